@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+from typing import Any, Dict
+
+import numpy as np
+
+from reward_shaping.training.utils import make_env
+
+TASKS = {
+    "cart_pole_obst": ["fixed_height"],
+    "bipedal_walker": ["forward", "hardcore"],
+    "lunar_lander": ["land"],
+    "racecar": ["drive", "drive_delta"],
+    "racecar2": ["follow_delta", "follow_delta_circle"],
+}
+REWARDS = ["default", "tltl", "bhnr", "morl_uni", "morl_dec", "hprs", "eval"]
+
+# layers timed by the profiler (see `make_env(..., profile=True)`)
+REWARD_LAYERS = ["RewardWrapper", "TLRewardWrapper", "EvaluationRewardWrapper"]
+TASK_LAYER = "RLTask"
+
+# metrics compared against the baseline, with the direction of improvement
+COMPARED_METRICS = {"steps_per_sec": +1, "reset_ms": -1, "reward_ms_per_step": -1, "task_ms_per_step": -1}
+
+
+def get_layer_stats(summary: Dict[str, Dict[str, Any]], layers, method: str):
+    for layer in layers:
+        if f"{layer}/{method}" in summary:
+            return summary[f"{layer}/{method}"]
+    return None
+
+
+def get_rss_bytes() -> float:
+    """ resident memory of this process, including native allocations (eg, pybullet, Box2D), NaN if not on linux """
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return np.nan
+
+
+def benchmark_env(env_name: str, task: str, reward: str, n_steps: int, seed: int = 0) -> Dict[str, float]:
+    """ run `n_steps` random steps in the given env and return the measured costs """
+    # memory of the env instance: resident memory delta (approximate, the allocator can reuse freed pages),
+    # and python heap only
+    rss = get_rss_bytes()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    env, _ = make_env(env_name, task, reward, eval=(reward == "eval"), logdir=None, seed=seed, profile=True)
+    make_time = time.perf_counter() - t0
+    py_heap, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss = get_rss_bytes() - rss
+    env.action_space.seed(seed)
+    # rollout
+    n_episodes = 1
+    env.reset()
+    for _ in range(n_steps):
+        _, _, done, _ = env.step(env.action_space.sample())
+        if done:
+            n_episodes += 1
+            env.reset()
+    summary = env.profiler.summary()
+    env.close()
+    # collect results: the outermost layer is the first one of the stack
+    outer_layer = type(env.env).__name__
+    step_stats, reset_stats = summary[f"{outer_layer}/step"], summary[f"{outer_layer}/reset"]
+    reward_stats = get_layer_stats(summary, REWARD_LAYERS, "step")
+    task_stats = get_layer_stats(summary, [TASK_LAYER], "step")
+    return {
+        "n_steps": n_steps,
+        "n_episodes": n_episodes,
+        "make_env_ms": 1000 * make_time,
+        "env_memory_mb": rss / 2 ** 20,
+        "env_py_heap_mb": py_heap / 2 ** 20,
+        "steps_per_sec": step_stats["calls"] / step_stats["cum_time"],
+        "reset_ms": reset_stats["mean_cum_ms"],
+        "reward_ms_per_step": reward_stats["mean_self_ms"] if reward_stats else np.nan,
+        "reward_ms_per_episode": 1000 * reward_stats["self_time"] / n_episodes if reward_stats else np.nan,
+        "task_ms_per_step": task_stats["mean_self_ms"] if task_stats else np.nan,
+        "layers": {name: {"calls": s["calls"], "mean_self_ms": s["mean_self_ms"], "mean_cum_ms": s["mean_cum_ms"]}
+                   for name, s in summary.items()},
+    }
+
+
+def compare_with_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float):
+    """ return the list of regressions, as relative change beyond `tolerance` in the worsening direction """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            print(f"[Warning] {key} not in the baseline, not compared")
+            continue
+        for metric, direction in COMPARED_METRICS.items():
+            new, old = result[metric], baseline[key][metric]
+            if not np.isfinite(new) or not np.isfinite(old) or old == 0:
+                continue
+            change = direction * (new - old) / abs(old)
+            if change < -tolerance:
+                regressions.append((key, metric, old, new, change))
+    return regressions
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def main(args):
+    results, failed = {}, []
+    for env_name in args.envs:
+        for task in (args.tasks if args.tasks else TASKS[env_name]):
+            for reward in args.rewards:
+                key = f"{env_name}/{task}/{reward}"
+                try:
+                    results[key] = benchmark_env(env_name, task, reward, n_steps=args.steps, seed=args.seed)
+                except Exception as error:
+                    warnings.warn(f"benchmark {key} failed: {error}", RuntimeWarning)
+                    failed.append(key)
+                    continue
+                r = results[key]
+                print(f"[{key}] steps/sec: {r['steps_per_sec']:.1f}, reset: {r['reset_ms']:.2f} ms, "
+                      f"reward: {r['reward_ms_per_step']:.3f} ms/step ({r['reward_ms_per_episode']:.2f} ms/episode), "
+                      f"task monitors: {r['task_ms_per_step']:.3f} ms/step, memory: {r['env_memory_mb']:.1f} MB "
+                      f"(python heap: {r['env_py_heap_mb']:.1f} MB)")
+    report = {
+        "meta": {"time": int(time.time()), "git_commit": get_git_commit(),
+                 "python": platform.python_version(), "platform": platform.platform(), "steps": args.steps},
+        "results": results,
+    }
+    if args.outfile:
+        args.outfile.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.outfile, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"[Info] Results saved in {args.outfile}")
+    exit_code = 0
+    if args.update_baseline:
+        if failed:
+            print("[Warning] The baseline does not include the failed benchmarks")
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"[Info] Baseline updated in {args.baseline}")
+    elif args.no_baseline:
+        print("[Warning] Comparison with the baseline skipped (-no_baseline)")
+    elif not args.baseline.exists():
+        print(f"[Error] Baseline {args.baseline} not found: create it with -update_baseline "
+              f"on the reference machine, or skip the comparison with -no_baseline")
+        exit_code = 1
+    else:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)["results"]
+        regressions = compare_with_baseline(results, baseline, tolerance=args.tolerance)
+        for key, metric, old, new, change in regressions:
+            print(f"[Regression] {key}, {metric}: {old:.3f} -> {new:.3f} ({100 * change:.1f}%)")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"[Info] No regression w.r.t. baseline {args.baseline} (tolerance: {100 * args.tolerance:.0f}%)")
+    if failed:
+        print(f"[Error] {len(failed)} benchmarks failed: {', '.join(failed)}")
+        exit_code = 1
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--envs", type=str, nargs="+", default=list(TASKS.keys()), choices=list(TASKS.keys()))
+    parser.add_argument("--tasks", type=str, nargs="+", default=None, help="tasks to run, default all tasks per env")
+    parser.add_argument("--rewards", type=str, nargs="+", default=REWARDS)
+    parser.add_argument("--steps", type=int, default=2000, help="nr random steps for each env/task/reward")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--outfile", type=pathlib.Path, default=None, help="json file where to store the results")
+    parser.add_argument("--baseline", type=pathlib.Path,
+                        default=pathlib.Path(__file__).parent / "baseline.json", help="json baseline to compare")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown tolerated w.r.t. baseline")
+    parser.add_argument("-update_baseline", action="store_true", help="store the results as new baseline")
+    parser.add_argument("-no_baseline", action="store_true", help="do not compare with the baseline")
+    args = parser.parse_args()
+    main(args)
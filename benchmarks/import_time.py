@@ -0,0 +1,77 @@
+import argparse
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = pathlib.Path(__file__).parent.parent
+
+# import statements paid at startup: training entrypoint, training stack, and env worker
+TARGETS = {
+    "run_training": "import run_training",
+    "training": "from reward_shaping.training.train import train",
+    "worker": "from reward_shaping.training.utils import make_env; import reward_shaping.envs.racecar",
+    "envs": "import reward_shaping.envs",
+    "helper_fns": "import reward_shaping.core.helper_fns",
+}
+
+
+def time_import(statement: str, rootdir: pathlib.Path, repeats: int) -> float:
+    """
+    Median wall-clock time of `statement` in a fresh interpreter, minus the interpreter startup.
+    For a per-module breakdown, use `python -X importtime -c <statement>`.
+    """
+    env = dict(os.environ, PYTHONPATH=str(rootdir))
+
+    def run(stmt):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", stmt], cwd=rootdir, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - t0
+
+    startup = statistics.median([run("pass") for _ in range(repeats)])
+    return statistics.median([run(statement) for _ in range(repeats)]) - startup
+
+
+def measure(rootdir: pathlib.Path, targets, repeats: int):
+    results = {}
+    for name in targets:
+        try:
+            results[name] = time_import(TARGETS[name], rootdir, repeats)
+        except subprocess.CalledProcessError:
+            results[name] = None  # eg, missing optional dependencies
+    return results
+
+
+def main(args):
+    results = measure(ROOT, args.targets, args.repeats)
+    ref_results = None
+    if args.ref is not None:
+        # measure the same targets on a clean checkout of the reference revision
+        with tempfile.TemporaryDirectory() as tmpdir:
+            refdir = pathlib.Path(tmpdir) / "ref"
+            subprocess.run(["git", "worktree", "add", "--detach", str(refdir), args.ref], cwd=ROOT, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                ref_results = measure(refdir, args.targets, args.repeats)
+            finally:
+                subprocess.run(["git", "worktree", "remove", "--force", str(refdir)], cwd=ROOT, check=True)
+    for name in args.targets:
+        current = "failed" if results[name] is None else f"{1000 * results[name]:.0f} ms"
+        line = f"[{name}] import time: {current}"
+        if ref_results is not None and ref_results[name] is not None and results[name] is not None:
+            reduction = 1.0 - results[name] / ref_results[name]
+            line += f" (ref {args.ref}: {1000 * ref_results[name]:.0f} ms, reduction: {100 * reduction:.1f}%)"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", type=str, nargs="+", default=list(TARGETS.keys()), choices=list(TARGETS.keys()))
+    parser.add_argument("--repeats", type=int, default=5, help="nr fresh interpreters per target")
+    parser.add_argument("--ref", type=str, default=None, help="git revision to compare with (eg, HEAD~1)")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,93 @@
+import argparse
+import importlib
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+import gym
+import numpy as np
+
+ROOT = pathlib.Path(__file__).parent.parent
+ENVS = ["cart_pole_obst", "bipedal_walker", "lunar_lander", "racecar", "racecar2"]
+
+
+class NullEnv(gym.Env):
+    """ placeholder env, only the monitoring of `RLTask` is timed """
+
+    def step(self, action):
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+
+def time_monitoring(env_name: str, n_steps: int, episode_len: int, seed: int = 0) -> dict:
+    """
+    Mean time of `RLTask._get_monitor_infos` per step, with the requirements registered by the env.
+    Predicates are replaced by array lookups, to measure only the automata and the info construction.
+    """
+    from reward_shaping.monitor.task import RLTask
+    specs = importlib.import_module(f"reward_shaping.envs.{env_name}.specs").get_all_specs()
+    requirements = [(label, op, (lambda state, info, i=i: state[i])) for i, (label, (op, _)) in
+                    enumerate(specs.items())]
+    task = RLTask(NullEnv(), requirements)
+    rng = np.random.default_rng(seed)
+    trace = rng.choice([-1.0, 1.0], p=[0.2, 0.8], size=(n_steps, len(requirements)))
+    info = {}
+    elapsed = 0.0
+    for start in range(0, n_steps, episode_len):
+        for monitor in task._monitors.values():
+            monitor.reset()
+        t0 = time.perf_counter()
+        for obs in trace[start:start + episode_len]:
+            task._get_monitor_infos(obs, info)
+        elapsed += time.perf_counter() - t0
+    return {"n_requirements": len(requirements), "us_per_step": 1e6 * elapsed / n_steps}
+
+
+def measure(envs, n_steps, episode_len):
+    return {env_name: time_monitoring(env_name, n_steps, episode_len) for env_name in envs}
+
+
+def measure_ref(ref, envs, n_steps, episode_len):
+    """ run this script on a clean checkout of the reference revision """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        refdir = pathlib.Path(tmpdir) / "ref"
+        subprocess.run(["git", "worktree", "add", "--detach", str(refdir), ref], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            env = dict(os.environ, PYTHONPATH=str(refdir))
+            output = subprocess.check_output([sys.executable, __file__, "--envs", *envs, "--steps", str(n_steps),
+                                              "--episode_len", str(episode_len), "-json"], cwd=refdir, env=env)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", str(refdir)], cwd=ROOT, check=True)
+    return json.loads(output)
+
+
+def main(args):
+    results = measure(args.envs, args.steps, args.episode_len)
+    if args.json:
+        print(json.dumps(results))
+        return
+    ref_results = measure_ref(args.ref, args.envs, args.steps, args.episode_len) if args.ref else None
+    for env_name, result in results.items():
+        line = f"[{env_name}] {result['n_requirements']} requirements, monitoring: {result['us_per_step']:.2f} us/step"
+        if ref_results is not None:
+            ref_time = ref_results[env_name]["us_per_step"]
+            line += f" (ref {args.ref}: {ref_time:.2f} us/step, speedup: {ref_time / result['us_per_step']:.2f}x)"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--envs", type=str, nargs="+", default=ENVS, choices=ENVS)
+    parser.add_argument("--steps", type=int, default=100000, help="nr monitored steps per env")
+    parser.add_argument("--episode_len", type=int, default=1000, help="nr steps between monitor resets")
+    parser.add_argument("--ref", type=str, default=None, help="git revision to compare with (eg, HEAD~1)")
+    parser.add_argument("-json", action="store_true", help="print the results as json, without comparison")
+    args = parser.parse_args()
+    main(args)
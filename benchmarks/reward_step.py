@@ -0,0 +1,99 @@
+import argparse
+import importlib
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = pathlib.Path(__file__).parent.parent
+
+# hierarchical potential-based shaping (hprs) of each env
+REWARDS = {
+    "racecar": "reward_shaping.envs.racecar.rewards.potential:RCHierarchicalPotentialShaping",
+    "bipedal_walker": "reward_shaping.envs.bipedal_walker.rewards.potential:BWHierarchicalPotentialShaping",
+}
+
+
+def _racecar_trace(rng, n_steps):
+    info = {"target_progress": 0.99, "target_dist2obst": 0.5, "comfort_max_steering": 0.1, "comfort_max_norm": 0.25,
+            "min_velx": 2.0, "max_velx": 3.0, "limit_velx": 3.5, "done": False}
+    states = [{"collision": float(rng.random() < 0.01), "progress": float(rng.uniform(0, 1)),
+               "dist2obst": float(rng.uniform(0, 1)),
+               "velocity_x": np.array([rng.uniform(0, 3.5)], dtype=np.float32),
+               "last_actions": rng.uniform(-1, 1, size=(3, 2)).astype(np.float32)} for _ in range(n_steps)]
+    return states, info
+
+
+def _bipedal_walker_trace(rng, n_steps):
+    info = {"norm_target_x": 1.0, "speed_x_target": 0.5, "speed_y_limit": 0.1, "angle_hull_limit": 0.5,
+            "angle_vel_limit": 0.5, "done": False}
+    states = [{"collision": float(rng.random() < 0.01), "x": np.float32(rng.uniform(0, 1)),
+               "horizontal_speed": np.float32(rng.uniform(-1, 1)), "vertical_speed": np.float32(rng.uniform(-1, 1)),
+               "hull_angle": np.float32(rng.uniform(-1, 1)), "hull_angle_speed": np.float32(rng.uniform(-1, 1))}
+              for _ in range(n_steps)]
+    return states, info
+
+
+TRACES = {"racecar": _racecar_trace, "bipedal_walker": _bipedal_walker_trace}
+
+
+def time_reward(env_name: str, n_steps: int, seed: int = 0) -> dict:
+    """
+    Mean time of a reward call per step, on a random trace of states with the observation types of the env.
+    """
+    module, name = REWARDS[env_name].split(":")
+    reward_fn = getattr(importlib.import_module(module), name)()
+    states, info = TRACES[env_name](np.random.default_rng(seed), n_steps + 1)
+    t0 = time.perf_counter()
+    for state, next_state in zip(states[:-1], states[1:]):
+        reward_fn(state, None, next_state, info)
+    elapsed = time.perf_counter() - t0
+    return {"us_per_step": 1e6 * elapsed / n_steps}
+
+
+def measure(envs, n_steps):
+    return {env_name: time_reward(env_name, n_steps) for env_name in envs}
+
+
+def measure_ref(ref, envs, n_steps):
+    """ run this script on a clean checkout of the reference revision """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        refdir = pathlib.Path(tmpdir) / "ref"
+        subprocess.run(["git", "worktree", "add", "--detach", str(refdir), ref], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            env = dict(os.environ, PYTHONPATH=str(refdir))
+            output = subprocess.check_output([sys.executable, __file__, "--envs", *envs, "--steps", str(n_steps),
+                                              "-json"], cwd=refdir, env=env)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", str(refdir)], cwd=ROOT, check=True)
+    return json.loads(output)
+
+
+def main(args):
+    results = measure(args.envs, args.steps)
+    if args.json:
+        print(json.dumps(results))
+        return
+    ref_results = measure_ref(args.ref, args.envs, args.steps) if args.ref else None
+    for env_name, result in results.items():
+        line = f"[{env_name}] hprs reward: {result['us_per_step']:.2f} us/step"
+        if ref_results is not None:
+            ref_time = ref_results[env_name]["us_per_step"]
+            line += f" (ref {args.ref}: {ref_time:.2f} us/step, speedup: {ref_time / result['us_per_step']:.2f}x)"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--envs", type=str, nargs="+", default=list(REWARDS.keys()), choices=list(REWARDS.keys()))
+    parser.add_argument("--steps", type=int, default=100000, help="nr reward calls per env")
+    parser.add_argument("--ref", type=str, default=None, help="git revision to compare with (eg, HEAD~1)")
+    parser.add_argument("-json", action="store_true", help="print the results as json, without comparison")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,39 @@
+import argparse
+import json
+import pathlib
+
+from utils.run_catalog import open_catalog
+
+
+def main(args):
+    with open_catalog(args.logdir, db_path=args.db, scan=False) as catalog:
+        n_updated, n_removed = catalog.scan(args.logdir)
+        print(f"[catalog] updated runs: {n_updated}, removed runs: {n_removed}")
+        if args.query is not None:
+            rows = catalog.query(args.query)
+        else:
+            rows = catalog.select_runs(under=args.logdir, env=args.env, task=args.task, reward=args.reward,
+                                       algo=args.algo)
+            metrics = [catalog.get_metrics(row["id"]).get(args.metric, {}) for row in rows]
+            rows = [{"env": row["env"], "task": row["task"], "reward": row["reward"], "algo": row["algo"],
+                     "seed": row["seed"], "n_evals": row["n_evals"], f"final_{args.metric}": m.get("final"),
+                     f"best_{args.metric}": m.get("best"), "path": row["path"]} for row, m in zip(rows, metrics)]
+        for row in rows:
+            print(json.dumps(row) if args.json else "  ".join(f"{k}: {v}" for k, v in row.items()))
+        if not args.json:
+            print(f"[catalog] nr rows: {len(rows)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logdir", type=pathlib.Path, required=True, help="root of the log tree")
+    parser.add_argument("--db", type=pathlib.Path, default=None, help="catalog file (default: <logdir>/runs.sqlite)")
+    for run_arg in ["env", "task", "reward", "algo"]:
+        parser.add_argument(f"--{run_arg}", type=str, default=None, help=f"only the runs with this {run_arg}")
+    parser.add_argument("--metric", type=str, default="results", help="evaluation metric to report")
+    parser.add_argument("--query", type=str, default=None,
+                        help="sql query on the tables runs, metrics, checkpoints (eg, \"SELECT reward, AVG(final) "
+                             "FROM metrics JOIN runs ON runs.id = run_id WHERE name = 'results' GROUP BY reward\")")
+    parser.add_argument("-json", action="store_true", help="print one json object per row")
+    args = parser.parse_args()
+    main(args)
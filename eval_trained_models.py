@@ -1,32 +1,157 @@
 import argparse
+import csv
+import json
 import pathlib
+import re
 
 import numpy as np
-from stable_baselines3 import SAC
-from stable_baselines3.common.evaluation import evaluate_policy
 
-from reward_shaping.training.utils import make_env
-from utils.utils import parse_env_task, parse_reward
+from reward_shaping.training.run_args import load_run_args
+from utils.utils import parse_env_task, parse_reward, find_run_dir
+
+RESULT_FIELDS = ["run", "checkpoint", "env", "task", "reward", "algo", "seed", "steps",
+                 "n_episodes", "mean_reward", "std_reward", "mean_length"]
+# seed of the eval env before each evaluation, the episodes do not depend on the previous evaluations
+EVAL_SEED = 0
+
+# eval envs (and their params) created in this process, indexed by (env, task), reused for all the checkpoints
+_eval_envs = {}
+
+
+def load_model(algo: str, checkpoint: pathlib.Path):
+    from stable_baselines3 import SAC, PPO, DDPG, TD3
+    algos = {"sac": SAC, "ppo": PPO, "ddpg": DDPG, "td3": TD3}
+    # note: algo variants (e.g., sac_large) are stored with the base algo
+    return algos[algo.split("_", 1)[0]].load(str(checkpoint))
+
+
+def get_eval_env(env_name: str, task_name: str):
+    if (env_name, task_name) not in _eval_envs:
+        from reward_shaping.training.utils import make_env
+        _eval_envs[(env_name, task_name)] = make_env(env_name, task_name, 'eval', eval=True, logdir=None,
+                                                     seed=EVAL_SEED)
+    return _eval_envs[(env_name, task_name)]
+
+
+def close_eval_envs():
+    for env, _ in _eval_envs.values():
+        env.close()
+    _eval_envs.clear()
+
+
+def run_evaluation(model, env, env_name: str, task_name: str, env_params, policy_hash: str, n_episodes: int,
+                   render: bool = False, refresh: bool = False):
+    """
+    Evaluate the model for `n_episodes` from the seeded eval env, the results are cached by content
+    (see `reward_shaping.core.eval_cache`).
+
+    @return: episode rewards, episode lengths, requirement metrics (`<req>_counter` -> list of values)
+    """
+    from reward_shaping.core.eval_cache import eval_cache_key, evaluate_with_cache
+    from reward_shaping.training.custom_evaluation import evaluate_policy_with_monitors
+    list_of_metrics = [f"{req}_counter" for req in env.req_labels]
+
+    def evaluate():
+        env.seed(EVAL_SEED)
+        return evaluate_policy_with_monitors(model, env, n_eval_episodes=n_episodes, deterministic=True,
+                                             render=render, return_episode_rewards=True,
+                                             list_of_metrics=list_of_metrics)
+
+    key = eval_cache_key(policy_hash, env_name, task_name, env_params, n_episodes, EVAL_SEED)
+    # when rendering, the episodes are always simulated
+    return evaluate_with_cache(key, evaluate, refresh=refresh or render)
+
+
+def find_checkpoints(logdir: pathlib.Path, **filters):
+    """
+    checkpoints of the runs in the log tree, with the training args of each run,
+    the runs are selected in the run catalog of the log tree (eg, `reward="hprs"`)
+    """
+    from utils.run_catalog import open_catalog
+    jobs = []
+    with open_catalog(logdir) as catalog:
+        for run in catalog.select_runs(under=logdir, **filters):
+            checkpoints = [pathlib.Path(c["path"]) for c in catalog.get_checkpoints(run["id"])]
+            if run["best_model"] is not None:
+                checkpoints.append(pathlib.Path(run["best_model"]))
+            jobs.extend((pathlib.Path(run["path"]), checkpoint, json.loads(run["args"])) for checkpoint in checkpoints)
+    # group the checkpoints of the same env, to reuse the eval envs of the workers
+    return sorted(jobs, key=lambda job: (job[2]["env"], job[2]["task"], str(job[1])))
+
+
+def evaluate_checkpoint(job):
+    from reward_shaping.core.eval_cache import get_file_hash
+    rundir, checkpoint, run_args, n_episodes, refresh = job
+    env, env_params = get_eval_env(run_args["env"], run_args["task"])
+    model = load_model(run_args["algo"], checkpoint)
+    rewards, eplens, metrics = run_evaluation(model, env, run_args["env"], run_args["task"], env_params,
+                                              get_file_hash(checkpoint), n_episodes, refresh=refresh)
+    steps = re.search(r"model_(\d+)_steps", checkpoint.name)
+    result = {"run": str(rundir), "checkpoint": checkpoint.name,
+              "env": run_args["env"], "task": run_args["task"], "reward": run_args["reward"],
+              "algo": run_args["algo"], "seed": run_args.get("seed"), "steps": int(steps.group(1)) if steps else None,
+              "n_episodes": len(rewards), "mean_reward": float(np.mean(rewards)),
+              "std_reward": float(np.std(rewards)), "mean_length": float(np.mean(eplens))}
+    result.update({m: float(np.mean(values)) for m, values in metrics.items()})
+    return result
+
+
+def evaluate_checkpoints(jobs, n_workers: int):
+    if n_workers <= 1:
+        results = [evaluate_checkpoint(job) for job in jobs]
+        close_eval_envs()
+        return results
+    import multiprocessing
+    # each worker keeps its eval envs for the next checkpoints, they are released with the worker
+    with multiprocessing.Pool(n_workers) as pool:
+        return list(pool.imap_unordered(evaluate_checkpoint, jobs, chunksize=1))
+
+
+def main_batch(args):
+    filters = {"env": args.env, "task": args.task, "reward": args.reward, "algo": args.algo}
+    jobs = [(rundir, checkpoint, run_args, args.n_episodes, args.refresh) for rundir, checkpoint, run_args in
+            find_checkpoints(args.logdir, **filters)]
+    print(f"[evaluation] nr checkpoints: {len(jobs)}, nr workers: {args.n_workers}")
+    # sort by run and training steps, the best model last
+    results = sorted(evaluate_checkpoints(jobs, args.n_workers),
+                     key=lambda r: (r["run"], r["steps"] is None, r["steps"] or 0, r["checkpoint"]))
+    outfile = args.outfile if args.outfile is not None else args.logdir / "eval_results.csv"
+    with open(outfile, "w", newline="") as file:
+        # one column per requirement metric, the envs of the log tree can have different requirements
+        metrics = sorted({k for r in results for k in r if k not in RESULT_FIELDS})
+        writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS + metrics)
+        writer.writeheader()
+        writer.writerows(results)
+    for r in results:
+        print(f"[results] {r['run']}/{r['checkpoint']}: mean reward: {r['mean_reward']:.5f}, "
+              f"mean lengths: {r['mean_length']:.5f}")
+    print(f"[results] table written in {outfile}")
 
 
 def main(args):
     checkpoint = args.checkpoint
     render = not args.no_render
-    # create eval env
-    env_name, task_name = parse_env_task(str(checkpoint))
-    reward_name = parse_reward(str(checkpoint))
+    # create eval env, the run args are used when available
+    rundir = find_run_dir(checkpoint.parent)
+    if rundir is not None:
+        run_args = load_run_args(rundir)
+        env_name, task_name, reward_name, algo = run_args["env"], run_args["task"], run_args["reward"], run_args["algo"]
+    else:
+        env_name, task_name = parse_env_task(str(checkpoint))
+        reward_name, algo = parse_reward(str(checkpoint)), "sac"
     # run evaluation
+    from reward_shaping.core.eval_cache import get_file_hash
+    from reward_shaping.training.utils import make_env
     print(f"[evaluation] env: {env_name}, task: {task_name}, reward: {reward_name}")
-    env, env_params = make_env(env_name, task_name, 'eval', eval=True, logdir=None, seed=0)
-    model = SAC.load(str(checkpoint))
-    rewards, eplens = evaluate_policy(model, env,
-                                      n_eval_episodes=args.n_episodes,
-                                      deterministic=True,
-                                      render=render,
-                                      return_episode_rewards=True)
+    env, env_params = make_env(env_name, task_name, 'eval', eval=True, logdir=None, seed=EVAL_SEED)
+    model = load_model(algo, checkpoint)
+    rewards, eplens, metrics = run_evaluation(model, env, env_name, task_name, env_params, get_file_hash(checkpoint),
+                                              args.n_episodes, render=render, refresh=args.refresh)
     env.close()
     print(
         f"[results] nr episodes: {len(rewards)}, mean reward: {np.mean(rewards):.5f}, mean lengths: {np.mean(eplens):.5f}")
+    for m, values in metrics.items():
+        print(f"[results] {m}: {np.mean(values):.5f} +/- {np.std(values):.5f}")
 
 
 if __name__ == "__main__":
@@ -34,10 +159,22 @@ if __name__ == "__main__":
 
     t0 = time.time()
     parser = argparse.ArgumentParser()
-    parser.add_argument("--checkpoint", type=pathlib.Path, required=True, help="model checkpoint to evaluate")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--checkpoint", type=pathlib.Path, help="model checkpoint to evaluate")
+    target.add_argument("--logdir", type=pathlib.Path, help="evaluate all the checkpoints in the log tree")
     parser.add_argument("--n_episodes", type=int, default=1, help="nr evaluation episodes")
+    parser.add_argument("--n_workers", type=int, default=1, help="nr worker processes, in batch mode")
+    for run_arg in ["env", "task", "reward", "algo"]:
+        parser.add_argument(f"--{run_arg}", type=str, default=None,
+                            help=f"only the runs with this {run_arg}, in batch mode")
+    parser.add_argument("--outfile", type=pathlib.Path, default=None,
+                        help="results table, in batch mode (default: <logdir>/eval_results.csv)")
     parser.add_argument("-no_render", action="store_true", help="disable rendering")
+    parser.add_argument("--refresh", action="store_true", help="ignore the cached results, evaluate again")
     args = parser.parse_args()
-    main(args)
+    if args.logdir is not None:
+        main_batch(args)
+    else:
+        main(args)
     tf = time.time()
     print(f"[done] elapsed time: {tf - t0:.2f} seconds")
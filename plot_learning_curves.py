@@ -1,4 +1,5 @@
 import argparse
+import functools
 import math
 import pathlib
 import time
@@ -7,9 +8,11 @@ from typing import Dict, List, Any, Callable, Tuple
 
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 
-from utils.utils import get_files, parse_env_task, parse_reward
+from utils.aggregation import aggregate_binned
+from utils.log_index import EvalLogIndex
+from utils.run_catalog import select_runs
+from utils.utils import parse_env_task, parse_reward
 
 FIGSIZE = (17.5, 4)
 LARGESIZE, MEDIUMSIZE, SMALLSIZE = 16, 13, 10
@@ -74,25 +77,30 @@ XLIMITS = {
     "racecar2_follow_delta": 1e6,
 }
 
-file_regex = "evaluations*.npz"
 
-
-def get_evaluations(logdir: pathlib.Path, regex: str, gby: Callable) -> Dict[str, List[Dict[str, Any]]]:
-    """ look for evaluations.npz in the subdirectories and return is content """
+def get_evaluations(index: EvalLogIndex, logdir: pathlib.Path, selection: str, gby: Callable,
+                    metrics: List[str], query: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    look for evaluations.npz in the subdirectories and return their content (from the index),
+    the metrics are averaged over the episodes of each evaluation and aligned on the evaluations having all of them
+    """
     evaluations = {}
-    for eval_file in get_files(logdir, regex, fileregex=file_regex):
-        if "skip" in str(eval_file):
-            continue
-        data = dict(np.load(eval_file))
-        data["filepath"] = str(eval_file)
+    for run in select_runs(index, logdir, selection, query):
+        eval_file = str(logdir / run["path"])
+        data = {"filepath": eval_file, "reward": run["reward"] or parse_reward(eval_file)}
+        series = {metric: index.get_metric(run, metric) for metric in metrics if metric in run["metrics"]}
+        if series:
+            data["timesteps"] = functools.reduce(np.intersect1d, [timesteps for timesteps, _ in series.values()])
+            for metric, (timesteps, values) in series.items():
+                data[metric] = values[np.isin(timesteps, data["timesteps"])]
         # group-by
-        group = gby(str(eval_file))
+        group = gby(dict(run, path=eval_file))
         if group in evaluations:
             evaluations[group].append(data)
         else:
             evaluations[group] = [data]
     if len(evaluations) == 0:
-        warnings.warn(f"cannot find any file for `{logdir}/{regex}/evaluations.npz`", UserWarning)
+        warnings.warn(f"cannot find any file for `{selection}` in {logdir}", UserWarning)
     return evaluations
 
 
@@ -104,18 +112,13 @@ def aggregate_evaluations(evaluations: List[Dict[str, np.ndarray]], params: Dict
         assert params['x'] in evaluation, f"{params['x']} is not in evaluation keys ({evaluation.keys()})"
         assert params['y'] in evaluation, f"{params['y']} is not in evaluation keys ({evaluation.keys()})"
         xx.append(evaluation[params['x']])
-        yy.append(np.mean(evaluation[params['y']], axis=-1))  # eg, average results over multiple eval episodes
+        yy.append(evaluation[params['y']])  # note: already averaged over the eval episodes
     xx = np.concatenate(xx, axis=0)
     yy = np.concatenate(yy, axis=0)
     assert xx.shape == yy.shape, f"xx, yy dimensions don't match (xx shape:{xx.shape}, yy shape:{yy.shape}"
-    # aggregate
-    df = pd.DataFrame({'x': xx, 'y': yy})
-    bins = np.arange(0, max(xx) + params['binning'], params['binning'])
-    df['xbin'] = pd.cut(df['x'], bins=bins, labels=bins[1:])
-    aggregated = df.groupby("xbin").agg(['mean', 'std'])['y'].reset_index()
-    return {'x': np.array([0.0] + list(aggregated['xbin'].values)),
-            'mean': np.array([0.0] + list(aggregated['mean'].values)),
-            'std': np.array([0.0] + list(aggregated['std'].values))}
+    # aggregate in bins of x, optionally with bootstrap confidence intervals of the mean
+    return aggregate_binned(xx, yy, params['binning'], confidence=params.get('ci'),
+                            n_boot=params.get('n_boot', 1000))
 
 
 def plot_data(data: Dict[str, np.ndarray], ax: plt.Axes, clipminy: float, clipmaxy: float,
@@ -123,31 +126,36 @@ def plot_data(data: Dict[str, np.ndarray], ax: plt.Axes, clipminy: float, clipma
               **kwargs):
     assert all([key in data for key in ['x', 'mean', 'std']]), f'x, mean, std not found in data (keys: {data.keys()})'
     ax.plot(data['x'], data['mean'], color=color, label=label, linestyle=linestyle, **kwargs)
-    data_minus_std = np.clip(data['mean'] - data['std'], clipminy, clipmaxy)
-    data_plus_std = np.clip(data['mean'] + data['std'], clipminy, clipmaxy)
+    if 'ci_low' in data:
+        # confidence interval of the mean instead of the std dev
+        data_minus_std = np.clip(data['ci_low'], clipminy, clipmaxy)
+        data_plus_std = np.clip(data['ci_high'], clipminy, clipmaxy)
+    else:
+        data_minus_std = np.clip(data['mean'] - data['std'], clipminy, clipmaxy)
+        data_plus_std = np.clip(data['mean'] + data['std'], clipminy, clipmaxy)
     ax.fill_between(data['x'], data_minus_std, data_plus_std, alpha=0.15, color=color)
     ax.set_title(title)
 
 
-def plot_file_info(args):
-    for regex in args.regex:
-        files = [f for f in get_files(args.logdir, regex, fileregex=file_regex) if "skip" not in str(f)]
-        print(f"regex: {regex}, nr files: {len(files)}")
-        for f in files:
-            data = dict(np.load(f))
-            keys = [k for k in data.keys()]
-            print(f"  file: {f.stem}, keys: {keys}")
+def plot_file_info(index: EvalLogIndex, args):
+    for selection in (args.query or args.regex):
+        runs = select_runs(index, args.logdir, selection, query=args.query is not None)
+        print(f"{'query' if args.query else 'regex'}: {selection}, nr files: {len(runs)}")
+        for run in runs:
+            keys = ["timesteps"] + run["metrics"]
+            print(f"  file: {pathlib.Path(run['path']).stem}, keys: {keys}")
 
 
 def make_gby_extractor(gby: str) -> Tuple[Callable, Dict[str, str]]:
+    """ group of a run of the index, from its training args if available, otherwise parsed from its path """
     if gby is None:
-        fn = lambda filepath: "all"
+        fn = lambda run: "all"
         titles = {"all": ""}
     elif gby == "env":
-        fn = lambda filepath: '_'.join(parse_env_task(filepath))
+        fn = lambda run: f"{run['env']}_{run['task']}" if run["env"] else '_'.join(parse_env_task(run["path"]))
         titles = ENV_LABELS
     elif gby == "reward":
-        fn = lambda filepath: parse_reward(filepath)
+        fn = lambda run: run["reward"] or parse_reward(run["path"])
         titles = REWARD_LABELS
     else:
         raise NotImplementedError(f"gby function not found {gby}")
@@ -176,9 +184,11 @@ def plot_secondaries(ax, xlabel, ylabel, hlines, minx, maxx, miny, maxy, show_yt
 
 
 def main(args):
+    # index of the evaluation logs, only the new or modified files are loaded
+    index = EvalLogIndex(args.logdir, n_workers=args.n_workers)
     # only print info on files
     if args.info:
-        plot_file_info(args)
+        plot_file_info(index, args)
         exit(0)
     # prepare plot
     gby_fn, titles = make_gby_extractor(args.gby)
@@ -187,14 +197,17 @@ def main(args):
     xlabel, ylabel = args.x.capitalize(), args.y.capitalize()
     minxs, maxxs = [np.Inf] * len(axes), [-np.Inf] * len(axes)
     # plot data
-    for regex in args.regex:
-        evaluations_grouped = get_evaluations(args.logdir, regex, gby=gby_fn)
+    for selection in (args.query or args.regex):
+        evaluations_grouped = get_evaluations(index, args.logdir, selection, gby=gby_fn,
+                                              metrics=[args.y] if args.x == "timesteps" else [args.x, args.y],
+                                              query=args.query is not None)
         if not evaluations_grouped:
             continue
         for i, (gby, evaluations) in enumerate(evaluations_grouped.items()):
-            data = aggregate_evaluations(evaluations, params={'x': args.x, 'y': args.y, 'binning': args.binning})
+            data = aggregate_evaluations(evaluations, params={'x': args.x, 'y': args.y, 'binning': args.binning,
+                                                              'ci': args.ci, 'n_boot': args.n_boot})
             # assume all evaluations have same env and reward
-            reward = parse_reward(evaluations[0]["filepath"])
+            reward = evaluations[0]["reward"]
             title = titles[gby]
             i = list(titles.keys()).index(gby)
             ax = axes[i]
@@ -212,7 +225,7 @@ def main(args):
             plot_secondaries(ax, xlabel="", ylabel=ylabel, hlines=args.hlines,
                              minx=minxs[i], maxx=maxxs[i], miny=args.miny, maxy=args.maxy, show_yticks=True)
         elif i == len(axes) - 1:
-            plot_secondaries(ax, xlabel="Steps", ylabel="", hlines=args.hlines,
+            plot_secondaries(ax, xlabel="Steps" if args.x == "timesteps" else xlabel, ylabel="", hlines=args.hlines,
                              minx=minxs[i], maxx=maxxs[i], miny=args.miny, maxy=args.maxy, show_yticks=False)
         else:
             plot_secondaries(ax, xlabel="", ylabel="", hlines=args.hlines,
@@ -236,9 +249,16 @@ if __name__ == "__main__":
     parser.add_argument("--logdir", type=pathlib.Path, required=True)
     parser.add_argument("--regex", type=str, default="**", nargs="+",
                         help="for each regex, group data for `{logdir}/{regex}/evaluations*.npz`")
+    parser.add_argument("--query", type=str, default=None, nargs="+",
+                        help="instead of regex, for each sql condition on the run catalog (see utils/run_catalog.py), "
+                             "group data of the selected runs (eg, \"reward = 'hprs' AND seed < 3\")")
     parser.add_argument("--binning", type=int, default=15000)
+    parser.add_argument("--ci", type=float, default=None,
+                        help="plot the bootstrap confidence interval of the mean at this level (eg, 0.95), not the std")
+    parser.add_argument("--n_boot", type=int, default=1000, help="nr bootstrap resamples for --ci")
+    parser.add_argument("--n_workers", type=int, default=1, help="nr threads loading the new evaluation files")
     parser.add_argument("--gby", choices=["env", "reward"], default=None)
-    parser.add_argument("--x", type=str, default="timesteps")
+    parser.add_argument("--x", type=str, default="timesteps", help="timesteps, or a metric of the evaluations")
     parser.add_argument("--y", type=str, default="results")
     parser.add_argument("--hlines", type=float, nargs='*', default=[], help="horizontal lines in plot, eg. y=0")
     parser.add_argument("--miny", type=float, default=0.0, help="y lower limit")
@@ -0,0 +1,41 @@
+import argparse
+import json
+import pathlib
+
+import numpy as np
+
+from reward_shaping.core.rescoring import rescore, DEFAULT_CACHE_DIR
+
+
+def main(args):
+    results = rescore(args.dir, args.env, args.task, args.rewards, n_workers=args.n_workers,
+                      chunk_episodes=args.chunk_episodes, cache_dir=args.cache_dir)
+    for reward in args.rewards:
+        scores = [score for shard in results.values() for score in shard[reward].values()]
+        mean = f"{np.mean(scores):.5f}" if len(scores) > 0 else "-"
+        print(f"[{reward}] nr episodes: {len(scores)}, mean score: {mean}")
+    if args.outfile is not None:
+        with open(args.outfile, "w") as file:
+            json.dump({shard: {reward: {str(i): score for i, score in scores.items()}
+                               for reward, scores in shard_results.items()}
+                       for shard, shard_results in results.items()}, file, indent=2)
+
+
+if __name__ == "__main__":
+    import time
+
+    t0 = time.time()
+    envs = ['cart_pole_obst', 'bipedal_walker', 'lunar_lander', 'racecar', 'racecar2']
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", type=pathlib.Path, required=True, help="directory of recorded episodes")
+    parser.add_argument("--env", type=str, required=True, choices=envs)
+    parser.add_argument("--task", type=str, required=True, help="task executed for the env")
+    parser.add_argument("--rewards", type=str, nargs="+", required=True, help="rewards to score (eg, tltl hprs eval)")
+    parser.add_argument("--n_workers", type=int, default=1, help="nr processes")
+    parser.add_argument("--chunk_episodes", type=int, default=8, help="nr episodes per unit of work")
+    parser.add_argument("--cache_dir", type=pathlib.Path, default=DEFAULT_CACHE_DIR, help="cache of the scores")
+    parser.add_argument("--outfile", type=pathlib.Path, default=None, help="json file with the per-episode scores")
+    args = parser.parse_args()
+    main(args)
+    tf = time.time()
+    print(f"[done] elapsed time: {tf - t0:.2f} seconds")
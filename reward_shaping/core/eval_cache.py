@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import pathlib
+import warnings
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+"""
+On-disk cache of evaluation results, addressed by content.
+
+The key of an evaluation is the hash of:
+    - the policy (checkpoint file hash, or hash of the policy parameters for an in-memory model),
+    - the eval env (env name, task and env params),
+    - the protocol (nr episodes, seed of the eval env, deterministic actions),
+    - the version of the eval code (package sources and configs, see `rescoring.get_code_version`).
+Each entry stores the per-episode rewards, lengths and requirement metrics (`<req>_counter`).
+The cache is bounded in size, the least recently used entries are removed first.
+"""
+
+# bump to invalidate the cached results when the stored format changes
+CACHE_VERSION = 1
+# directory of the on-disk cache, set the environment variable to an empty string to disable it
+CACHE_DIR_ENV = "REWARD_SHAPING_EVAL_CACHE"
+DEFAULT_CACHE_DIR = pathlib.Path.home() / ".cache" / "reward_shaping" / "evals"
+MAX_SIZE_ENV = "REWARD_SHAPING_EVAL_CACHE_MB"
+DEFAULT_MAX_SIZE_MB = 256
+
+# code version of this process, hashing the sources at each evaluation is expensive
+_code_version = None
+
+
+def get_cache_dir() -> Optional[pathlib.Path]:
+    cache_dir = os.environ.get(CACHE_DIR_ENV, str(DEFAULT_CACHE_DIR))
+    return pathlib.Path(cache_dir) if cache_dir else None
+
+
+def get_max_size() -> int:
+    """ size bound of the cache, in bytes """
+    return int(float(os.environ.get(MAX_SIZE_ENV, DEFAULT_MAX_SIZE_MB)) * 1024 * 1024)
+
+
+def get_eval_version() -> str:
+    global _code_version
+    if _code_version is None:
+        from reward_shaping.core.rescoring import get_code_version
+        _code_version = get_code_version()
+    return _code_version
+
+
+def get_file_hash(file: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_model_hash(model) -> str:
+    """ hash of the policy of a sb3 model: class, parameter names and values """
+    digest = hashlib.sha256(type(model.policy).__name__.encode("utf-8"))
+    for name, tensor in sorted(model.policy.state_dict().items()):
+        digest.update(name.encode("utf-8"))
+        digest.update(tensor.detach().cpu().numpy().tobytes())
+    return digest.hexdigest()
+
+
+def eval_cache_key(policy_hash: str, env_name: str, task: str, env_params: Dict[str, Any], n_episodes: int,
+                   seed: int, deterministic: bool = True) -> str:
+    content = [CACHE_VERSION, get_eval_version(), policy_hash, env_name, task, env_params, n_episodes, seed,
+               deterministic]
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _to_list(values) -> List[float]:
+    return np.asarray(values, dtype=np.float64).tolist()
+
+
+def load_eval_result(key: str, cache_dir: Optional[pathlib.Path] = None) -> Optional[Dict[str, Any]]:
+    """
+    @return: dictionary with `episode_rewards`, `episode_lengths` and `episode_metrics` (metric -> list),
+             or None if not in the cache
+    """
+    cache_dir = get_cache_dir() if cache_dir is None else cache_dir
+    if cache_dir is None:
+        return None
+    cache_file = cache_dir / f"{key}.json"
+    try:
+        with open(cache_file, "r") as file:
+            result = json.load(file)
+        # mark the entry as recently used
+        os.utime(cache_file)
+    except (OSError, ValueError):
+        return None
+    if not all(k in result for k in ["episode_rewards", "episode_lengths", "episode_metrics"]):
+        return None
+    return result
+
+
+def store_eval_result(key: str, episode_rewards, episode_lengths, episode_metrics: Dict[str, List],
+                      cache_dir: Optional[pathlib.Path] = None, max_size: Optional[int] = None):
+    cache_dir = get_cache_dir() if cache_dir is None else cache_dir
+    if cache_dir is None:
+        return
+    result = {"episode_rewards": _to_list(episode_rewards), "episode_lengths": _to_list(episode_lengths),
+              "episode_metrics": {m: _to_list(values) for m, values in episode_metrics.items()}}
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # atomic write, concurrent workers may evaluate the same checkpoint
+        tmp_file = cache_dir / f"{key}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as file:
+            json.dump(result, file)
+        os.replace(tmp_file, cache_dir / f"{key}.json")
+    except OSError as error:
+        warnings.warn(f"evaluation result not stored in {cache_dir}: {error}", RuntimeWarning)
+        return
+    prune_eval_cache(cache_dir, max_size)
+
+
+def evaluate_with_cache(key: str, evaluate: Callable[[], Tuple], refresh: bool = False,
+                        cache_dir: Optional[pathlib.Path] = None) -> Tuple[List, List, Dict[str, List]]:
+    """
+    Return the cached result of the evaluation, or run `evaluate` and store its result.
+
+    @param: evaluate: callable returning the episode rewards, lengths and metrics
+    @param: refresh: if true, ignore the cached result and replace it
+    """
+    result = None if refresh else load_eval_result(key, cache_dir)
+    if result is not None:
+        return result["episode_rewards"], result["episode_lengths"], result["episode_metrics"]
+    episode_rewards, episode_lengths, episode_metrics = evaluate()
+    store_eval_result(key, episode_rewards, episode_lengths, episode_metrics, cache_dir)
+    return episode_rewards, episode_lengths, episode_metrics
+
+
+def prune_eval_cache(cache_dir: Optional[pathlib.Path] = None, max_size: Optional[int] = None):
+    """ remove the least recently used entries until the cache fits in `max_size` bytes """
+    cache_dir = get_cache_dir() if cache_dir is None else cache_dir
+    max_size = get_max_size() if max_size is None else max_size
+    if cache_dir is None or not cache_dir.exists():
+        return
+    entries = []
+    for file in cache_dir.glob("*.json"):
+        try:
+            stat = file.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, file))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, file in sorted(entries, key=lambda entry: entry[0]):
+        if total_size <= max_size:
+            break
+        try:
+            file.unlink()
+        except OSError:
+            # removed by another process
+            pass
+        total_size -= size
+
+
+def clear_eval_cache(cache_dir: Optional[pathlib.Path] = None):
+    prune_eval_cache(cache_dir, max_size=0)
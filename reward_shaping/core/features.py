@@ -0,0 +1,100 @@
+from collections import OrderedDict
+from typing import Any, Callable, List, Sequence
+
+import numpy as np
+
+# placeholder of the features not computed yet
+_MISSING = object()
+
+
+class StepFeatures:
+    """
+    Named features of a single step (state, info), each one computed at its first access.
+    """
+    __slots__ = ("_extractor", "_state", "_info", "_values")
+
+    def __init__(self, extractor: "FeatureExtractor", state, info):
+        self._extractor = extractor
+        self._state = state
+        self._info = info
+        self._values = [_MISSING] * len(extractor.names)
+
+    def __getitem__(self, name: str):
+        i = self._extractor.index[name]
+        value = self._values[i]
+        if value is _MISSING:
+            value = self._values[i] = self._extractor.compute(name, self)
+        return value
+
+    def __contains__(self, name: str):
+        return name in self._extractor.index
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def info(self):
+        return self._info
+
+    def as_array(self, names: Sequence[str] = None) -> np.ndarray:
+        names = self._extractor.names if names is None else names
+        return np.array([self[name] for name in names], dtype=np.float64)
+
+
+class FeatureExtractor:
+    """
+    Per-step extractor of the derived quantities of an env, shared by task monitors, rewards and tl specs.
+
+    Features are either extracted from (state, info) or derived from other features,
+    each of them is computed at most once per step.
+    The features of a step are memoized on the identity of the (state, info) objects, then they assume that
+    state and info are not modified in-place once returned by the env.
+    The cache is cleared at each `new_step` and anyway bounded to the `cache_size` most recent (state, info).
+    """
+
+    def __init__(self, cache_size: int = 4):
+        self.names: List[str] = []
+        self.index = {}
+        self._extractors = {}
+        self._derived = {}
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def register(self, name: str, extractor: Callable):
+        """ feature extracted by `extractor(state, info)` """
+        if name not in self.index:
+            self._add(name)
+            self._extractors[name] = extractor
+
+    def register_derived(self, name: str, inputs: Sequence[str], fn: Callable):
+        """ feature computed by `fn(*inputs)`, where the inputs are previously registered features """
+        assert all(i in self.index for i in inputs), f"unknown inputs of {name}: {inputs}"
+        if name not in self.index:
+            self._add(name)
+            self._derived[name] = (tuple(inputs), fn)
+
+    def _add(self, name: str):
+        self.index[name] = len(self.names)
+        self.names.append(name)
+        self._cache.clear()  # memoized features have a fixed size
+
+    def compute(self, name: str, features: StepFeatures) -> Any:
+        if name in self._derived:
+            inputs, fn = self._derived[name]
+            return fn(*[features[i] for i in inputs])
+        return self._extractors[name](features.state, features.info)
+
+    def __call__(self, state, info) -> StepFeatures:
+        key = (id(state), id(info))
+        features = self._cache.get(key)
+        # the entry keeps a reference to state and info, then their ids cannot be reused while cached
+        if features is None:
+            features = StepFeatures(self, state, info)
+            self._cache[key] = features
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return features
+
+    def new_step(self):
+        self._cache.clear()
@@ -1,10 +1,6 @@
 from typing import List, Dict, Any
 
-import numpy as np
-import rtamt
-
 from reward_shaping.core.reward import RewardFunction
-from reward_shaping.lti_filtering.specification import MTLDiscreteTimeSpecification
 
 
 class DefaultReward(RewardFunction):
@@ -19,12 +15,10 @@ class DefaultReward(RewardFunction):
 
 
 def monitor_stl_episode(stl_spec: str, vars: List[str], types: List[str], episode: Dict[str, Any]):
-    spec = rtamt.STLSpecification()
-    for v, t in zip(vars, types):
-        spec.declare_var(v, f'{t}')
-    spec.spec = stl_spec
+    import rtamt  # deferred, rtamt loads the antlr parser stack
+    from reward_shaping.core.spec_cache import load_or_parse_spec
     try:
-        spec.parse()
+        spec = load_or_parse_spec("stl", rtamt.STLSpecification, stl_spec, vars, types)
     except rtamt.STLParseException:
         return
     # preprocess format, evaluate, post process
@@ -32,15 +26,35 @@ def monitor_stl_episode(stl_spec: str, vars: List[str], types: List[str], episod
     return robustness_trace
 
 
-def monitor_mtl_filtering_episode(mtl_spec: str, vars: List[str], types: List[str], episode: Dict[str, Any]):
-    spec = MTLDiscreteTimeSpecification(mtl_spec)
-    for v, t in zip(vars, types):
-        spec.declare_var(v, f'{t}')
-    spec.spec = mtl_spec
+def monitor_mtl_filtering_episode(mtl_spec: str, vars: List[str], types: List[str], episode: Dict[str, Any],
+                                  check_sampling: bool = True):
+    import rtamt
+    from reward_shaping.core.spec_cache import load_or_parse_spec
+    from reward_shaping.lti_filtering.specification import MTLDiscreteTimeSpecification
     try:
-        spec.parse()
+        spec = load_or_parse_spec("mtl_filtering", MTLDiscreteTimeSpecification, mtl_spec, vars, types)
     except rtamt.STLParseException:
         return
+    spec.set_sampling_check(check_sampling)
     # preprocess format, evaluate, post process
     robustness_trace = spec.evaluate(episode)
-    return robustness_trace
\ No newline at end of file
+    return robustness_trace
+
+
+def make_mtl_filtering_online_monitor(mtl_spec: str, vars: List[str], types: List[str], window_len: int = None,
+                                      check_sampling: bool = True):
+    """
+    Parse the spec once for online monitoring with the filtering semantics, samples are then pushed with `update`.
+    Return None if the spec cannot be parsed or monitored online.
+    """
+    import rtamt
+    from rtamt.exception.ltl.exception import LTLException
+    from reward_shaping.core.spec_cache import load_or_parse_spec
+    from reward_shaping.lti_filtering.specification import MTLDiscreteTimeSpecification
+    try:
+        spec = load_or_parse_spec("mtl_filtering", MTLDiscreteTimeSpecification, mtl_spec, vars, types)
+        spec.set_sampling_check(check_sampling)
+        spec.set_online_window(window_len)
+    except (rtamt.STLParseException, LTLException, NotImplementedError):
+        return
+    return spec
@@ -0,0 +1,123 @@
+import bisect
+import json
+import time
+from typing import Any, Dict, List
+
+import gym
+import numpy as np
+
+
+class StepProfiler:
+    """
+    Collect timings of nested calls (e.g., the `step` of each layer in a wrapper stack).
+
+    For each (layer, method) it records the number of calls, the cumulative time (including inner layers),
+    the self time (excluding the inner profiled layers) and a histogram of the self time per call.
+    Self time is obtained by subtracting from each call the time spent in the nested profiled calls.
+
+    @param: hist_bins: upper edges of the histogram bins in seconds, the last bin collects any longer call
+    """
+
+    def __init__(self, hist_bins: List[float] = None):
+        self._hist_bins = hist_bins if hist_bins is not None else list(np.logspace(-6, 0, 19))
+        self._stats = {}
+        self._children_time = []  # stack of time spent in nested calls, one entry per open call
+
+    def start(self):
+        self._children_time.append(0.0)
+
+    def stop(self, name: str, elapsed: float):
+        self_time = elapsed - self._children_time.pop()
+        if self._children_time:
+            self._children_time[-1] += elapsed
+        if name not in self._stats:
+            self._stats[name] = {"calls": 0, "cum_time": 0.0, "self_time": 0.0,
+                                 "hist": [0] * (len(self._hist_bins) + 1)}
+        stats = self._stats[name]
+        stats["calls"] += 1
+        stats["cum_time"] += elapsed
+        stats["self_time"] += self_time
+        stats["hist"][bisect.bisect_left(self._hist_bins, self_time)] += 1
+
+    def reset(self):
+        self._stats = {}
+        self._children_time = []
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        summary = {}
+        for name, stats in self._stats.items():
+            summary[name] = {
+                "calls": stats["calls"],
+                "cum_time": stats["cum_time"],
+                "self_time": stats["self_time"],
+                "mean_cum_ms": 1000 * stats["cum_time"] / stats["calls"],
+                "mean_self_ms": 1000 * stats["self_time"] / stats["calls"],
+                "hist_bins": self._hist_bins,
+                "hist_counts": list(stats["hist"]),
+            }
+        return summary
+
+    def save(self, filepath):
+        with open(filepath, "w") as file:
+            json.dump(self.summary(), file, indent=2)
+
+
+class ProfilingWrapper(gym.Wrapper):
+    """
+    Transparent wrapper which times `step` and `reset` of the wrapped env (and everything below it).
+    The timings are stored in the shared `profiler` under `<name>/step` and `<name>/reset`.
+    """
+
+    def __init__(self, env: gym.Env, name: str, profiler: StepProfiler):
+        super(ProfilingWrapper, self).__init__(env)
+        self._name = name
+        self.profiler = profiler
+
+    def reset(self, **kwargs):
+        self.profiler.start()
+        t0 = time.perf_counter()
+        obs = self.env.reset(**kwargs)
+        self.profiler.stop(f"{self._name}/reset", time.perf_counter() - t0)
+        return obs
+
+    def step(self, action):
+        self.profiler.start()
+        t0 = time.perf_counter()
+        result = self.env.step(action)
+        self.profiler.stop(f"{self._name}/step", time.perf_counter() - t0)
+        return result
+
+    def step_frames(self, action, n_frames: int):
+        # fused frame-skipping step (see `FrameSkip`), only called when the wrapped env implements it
+        self.profiler.start()
+        t0 = time.perf_counter()
+        result = self.env.step_frames(action, n_frames=n_frames)
+        self.profiler.stop(f"{self._name}/step", time.perf_counter() - t0)
+        return result
+
+
+def insert_profiling_wrappers(env: gym.Env, profiler: StepProfiler = None) -> gym.Env:
+    """
+    Insert a profiling wrapper below each layer of the wrapper stack, base env included.
+    Each layer is named after its class, duplicated names are disambiguated with a counter.
+
+    note: it is intended to be called once the stack is built, the wrappers' spaces are not changed.
+    """
+    profiler = profiler if profiler is not None else StepProfiler()
+    layers = []
+    layer = env
+    while isinstance(layer, gym.Wrapper):
+        layers.append(layer)
+        layer = layer.env
+    layers.append(layer)  # base env
+    # name layers from the base env, to have the same names regardless of the outer wrappers
+    names, counts = [], {}
+    for layer in reversed(layers):
+        name = type(layer).__name__
+        counts[name] = counts.get(name, 0) + 1
+        names.append(name if counts[name] == 1 else f"{name}_{counts[name]}")
+    names = list(reversed(names))
+    # re-link each wrapper to a profiled version of its inner env
+    for wrapper, inner_name in zip(layers[:-1], names[1:]):
+        wrapper.env = ProfilingWrapper(wrapper.env, inner_name, profiler)
+    return ProfilingWrapper(env, names[0], profiler)
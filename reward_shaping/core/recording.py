@@ -0,0 +1,333 @@
+import json
+import os
+import pathlib
+import shutil
+import uuid
+import warnings
+from typing import Any, Dict, Iterator, List
+
+import gym
+import numpy as np
+
+"""
+Columnar storage of trajectories.
+
+Layout of a recording directory, one shard per writer (eg, one per env worker):
+    <root>/<shard>/schema.json                  field names, dtypes and shapes
+    <root>/<shard>/episodes.npy                 episode index: (episode, chunk, start, length, done) per segment
+    <root>/<shard>/chunk_<k>/<field>.npy        one column per field, `chunk_size` rows at most
+
+Each episode of T steps is stored as T+1 consecutive rows: row 0 holds the reset observation
+(with zero action, reward and info fields), row t>0 holds the observation after step t with its action,
+reward, done and info fields. The column `t` gives the step of each row.
+Observation and action dictionaries are stored as one field per key (`obs.<key>`, `action.<key>`),
+info values as `info.<key>`. Only numeric fields are recorded, numeric info values are stored as float64
+(an info field can be an int at the first step and a float later, or None until it is available).
+The recorded info fields are the ones of the first step (or the declared ones): a missing, None or mismatching
+value is stored as NaN (zero for bool fields), the fields appearing later are not recorded, with a warning.
+"""
+
+INDEX_DTYPE = np.dtype([("episode", np.int64), ("chunk", np.int64), ("start", np.int64), ("length", np.int64),
+                        ("done", np.bool_)])
+# info fields added by gym wrappers at the end of some episodes only, not recorded
+EPISODE_END_INFO_KEYS = ["TimeLimit.truncated", "terminal_observation"]
+
+
+def _numeric(value) -> bool:
+    try:
+        return np.asarray(value).dtype.kind in "biuf"
+    except (TypeError, ValueError):
+        return False
+
+
+def _obs_fields(obs) -> Dict[str, Any]:
+    if isinstance(obs, dict):
+        return {f"obs.{k}": v for k, v in obs.items()}
+    return {"obs": obs}
+
+
+def _action_fields(action) -> Dict[str, Any]:
+    if isinstance(action, dict):
+        return {f"action.{k}": v for k, v in action.items()}
+    return {"action": action}
+
+
+def _chunk_name(chunk: int) -> str:
+    return f"chunk_{chunk:06d}"
+
+
+class TrajectoryWriter:
+    """
+    Buffered writer of a single shard.
+
+    Rows are accumulated in preallocated buffers of `chunk_size` rows, then each full buffer is written
+    as a new chunk. The memory is bounded by one chunk per field.
+    Chunks contain whole episodes, unless an episode is longer than a chunk (then it is split in segments).
+
+    @param: directory: shard directory, created if it does not exist
+    @param: chunk_size: nr rows per chunk
+    @param: info_keys: info fields to record, if None then all the numeric (or None) fields of the first step
+    @raise ValueError: if an observation or action field is not numeric, at the first step
+    """
+
+    def __init__(self, directory: pathlib.Path, chunk_size: int = 10000, info_keys: List[str] = None):
+        self._dir = pathlib.Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._chunk_size = chunk_size
+        self._info_keys = info_keys
+        self._infer_info_keys = info_keys is None
+        self._schema = None
+        self._buffers = None
+        self._n_rows = 0
+        self._n_chunks = 0
+        self._index = []
+        # episodes in the buffer: (episode id, start row, length, done), the last one can be in progress
+        self._episodes = []
+        self._episode_id = -1
+        self._t = 0
+        self._pending_reset = None
+        # info fields already reported as missing, mismatching or not recorded
+        self._warned = set()
+
+    def reset(self, obs):
+        self._end_episode(done=False)
+        self._episode_id += 1
+        # the reset row is written with the first step, once the schema is known
+        self._pending_reset = {k: np.array(v, copy=True) for k, v in _obs_fields(obs).items()}
+
+    def step(self, obs, action, reward, done, info):
+        assert self._pending_reset is not None or self._in_episode(), "step before reset"
+        fields = dict(_obs_fields(obs))
+        fields.update(_action_fields(action))
+        fields.update({"reward": reward, "done": done})
+        if self._schema is None:
+            self._init_schema(fields, info)
+        fields.update(self._info_fields(info))
+        if self._pending_reset is not None:
+            reset_fields = {name: 0 for name in self._schema}
+            reset_fields.update(self._pending_reset)
+            self._pending_reset = None
+            self._t = 0
+            self._append_row(reset_fields)
+            self._episodes.append([self._episode_id, self._n_rows - 1, 1, None])
+        self._t += 1
+        self._append_row(fields)
+        self._episodes[-1][2] += 1
+        if done:
+            self._end_episode(done=True)
+
+    def close(self):
+        self._end_episode(done=False)
+        self._flush(self._n_rows)
+
+    def _in_episode(self) -> bool:
+        return len(self._episodes) > 0 and self._episodes[-1][3] is None
+
+    def _end_episode(self, done: bool):
+        self._pending_reset = None
+        if len(self._episodes) > 0 and self._episodes[-1][3] is None:
+            self._episodes[-1][3] = done
+
+    def _init_schema(self, fields: Dict[str, Any], info: Dict[str, Any]):
+        if self._info_keys is None:
+            self._info_keys = [k for k, v in info.items() if (v is None or _numeric(v)) and
+                               k not in EPISODE_END_INFO_KEYS]
+        self._schema = {"t": (np.dtype(np.int32), ())}
+        for name, value in fields.items():
+            value = np.asarray(value)
+            if value.dtype.kind not in "biuf":
+                raise ValueError(f"field {name} of dtype {value.dtype} cannot be recorded, only numeric fields")
+            self._schema[name] = (value.dtype, value.shape)
+        for key in list(self._info_keys):
+            if info.get(key, None) is None:
+                # not available yet, a scalar value is expected
+                if key not in info:
+                    self._warn_once(key, f"info field {key} missing at the first step, recorded as a float scalar")
+                self._schema[f"info.{key}"] = (np.dtype(np.float64), ())
+            elif _numeric(info[key]):
+                value = np.asarray(info[key])
+                dtype = np.dtype(np.float64) if value.dtype.kind in "iuf" else value.dtype
+                self._schema[f"info.{key}"] = (dtype, value.shape)
+            else:
+                self._warn_once(key, f"info field {key} of type {type(info[key])} is not numeric, not recorded")
+                self._info_keys.remove(key)
+        self._buffers = {name: np.zeros((self._chunk_size, *shape), dtype=dtype) for name, (dtype, shape) in
+                         self._schema.items()}
+        with open(self._dir / "schema.json", "w") as file:
+            json.dump({"chunk_size": self._chunk_size,
+                       "fields": {name: {"dtype": dtype.str, "shape": list(shape)} for name, (dtype, shape) in
+                                  self._schema.items()}}, file)
+
+    def _info_fields(self, info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        recorded info fields of a step, a missing, None or mismatching value is stored as NaN (zero if not float).
+        The recorder never stops the training: the anomalies are reported once per field, as warnings.
+        """
+        fields = {}
+        for key in self._info_keys:
+            dtype, shape = self._schema[f"info.{key}"]
+            value = info.get(key, None)
+            if key not in info:
+                self._warn_once(key, f"info field {key} missing at step {self._t + 1} of episode "
+                                     f"{self._episode_id}, stored as missing")
+            elif value is not None and not (_numeric(value) and np.shape(value) == shape and
+                                             np.can_cast(np.asarray(value).dtype, dtype, "same_kind")):
+                self._warn_once(key, f"info field {key} with value {value} does not match the recorded {dtype} "
+                                     f"and shape {shape}, stored as missing")
+                value = None
+            fields[f"info.{key}"] = np.full(shape, np.nan if dtype.kind == "f" else 0, dtype) if value is None \
+                else value
+        if self._infer_info_keys:
+            for key, value in info.items():
+                if key not in self._info_keys and key not in EPISODE_END_INFO_KEYS and _numeric(value):
+                    self._warn_once(key, f"info field {key} not in the first step, not recorded "
+                                         f"(declare the recorded fields with `info_keys`)")
+        return fields
+
+    def _warn_once(self, key: str, message: str):
+        if key not in self._warned:
+            self._warned.add(key)
+            warnings.warn(message, RuntimeWarning)
+
+    def _append_row(self, fields: Dict[str, Any]):
+        if self._n_rows == self._chunk_size:
+            # write the completed episodes, or the whole buffer if a single episode fills it
+            in_progress = self._episodes[-1] if self._episodes and self._episodes[-1][3] is None else None
+            self._flush(in_progress[1] if in_progress is not None and in_progress[1] > 0 else self._n_rows)
+        for name, buffer in self._buffers.items():
+            buffer[self._n_rows] = self._t if name == "t" else fields[name]
+        self._n_rows += 1
+
+    def _flush(self, n_rows: int):
+        if n_rows == 0 or self._buffers is None:
+            return
+        chunk_dir = self._dir / _chunk_name(self._n_chunks)
+        tmp_dir = self._dir / f"{_chunk_name(self._n_chunks)}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir()
+        for name, buffer in self._buffers.items():
+            np.save(tmp_dir / f"{name}.npy", buffer[:n_rows])
+        os.replace(tmp_dir, chunk_dir)
+        # index the segments of episodes in the chunk, keep the remaining ones
+        remaining = []
+        for episode in self._episodes:
+            episode_id, start, length, done = episode
+            if start >= n_rows:
+                remaining.append([episode_id, start - n_rows, length, done])
+                continue
+            written = min(length, n_rows - start)
+            if written > 0:
+                segment_done = bool(done) if written == length else False
+                self._index.append((episode_id, self._n_chunks, start, written, segment_done))
+            if written < length or done is None:
+                # the episode continues in the next chunk
+                remaining.append([episode_id, 0, length - written, done])
+        self._episodes = remaining
+        # move the rows not written to the front of the buffers
+        n_left = self._n_rows - n_rows
+        if n_left > 0:
+            for buffer in self._buffers.values():
+                buffer[:n_left] = buffer[n_rows:self._n_rows]
+        self._n_rows = n_left
+        self._n_chunks += 1
+        # atomic update of the index, readers only see complete chunks
+        np.save(self._dir / "episodes.tmp.npy", np.array(self._index, dtype=INDEX_DTYPE))
+        os.replace(self._dir / "episodes.tmp.npy", self._dir / "episodes.npy")
+
+
+class TrajectoryRecorder(gym.Wrapper):
+    """
+    This wrapper streams the episodes (observations, actions, rewards, info fields) into a columnar shard.
+
+    @param: env: gym environment
+    @param: directory: root of the recording, each wrapper writes its own shard in it
+    @param: shard: name of the shard, by default unique per process and wrapper (eg, for subprocess vec-envs)
+    @param: chunk_size: nr rows buffered in memory before writing a chunk
+    @param: info_keys: info fields to record, if None then all the numeric fields
+    """
+
+    def __init__(self, env: gym.Env, directory: pathlib.Path, shard: str = None, chunk_size: int = 10000,
+                 info_keys: List[str] = None):
+        super(TrajectoryRecorder, self).__init__(env)
+        shard = f"shard_{os.getpid()}_{uuid.uuid4().hex[:8]}" if shard is None else shard
+        self._writer = TrajectoryWriter(pathlib.Path(directory) / shard, chunk_size=chunk_size, info_keys=info_keys)
+
+    def reset(self, **kwargs):
+        obs = self.env.reset(**kwargs)
+        self._writer.reset(obs)
+        return obs
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        self._writer.step(obs, action, reward, done, info)
+        return obs, reward, done, info
+
+    def close(self):
+        self._writer.close()
+        return super(TrajectoryRecorder, self).close()
+
+
+class TrajectoryDataset:
+    """
+    Reader of a recording directory (or of a single shard).
+    Episodes are dictionaries of memory-mapped columns, views on the chunk files unless split across chunks.
+    """
+
+    def __init__(self, root: pathlib.Path):
+        root = pathlib.Path(root)
+        shard_dirs = [root] if (root / "schema.json").exists() else \
+            sorted(d for d in root.iterdir() if (d / "schema.json").exists())
+        self._shards = []
+        for shard_dir in shard_dirs:
+            with open(shard_dir / "schema.json", "r") as file:
+                schema = json.load(file)
+            index = np.load(shard_dir / "episodes.npy") if (shard_dir / "episodes.npy").exists() else \
+                np.zeros(0, dtype=INDEX_DTYPE)
+            self._shards.append((shard_dir, schema, index))
+        # episodes as (shard, list of segments), in order of shard and episode id
+        self._episodes = []
+        for i, (_, _, index) in enumerate(self._shards):
+            segments = {}
+            for segment in index:
+                segments.setdefault(int(segment["episode"]), []).append(segment)
+            self._episodes.extend((i, segments[episode_id]) for episode_id in sorted(segments))
+        self._chunks = {}
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._shards[0][1]["fields"].keys()) if self._shards else []
+
+    def __len__(self):
+        return len(self._episodes)
+
+    def is_complete(self, i: int) -> bool:
+        """ true if the episode terminated with done, false if interrupted (eg, the recording was closed) """
+        return bool(self._episodes[i][1][-1]["done"])
+
+    def _column(self, shard: int, chunk: int, field: str) -> np.ndarray:
+        key = (shard, chunk, field)
+        if key not in self._chunks:
+            shard_dir = self._shards[shard][0]
+            self._chunks[key] = np.load(shard_dir / _chunk_name(chunk) / f"{field}.npy", mmap_mode="r")
+        return self._chunks[key]
+
+    def episode(self, i: int) -> Dict[str, np.ndarray]:
+        shard, segments = self._episodes[i]
+        episode = {}
+        for field in self._shards[shard][1]["fields"]:
+            parts = [self._column(shard, int(s["chunk"]), field)[s["start"]:s["start"] + s["length"]]
+                     for s in segments]
+            episode[field] = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return episode
+
+    def episodes(self, complete_only: bool = True) -> Iterator[Dict[str, np.ndarray]]:
+        for i in range(len(self)):
+            if not complete_only or self.is_complete(i):
+                yield self.episode(i)
+
+
+def get_field_group(episode: Dict[str, np.ndarray], prefix: str) -> Dict[str, np.ndarray]:
+    """ columns of a group of fields (eg, 'obs' or 'info'), with the names of the original dictionary """
+    if prefix in episode:
+        return {prefix: episode[prefix]}
+    return {name[len(prefix) + 1:]: column for name, column in episode.items() if name.startswith(f"{prefix}.")}
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import pathlib
+from typing import Any, Dict, List, Tuple
+
+import gym
+import numpy as np
+
+from reward_shaping.core.recording import TrajectoryDataset, get_field_group
+
+"""
+Offline re-scoring of recorded episodes (see `reward_shaping.core.recording`).
+
+Each episode is replayed through the reward wrappers used in training (`make_reward_wrap`),
+then its score is the return of the replayed episode:
+    - the robustness of the spec for 'tltl', the sum of the windowed robustness for 'bhnr',
+    - the return of the shaped reward for 'hprs', 'morl_*', 'default',
+    - the custom metric `EvalConfig.eval_episode` for 'eval'.
+
+Scores are cached per (shard content hash, env, task, reward, code version).
+"""
+
+PACKAGE_DIR = pathlib.Path(__file__).parent.parent
+DEFAULT_CACHE_DIR = pathlib.Path.home() / ".cache" / "reward_shaping" / "scores"
+
+# hashes and datasets opened in this process, workers score several chunks of the same shard
+_shard_hashes = {}
+_datasets = {}
+
+
+def _scalar_or_none(value):
+    value = value.item()
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+
+class ReplayEnv(gym.Env):
+    """ env replaying a recorded episode: the observations, rewards, done flags and infos of each step """
+
+    def __init__(self, episode: Dict[str, np.ndarray]):
+        self._obs = get_field_group(episode, "obs")
+        self._info = get_field_group(episode, "info")
+        self._actions = get_field_group(episode, "action")
+        self._rewards = episode["reward"]
+        self._dones = episode["done"]
+        self._t = 0
+
+    @property
+    def n_steps(self) -> int:
+        return len(self._rewards) - 1
+
+    def action(self, t: int):
+        if "action" in self._actions and len(self._actions) == 1:
+            return self._actions["action"][t]
+        return {k: column[t] for k, column in self._actions.items()}
+
+    def _observation(self, t: int):
+        if "obs" in self._obs and len(self._obs) == 1:
+            return np.array(self._obs["obs"][t])
+        return {k: np.array(column[t]) if column.ndim > 1 else column[t].item() for k, column in self._obs.items()}
+
+    def reset(self):
+        self._t = 0
+        return self._observation(0)
+
+    def get_state(self) -> Dict[str, Any]:
+        """ the replay position, then a wrapped replay can be cloned with `wrappers.get_wrappers_state` """
+        return {"t": self._t}
+
+    def set_state(self, state: Dict[str, Any]):
+        self._t = state["t"]
+
+    def step(self, action):
+        self._t += 1
+        # a new info dict at each step, wrappers update it in-place, the missing values (NaN) are replayed as None
+        info = {k: _scalar_or_none(column[self._t]) if column.ndim == 1 else np.array(column[self._t])
+                for k, column in self._info.items()}
+        return self._observation(self._t), float(self._rewards[self._t]), bool(self._dones[self._t]), info
+
+
+def score_episode(episode: Dict[str, np.ndarray], env_name: str, env_params: Dict[str, Any], reward: str) -> float:
+    from reward_shaping.training.utils import make_reward_wrap
+    replay = ReplayEnv(episode)
+    env = make_reward_wrap(env_name, replay, env_params, reward)
+    env.reset()
+    tot_reward = 0.0
+    for t in range(1, replay.n_steps + 1):
+        _, step_reward, _, _ = env.step(replay.action(t))
+        tot_reward += float(step_reward)
+    return tot_reward
+
+
+def get_code_version() -> str:
+    """ hash of the package sources and configs, the scores depend on reward definitions and env params """
+    digest = hashlib.sha256()
+    for file in sorted(list(PACKAGE_DIR.rglob("*.py")) + list(PACKAGE_DIR.rglob("*.yml"))):
+        digest.update(str(file.relative_to(PACKAGE_DIR)).encode("utf-8"))
+        digest.update(file.read_bytes())
+    return digest.hexdigest()
+
+
+def get_shard_hash(shard_dir: pathlib.Path) -> str:
+    """ content hash of a recorded shard (schema, episode index and chunks) """
+    shard_dir = pathlib.Path(shard_dir)
+    if shard_dir not in _shard_hashes:
+        digest = hashlib.sha256()
+        for file in sorted(f for f in shard_dir.rglob("*.npy") if ".tmp" not in str(f)) + [shard_dir / "schema.json"]:
+            digest.update(str(file.relative_to(shard_dir)).encode("utf-8"))
+            with open(file, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        _shard_hashes[shard_dir] = digest.hexdigest()
+    return _shard_hashes[shard_dir]
+
+
+def _cache_file(cache_dir: pathlib.Path, shard_hash: str, env_name: str, task: str, reward: str,
+                code_version: str) -> pathlib.Path:
+    content = json.dumps([shard_hash, env_name, task, reward, code_version])
+    return cache_dir / f"{hashlib.sha256(content.encode('utf-8')).hexdigest()}.json"
+
+
+def _load_scores(cache_file: pathlib.Path):
+    try:
+        with open(cache_file, "r") as file:
+            return {int(i): score for i, score in json.load(file)["scores"].items()}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _store_scores(cache_file: pathlib.Path, scores: Dict[int, float]):
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_file, "w") as file:
+        json.dump({"scores": {str(i): score for i, score in sorted(scores.items())}}, file)
+    os.replace(tmp_file, cache_file)
+
+
+def _score_chunk(task: Tuple[str, List[int], str, Dict[str, Any], str]):
+    """ worker: score a chunk of episodes of a shard with a reward """
+    shard_dir, episodes, env_name, env_params, reward = task
+    if shard_dir not in _datasets:
+        _datasets[shard_dir] = TrajectoryDataset(pathlib.Path(shard_dir))
+    dataset = _datasets[shard_dir]
+    return shard_dir, reward, {i: score_episode(dataset.episode(i), env_name, env_params, reward) for i in episodes}
+
+
+def rescore(directory: pathlib.Path, env_name: str, task: str, rewards: List[str], n_workers: int = 1,
+            chunk_episodes: int = 8, cache_dir: pathlib.Path = DEFAULT_CACHE_DIR) -> Dict[str, Dict[str, Dict]]:
+    """
+    Score all the complete episodes of a recording directory with each reward.
+
+    The work is split in chunks of `chunk_episodes` episodes, distributed one at a time to the idle workers.
+    Only the (shard, reward) pairs not in the cache are scored.
+
+    @return: scores indexed by shard name, reward and episode index in the shard
+    """
+    from reward_shaping.training.utils import load_env_params
+    env_params = load_env_params(env_name, task)
+    code_version = get_code_version()
+    directory = pathlib.Path(directory)
+    shard_dirs = [directory] if (directory / "schema.json").exists() else \
+        sorted(d for d in directory.iterdir() if (d / "schema.json").exists())
+    results, missing, tasks = {}, {}, []
+    for shard_dir in shard_dirs:
+        results[shard_dir.name] = {}
+        dataset = TrajectoryDataset(shard_dir)
+        episodes = [i for i in range(len(dataset)) if dataset.is_complete(i)]
+        for reward in rewards:
+            cache_file = _cache_file(cache_dir, get_shard_hash(shard_dir), env_name, task, reward, code_version)
+            scores = _load_scores(cache_file)
+            if scores is not None:
+                results[shard_dir.name][reward] = scores
+                continue
+            missing[(str(shard_dir), reward)] = (cache_file, {})
+            for k in range(0, len(episodes), chunk_episodes):
+                tasks.append((str(shard_dir), episodes[k:k + chunk_episodes], env_name, env_params, reward))
+    if n_workers > 1 and len(tasks) > 1:
+        import multiprocessing
+        with multiprocessing.Pool(n_workers) as pool:
+            # chunksize 1: each idle worker takes the next chunk of episodes
+            chunk_results = list(pool.imap_unordered(_score_chunk, tasks, chunksize=1))
+    else:
+        chunk_results = [_score_chunk(t) for t in tasks]
+    for shard_dir, reward, scores in chunk_results:
+        missing[(shard_dir, reward)][1].update(scores)
+    for (shard_dir, reward), (cache_file, scores) in missing.items():
+        _store_scores(cache_file, scores)
+        results[pathlib.Path(shard_dir).name][reward] = scores
+    return results
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import pathlib
+import pickle
+import warnings
+from typing import Callable, List
+
+# bump to invalidate the cached specs when the serialized objects change
+CACHE_VERSION = 1
+# directory of the on-disk cache, set the environment variable to an empty string to disable it
+CACHE_DIR_ENV = "REWARD_SHAPING_SPEC_CACHE"
+DEFAULT_CACHE_DIR = pathlib.Path.home() / ".cache" / "reward_shaping" / "specs"
+# sources of the filtering specs, their classes are pickled with the parsed specs
+FILTERING_DIR = pathlib.Path(__file__).parent.parent / "lti_filtering"
+
+# pickled specs loaded in this process, to avoid reading the same file at each episode
+_memory_cache = {}
+# version of the filtering sources in this process, hashed once
+_filtering_version = None
+
+
+def get_cache_dir():
+    cache_dir = os.environ.get(CACHE_DIR_ENV, str(DEFAULT_CACHE_DIR))
+    return pathlib.Path(cache_dir) if cache_dir else None
+
+
+def get_rtamt_version():
+    try:
+        from importlib.metadata import version
+        return version("rtamt")
+    except Exception:
+        return "unknown"
+
+
+def get_filtering_version() -> str:
+    """ hash of the lti_filtering sources, as `rescoring.get_code_version` for the package """
+    global _filtering_version
+    if _filtering_version is None:
+        digest = hashlib.sha256()
+        for file in sorted(FILTERING_DIR.rglob("*.py")):
+            digest.update(str(file.relative_to(FILTERING_DIR)).encode("utf-8"))
+            digest.update(file.read_bytes())
+        _filtering_version = digest.hexdigest()
+    return _filtering_version
+
+
+def spec_cache_key(kind: str, spec: str, vars: List[str], types: List[str], semantics) -> str:
+    """
+    the key identifies the parsed spec: spec class, text, declarations, semantics,
+    parser version and version of the filtering sources
+    """
+    content = [CACHE_VERSION, get_rtamt_version(), get_filtering_version(), kind, spec, list(vars), list(types),
+               str(semantics)]
+    return hashlib.sha256(json.dumps(content).encode("utf-8")).hexdigest()
+
+
+def _store(key: str, spec_obj):
+    try:
+        blob = pickle.dumps(spec_obj, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError, RecursionError) as error:
+        warnings.warn(f"parsed spec not cached, it cannot be pickled: {error}", RuntimeWarning)
+        return
+    _memory_cache[key] = blob
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # atomic write, concurrent workers may parse and store the same spec
+        tmp_file = cache_dir / f"{key}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as file:
+            file.write(blob)
+        os.replace(tmp_file, cache_dir / f"{key}.pkl")
+    except OSError as error:
+        warnings.warn(f"parsed spec not stored in {cache_dir}: {error}", RuntimeWarning)
+
+
+def _load(key: str):
+    if key not in _memory_cache:
+        cache_dir = get_cache_dir()
+        if cache_dir is None or not (cache_dir / f"{key}.pkl").exists():
+            return None
+        try:
+            with open(cache_dir / f"{key}.pkl", "rb") as file:
+                _memory_cache[key] = file.read()
+        except OSError:
+            return None
+    try:
+        # a fresh copy at each load, since the evaluation mutates the spec
+        return pickle.loads(_memory_cache[key])
+    except Exception:
+        # corrupted or incompatible entry, it will be replaced by the next parse
+        _memory_cache.pop(key)
+        return None
+
+
+def load_or_parse_spec(kind: str, make_spec: Callable, spec: str, vars: List[str], types: List[str]):
+    """
+    Return a parsed spec, loading it from the cache when possible.
+
+    @param: kind: name of the spec class, part of the cache key
+    @param: make_spec: callable returning a new (not parsed) spec object, with the desired semantics
+    @param: spec, vars, types: spec text and variable declarations
+
+    note: parsing errors are propagated and nothing is cached.
+    """
+    spec_obj = make_spec()
+    key = spec_cache_key(kind, spec, vars, types, spec_obj.semantics)
+    cached = _load(key)
+    if cached is not None:
+        return cached
+    for v, t in zip(vars, types):
+        spec_obj.declare_var(v, f'{t}')
+    spec_obj.spec = spec
+    spec_obj.parse()
+    _store(key, spec_obj)
+    return spec_obj
+
+
+def clear_spec_cache(disk: bool = True):
+    _memory_cache.clear()
+    cache_dir = get_cache_dir()
+    if disk and cache_dir is not None and cache_dir.exists():
+        for file in cache_dir.glob("*.pkl"):
+            file.unlink()
@@ -2,14 +2,48 @@ from typing import Union
 
 import numpy as np
 
+"""
+Math utilities for rewards and potentials, with two paths:
+    - scalar path: plain float math, used when all the inputs are python or numpy scalars (one env step)
+    - array path: numpy vectorized math, used as soon as an input is an array (eg, batches of states)
+"""
 
-def clip_and_norm(v: Union[int, float], minv: Union[int, float], maxv: Union[int, float]):
+Number = Union[int, float, np.ndarray]
+
+# below this domain width, the normalization is degenerate
+_NORM_TOL = 0.000001
+
+
+def _is_array(v) -> bool:
+    return isinstance(v, np.ndarray) and v.ndim > 0
+
+
+def clip(v: Number, minv: Number, maxv: Number):
+    """
+    utility function which returns the value v clipped in [minv, maxv], as np.clip.
+    """
+    if _is_array(v) or _is_array(minv) or _is_array(maxv):
+        return np.clip(v, minv, maxv)
+    # note: the order of min/max propagates nan as np.clip
+    return float(min(max(float(v), minv), maxv))
+
+
+def clip_and_norm(v: Number, minv: Number, maxv: Number):
     """
     utility function which returns the normalized value v' in [0, 1].
 
     @params: value `v` before normalization,
     @params: `minv`, `maxv` extreme values of the domain.
     """
-    if np.abs(minv - maxv) <= 0.000001:
+    if _is_array(v) or _is_array(minv) or _is_array(maxv):
+        return _clip_and_norm_array(v, minv, maxv)
+    if abs(minv - maxv) <= _NORM_TOL:
         return 0.0
-    return (np.clip(v, minv, maxv) - minv) / (maxv - minv)
+    return (min(max(float(v), minv), maxv) - minv) / (maxv - minv)
+
+
+def _clip_and_norm_array(v: np.ndarray, minv: Number, maxv: Number) -> np.ndarray:
+    width = np.asarray(maxv - minv, dtype=np.float64)
+    degenerate = np.abs(width) <= _NORM_TOL
+    normalized = (np.clip(v, minv, maxv) - minv) / np.where(degenerate, 1.0, width)
+    return np.where(degenerate, 0.0, normalized)
@@ -1,5 +1,6 @@
 from collections import deque
-from typing import Any, Callable, List
+from functools import partial
+from typing import Any, Callable, Dict, List
 
 import gym
 import numpy as np
@@ -8,6 +9,23 @@ from reward_shaping.core.configs import TLRewardConfig, EvalConfig
 from reward_shaping.core.reward import RewardFunction
 
 
+def _copy_obs(obs):
+    """ copy of the numpy arrays in an observation (possibly a dictionary), no deep copy of python objects """
+    if isinstance(obs, dict):
+        return {k: np.array(v, copy=True) for k, v in obs.items()}
+    return None if obs is None else np.array(obs, copy=True)
+
+
+def _stack_column(values):
+    try:
+        return np.array(values)
+    except ValueError:
+        # ragged values (e.g., arrays of different shapes)
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+
+
 class RewardWrapper(gym.Wrapper):
 
     def __init__(self, env: gym.Env, reward_fn: RewardFunction):
@@ -32,6 +50,13 @@ class RewardWrapper(gym.Wrapper):
         self._return += reward
         return next_state, reward, done, info
 
+    def get_state(self) -> Dict[str, Any]:
+        return {"state": _copy_obs(self._state), "reward": self._reward, "return": self._return}
+
+    def set_state(self, state: Dict[str, Any]):
+        self._state = _copy_obs(state["state"])
+        self._reward, self._return = state["reward"], state["return"]
+
 
 class CollectionWrapper(gym.Wrapper):
     """
@@ -67,6 +92,13 @@ class CollectionWrapper(gym.Wrapper):
         # evaluate reward only in terminal states
         return obs, reward, done, info
 
+    def get_state(self) -> Dict[str, Any]:
+        """ snapshot of the collected window, one numpy column per variable """
+        return {"episode": {var: _stack_column(list(values)) for var, values in self._episode.items()}}
+
+    def set_state(self, state: Dict[str, Any]):
+        self._episode = {var: deque(state["episode"][var], maxlen=self._window_len) for var in self._variables}
+
 
 class TLRewardWrapper(CollectionWrapper):
     """
@@ -74,6 +106,9 @@ class TLRewardWrapper(CollectionWrapper):
     It evaluates the episode (or a slice of it), and return the robustness of the specification.
 
     @param: eval_at_end: boolean indicating if evaluating only on terminal states or at each step
+
+    note: with the 'filtering' semantics, the spec is monitored online pushing one sample per step,
+    when the spec contains operators not supported online, the episode is re-evaluated offline at each step.
     """
 
     def __init__(self, env: gym.Env, tl_conf: TLRewardConfig, semantics: str = "stl", window_len: int = None,
@@ -84,25 +119,39 @@ class TLRewardWrapper(CollectionWrapper):
         self._eval_at_end = eval_at_end
         self._reward = 0.0
         self._return = 0.0
+        self._online_monitor = None
         # initialize monitor fn
         if semantics == "stl":
             from reward_shaping.core.helper_fns import monitor_stl_episode
             self._monitor = monitor_stl_episode
         elif semantics == "filtering":
-            from reward_shaping.core.helper_fns import monitor_mtl_filtering_episode
-            self._monitor = monitor_mtl_filtering_episode
+            from reward_shaping.core.helper_fns import monitor_mtl_filtering_episode, \
+                make_mtl_filtering_online_monitor
+            # the collected time is the integer step counter, then the sampling check is skipped
+            self._monitor = partial(monitor_mtl_filtering_episode, check_sampling=False)
+            self._online_monitor = make_mtl_filtering_online_monitor(tl_conf.spec, tl_conf.monitoring_variables,
+                                                                     tl_conf.monitoring_types, window_len,
+                                                                     check_sampling=False)
         else:
             raise NotImplementedError(f"semantics {semantics} not implemented. available semantics: 'stl', 'filtering'")
 
     def reset(self, **kwargs):
         self._reward = 0.0
         self._return = 0.0
+        if self._online_monitor is not None:
+            self._online_monitor.reset()
         state = super().reset(**kwargs)
         return state
 
     def _compute_episode_robustness(self, done):
         reward = 0.0
-        if len(self._episode['time']) > 1 and (not self._eval_at_end or done):
+        if self._online_monitor is not None:
+            # push the last collected sample, the monitor keeps its own moving window
+            inputs = [(var, self._episode[var][-1]) for var in self._tl_conf.monitoring_variables if var != 'time']
+            robustness = self._online_monitor.update(self._episode['time'][-1], inputs)
+            if len(self._episode['time']) > 1 and (not self._eval_at_end or done):
+                reward = robustness
+        elif len(self._episode['time']) > 1 and (not self._eval_at_end or done):
             reward = self._monitor(self._tl_conf.spec, self._tl_conf.monitoring_variables,
                                    self._tl_conf.monitoring_types, self._episode)[0][1]
         return reward
@@ -117,6 +166,19 @@ class TLRewardWrapper(CollectionWrapper):
         self._return += reward
         return obs, reward, done, info
 
+    def get_state(self) -> Dict[str, Any]:
+        state = super(TLRewardWrapper, self).get_state()
+        state.update({"reward": self._reward, "return": self._return})
+        if self._online_monitor is not None:
+            state["online_monitor"] = self._online_monitor.get_online_state()
+        return state
+
+    def set_state(self, state: Dict[str, Any]):
+        super(TLRewardWrapper, self).set_state(state)
+        self._reward, self._return = state["reward"], state["return"]
+        if self._online_monitor is not None:
+            self._online_monitor.set_online_state(state["online_monitor"])
+
 
 class EvaluationRewardWrapper(CollectionWrapper):
     """ This is an 'episodic' wrapper which evaluate a custom metric in the terminal states."""
@@ -138,4 +200,40 @@ class EvaluationRewardWrapper(CollectionWrapper):
         reward = self._conf.eval_episode(self._episode) if done else 0.0
         self._reward = reward
         self._return += reward
-        return obs, reward, done, info
\ No newline at end of file
+        return obs, reward, done, info
+
+    def get_state(self) -> Dict[str, Any]:
+        state = super(EvaluationRewardWrapper, self).get_state()
+        state.update({"reward": self._reward, "return": self._return})
+        return state
+
+    def set_state(self, state: Dict[str, Any]):
+        super(EvaluationRewardWrapper, self).set_state(state)
+        self._reward, self._return = state["reward"], state["return"]
+
+
+def _stateful_layers(env: gym.Env):
+    """ layers of the wrapper stack implementing `get_state`, from the outermost one """
+    layer, layers = env, []
+    while True:
+        # look it up on the class, gym.Wrapper forwards the attributes of the inner layers
+        if callable(getattr(type(layer), "get_state", None)):
+            layers.append(layer)
+        if not isinstance(layer, gym.Wrapper):
+            return layers
+        layer = layer.env
+
+
+def get_wrappers_state(env: gym.Env) -> List[Dict[str, Any]]:
+    """
+    Snapshot of all the stateful layers in the wrapper stack (e.g., task monitors, reward wrappers).
+    note: the state of the simulation itself is not included.
+    """
+    return [layer.get_state() for layer in _stateful_layers(env)]
+
+
+def set_wrappers_state(env: gym.Env, states: List[Dict[str, Any]]):
+    layers = _stateful_layers(env)
+    assert len(layers) == len(states), f"the snapshot has {len(states)} layers, the stack {len(layers)}"
+    for layer, state in zip(layers, states):
+        layer.set_state(state)
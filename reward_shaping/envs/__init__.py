@@ -1,3 +1,22 @@
-from .cart_pole_obst.cp_continuousobstacle_env import CartPoleContObsEnv
-from .bipedal_walker.bipedal_walker import BipedalWalker
-from .lunar_lander.lunar_lander import LunarLander, LunarLanderContinuous
\ No newline at end of file
+import importlib
+
+# envs are imported on first access (PEP 562), to not load Box2D/pyglet when importing any subpackage
+_lazy_envs = {
+    "CartPoleContObsEnv": ".cart_pole_obst.cp_continuousobstacle_env",
+    "BipedalWalker": ".bipedal_walker.bipedal_walker",
+    "LunarLander": ".lunar_lander.lunar_lander",
+    "LunarLanderContinuous": ".lunar_lander.lunar_lander",
+}
+
+__all__ = list(_lazy_envs.keys())
+
+
+def __getattr__(name):
+    if name in _lazy_envs:
+        module = importlib.import_module(_lazy_envs[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__} has no attribute {name}")
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
@@ -3,7 +3,7 @@ from typing import List
 import numpy as np
 
 from reward_shaping.core.reward import RewardFunction
-from reward_shaping.core.utils import clip_and_norm
+from reward_shaping.core.utils import clip, clip_and_norm
 from reward_shaping.envs.bipedal_walker.specs import get_all_specs
 
 gamma = 1.0
@@ -16,7 +16,7 @@ def safety_collision_potential(state, info):
 
 def dist_to_target(state, info):
     assert "x" in state
-    return np.clip(state["x"], 0.0, 1.0)  # already normalize, safety clipping to avoid unexpected values
+    return clip(state["x"], 0.0, 1.0)  # already normalize, safety clipping to avoid unexpected values
 
 
 def comfort_vx_potential(state, info):
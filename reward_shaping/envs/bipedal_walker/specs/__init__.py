@@ -1,48 +1,78 @@
 from reward_shaping.monitor.formula import Operator
+from reward_shaping.monitor.predicates import RequirementRegistry
 
-_registry = {}
+_registry = RequirementRegistry()
 
 
 def get_spec(name):
-    return _registry[name]
+    return _registry.get_spec(name)
 
 
 def get_all_specs():
-    return _registry
+    return _registry.get_all_specs()
+
+
+def compile_specs(env_params):
+    return _registry.compile(env_params)
+
+
+def get_features():
+    """ shared per-step extractor of the env features """
+    return _registry.features
 
 
 def register_spec(name, operator, build_predicate):
-    if name not in _registry.keys():
-        _registry[name] = (operator, build_predicate)
+    _registry.register_spec(name, operator, build_predicate)
+
+
+def register_feature(name, extractor):
+    _registry.register_feature(name, extractor)
+
+
+def register_derived_feature(name, inputs, fn):
+    _registry.register_derived_feature(name, inputs, fn)
 
 
 def _build_no_collision(env_params):
     assert 'dist_hull_limit' in env_params
-    return lambda state, info: -1.0 if state['collision'] > 0 else +1
+    return ("collision",), lambda collision: 1.0 - 2.0 * (collision > 0)
+
 
 def _build_achieve_goal(env_params):
-    return lambda state, info: info["position_x"] - info["target_x"]
+    return ("position_x", "target_x"), lambda position_x, target_x: position_x - target_x
 
 
 def _build_comfortable_angle(env_params):
     assert 'angle_hull_limit' in env_params
-    return lambda state, info: env_params['angle_hull_limit'] - abs(state['hull_angle'])
+    angle_hull_limit = env_params['angle_hull_limit']
+    return ("hull_angle",), lambda hull_angle: angle_hull_limit - abs(hull_angle)
 
 
 def _build_comfortable_vx(env_params):
     assert 'speed_x_target' in env_params
-    return lambda state, info: state['horizontal_speed'] - env_params['speed_x_target']
+    speed_x_target = env_params['speed_x_target']
+    return ("horizontal_speed",), lambda horizontal_speed: horizontal_speed - speed_x_target
 
 
 def _build_comfortable_vy(env_params):
     assert 'speed_y_limit' in env_params
-    return lambda state, info: env_params['speed_y_limit'] - abs(state['vertical_speed'])
+    speed_y_limit = env_params['speed_y_limit']
+    return ("vertical_speed",), lambda vertical_speed: speed_y_limit - abs(vertical_speed)
 
 
 def _build_comfortable_angle_vel(env_params):
     assert 'angle_vel_limit' in env_params
-    return lambda state, info: env_params['angle_vel_limit'] - abs(state['hull_angle_speed'])
+    angle_vel_limit = env_params['angle_vel_limit']
+    return ("hull_angle_speed",), lambda hull_angle_speed: angle_vel_limit - abs(hull_angle_speed)
+
 
+register_feature("collision", lambda state, info: state["collision"])
+register_feature("position_x", lambda state, info: info["position_x"])
+register_feature("target_x", lambda state, info: info["target_x"])
+register_feature("hull_angle", lambda state, info: state["hull_angle"])
+register_feature("horizontal_speed", lambda state, info: state["horizontal_speed"])
+register_feature("vertical_speed", lambda state, info: state["vertical_speed"])
+register_feature("hull_angle_speed", lambda state, info: state["hull_angle_speed"])
 
 register_spec("s1_coll", Operator.ENSURE, _build_no_collision)
 register_spec("t_goal", Operator.ACHIEVE, _build_achieve_goal)
@@ -8,7 +8,6 @@ import math
 
 import gym
 import numpy as np
-import pyglet
 from gym import spaces
 from gym.spaces import Box
 from gym.utils import seeding
@@ -345,6 +344,7 @@ class CartPoleContObsEnv(gym.Env):
         obstacle_color = (0.05, 0.35, 0.1)
 
         if self.viewer is None:
+            import pyglet  # deferred as the rendering, it needs a display
             from gym.envs.classic_control import rendering
             self.viewer = rendering.Viewer(screen_width, screen_height)
             # Track and background must be drawn fist
@@ -5,6 +5,7 @@ import numpy as np
 from reward_shaping.core.configs import EvalConfig
 from reward_shaping.core.helper_fns import monitor_stl_episode
 from reward_shaping.core.reward import RewardFunction
+from reward_shaping.envs.cart_pole_obst.specs import get_features
 
 
 class CPOContinuousReward(RewardFunction):
@@ -74,11 +75,7 @@ class CPOProgressTargetReward(RewardFunction):
     """
 
     def target_potential(self, state, info):
-        x, theta, collision = state['x'], state['theta'], state['collision']
-        pole_x, pole_y = x + info['pole_length'] * np.sin(theta), \
-                         info['axle_y'] + info['pole_length'] * np.cos(theta)
-        goal_x, goal_y = info['x_target'], info['axle_y'] + info['pole_length']
-        dist_goal = np.linalg.norm([goal_x - pole_x, goal_y - pole_y])
+        dist_goal = get_features()(state, info)['dist_pole_target']
         target_reward = 1 - np.clip(dist_goal, 0, 2.5) / 2.5
         return target_reward
 
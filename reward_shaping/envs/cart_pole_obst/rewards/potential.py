@@ -3,10 +3,11 @@ from typing import Union, List
 from reward_shaping.core.reward import RewardFunction
 import numpy as np
 
-from reward_shaping.core.utils import clip_and_norm
-from reward_shaping.envs.cart_pole_obst.specs import get_all_specs
+from reward_shaping.core.utils import clip, clip_and_norm
+from reward_shaping.envs.cart_pole_obst.specs import get_all_specs, get_features
 
 gamma = 1.0
+_features = get_features()
 
 def safety_falldown_potential(state, info):
     assert "theta" in state and "theta_limit" in info
@@ -29,11 +30,8 @@ def safety_collision_potential(state, info):
 def target_dist_to_goal_potential(state, info):
     assert "x" in state and "theta" in state and "x_target" in info
     assert "axle_y" in info and "pole_length" in info
-    x, theta = state['x'], state['theta']
-    pole_x, pole_y = x + info['pole_length'] * np.sin(theta), info['axle_y'] + info['pole_length'] * np.cos(theta)
-    goal_x, goal_y = info['x_target'], info['axle_y'] + info['pole_length']
-    dist_goal = np.linalg.norm([goal_x - pole_x, goal_y - pole_y])
-    target_reward = 1 - np.clip(dist_goal, 0, 2.5) / 2.5
+    dist_goal = _features(state, info)["dist_pole_target"]
+    target_reward = 1 - clip(dist_goal, 0, 2.5) / 2.5
     return target_reward
 
 
@@ -48,10 +46,7 @@ def simple_base_reward(state, info):
     sparse reward which returns +1 when the target configuration has been reached,
     otherwise 0.
     """
-    pole_x = state["x"] + info['pole_length'] * np.sin(state["theta"])
-    pole_y = info['axle_y'] + info['pole_length'] * np.cos(state["theta"])
-    goal_x, goal_y = info['x_target'], info['axle_y'] + info['pole_length']
-    check_goal = np.linalg.norm([goal_x - pole_x, goal_y - pole_y]) <= info["dist_target_tol"]
+    check_goal = _features(state, info)["dist_pole_target"] <= info["dist_target_tol"]
     return 1.0 if check_goal else 0.0
 
 
@@ -3,6 +3,7 @@ from typing import Dict, Any
 import numpy as np
 
 from reward_shaping.core.configs import TLRewardConfig
+from reward_shaping.envs.cart_pole_obst.specs import get_features
 
 
 def _get_cpo_default_monitoring_variables():
@@ -25,9 +26,7 @@ def _get_cpo_default_monitoring_procedure(state, done, info):
     theta_norm = state['theta'] / info['theta_limit']
     theta_target_norm = np.clip(info['theta_target'], -info['theta_limit'], info['theta_limit']) / info[
         'theta_limit']
-    pole_x, pole_y = state['x'] + info['pole_length'] * np.sin(state['theta']), info['axle_y'] + info['pole_length'] * np.cos(state['theta'])
-    goal_x, goal_y = info['x_target'], info['axle_y'] + info['pole_length']
-    dist_to_target_conf = np.linalg.norm([goal_x - pole_x, goal_y - pole_y])
+    dist_to_target_conf = get_features()(state, info)['dist_pole_target']
     # compute monitoring variables
     monitored_state = {
         'time': info['time'],
@@ -1,47 +1,81 @@
-from reward_shaping.monitor.formula import Operator
 import numpy as np
 
-_registry = {}
+from reward_shaping.monitor.formula import Operator
+from reward_shaping.monitor.predicates import RequirementRegistry
+
+_registry = RequirementRegistry()
 
 
 def get_spec(name):
-    return _registry[name]
+    return _registry.get_spec(name)
 
 
 def get_all_specs():
-    return _registry
+    return _registry.get_all_specs()
+
+
+def compile_specs(env_params):
+    return _registry.compile(env_params)
+
+
+def get_features():
+    """ shared per-step extractor of the env features """
+    return _registry.features
 
 
 def register_spec(name, operator, build_predicate):
-    if name not in _registry.keys():
-        _registry[name] = (operator, build_predicate)
+    _registry.register_spec(name, operator, build_predicate)
+
+
+def register_feature(name, extractor):
+    _registry.register_feature(name, extractor)
+
+
+def register_derived_feature(name, inputs, fn):
+    _registry.register_derived_feature(name, inputs, fn)
 
 
 def _build_no_falldown(env_params):
     assert "theta_limit" in env_params
-    return lambda state, info: np.deg2rad(env_params["theta_limit"]) - abs(state["theta"])
+    theta_limit = np.deg2rad(env_params["theta_limit"])
+    return ("theta",), lambda theta: theta_limit - abs(theta)
 
 
 def _build_no_outside(env_params):
     assert "x_limit" in env_params
-    return lambda state, info: env_params["x_limit"] - abs(state["x"])
+    x_limit = env_params["x_limit"]
+    return ("x",), lambda x: x_limit - abs(x)
 
 
 def _build_no_collision(_):
-    return lambda state, info: -1 if state['collision'] == 1 else +1
+    return ("collision",), lambda collision: 1.0 - 2.0 * (collision == 1)
 
 
 def _build_reach_target(env_params):
-    pole_x = lambda state, info: state['x'] + info['pole_length'] * np.sin(state['theta'])
-    pole_y = lambda state, info: info['axle_y'] + info['pole_length'] * np.cos(state['theta'])
-    return lambda state, info: info['dist_target_tol'] - np.linalg.norm(
-        [info['x_target'] - pole_x(state, info), (info['axle_y'] + info['pole_length']) - pole_y(state, info)])
+    return ("dist_pole_target", "dist_target_tol"), \
+           lambda dist_pole_target, dist_target_tol: dist_target_tol - dist_pole_target
+
+
+def _dist_pole_target(x, theta, pole_length, x_target):
+    # distance of the pole tip from the target, ie. the tip of the pole upright on x_target
+    dist_x = x_target - (x + pole_length * np.sin(theta))
+    dist_y = pole_length - pole_length * np.cos(theta)
+    return (dist_x * dist_x + dist_y * dist_y) ** 0.5
 
 
 def _build_balance(env_params):
     assert "theta_target_tol" in env_params and "theta_target" in env_params
-    return lambda state, info: env_params["theta_target_tol"] - abs(state["theta"] - env_params["theta_target"])
+    theta_target, theta_target_tol = env_params["theta_target"], env_params["theta_target_tol"]
+    return ("theta",), lambda theta: theta_target_tol - abs(theta - theta_target)
+
 
+register_feature("x", lambda state, info: state["x"])
+register_feature("theta", lambda state, info: state["theta"])
+register_feature("collision", lambda state, info: state["collision"])
+register_feature("pole_length", lambda state, info: info["pole_length"])
+register_feature("x_target", lambda state, info: info["x_target"])
+register_feature("dist_target_tol", lambda state, info: info["dist_target_tol"])
+register_derived_feature("dist_pole_target", ("x", "theta", "pole_length", "x_target"), _dist_pole_target)
 
 register_spec("s1_fall", Operator.ENSURE, _build_no_falldown)
 register_spec("s2_exit", Operator.ENSURE, _build_no_outside)
@@ -4,10 +4,11 @@ import numpy as np
 
 from reward_shaping.core.reward import RewardFunction
 from reward_shaping.core.utils import clip_and_norm
-from reward_shaping.envs.lunar_lander.specs import get_all_specs
+from reward_shaping.envs.lunar_lander.specs import get_all_specs, get_features
 
 
 gamma = 1.0
+_features = get_features()
 
 def safety_collision_potential(state, info):
     assert "collision" in state
@@ -20,7 +21,7 @@ def safety_exit_potential(state, info):
 
 
 def target_dist_to_goal_potential(state, info):
-    dist_goal = np.linalg.norm([state["x"] - info["x_target"], state["y"] - info["y_target"]])
+    dist_goal = _features(state, info)["dist_goal"]
     return 1.0 - clip_and_norm(dist_goal, 0, 1.5)
 
 
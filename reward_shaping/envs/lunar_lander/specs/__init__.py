@@ -1,45 +1,75 @@
+import numpy as np
+
 from reward_shaping.monitor.formula import Operator
+from reward_shaping.monitor.predicates import RequirementRegistry
 
-_registry = {}
+_registry = RequirementRegistry()
 
 
 def get_spec(name):
-    return _registry[name]
+    return _registry.get_spec(name)
 
 
 def get_all_specs():
-    return _registry
+    return _registry.get_all_specs()
+
+
+def compile_specs(env_params):
+    return _registry.compile(env_params)
+
+
+def get_features():
+    """ shared per-step extractor of the env features """
+    return _registry.features
 
 
 def register_spec(name, operator, build_predicate):
-    if name not in _registry.keys():
-        _registry[name] = (operator, build_predicate)
+    _registry.register_spec(name, operator, build_predicate)
+
+
+def register_feature(name, extractor):
+    _registry.register_feature(name, extractor)
+
+
+def register_derived_feature(name, inputs, fn):
+    _registry.register_derived_feature(name, inputs, fn)
 
 
 def _build_no_collision(_):
-    return lambda state, info: -1 if state['collision'] == 1 else +1
+    return ("collision",), lambda collision: 1.0 - 2.0 * (collision == 1)
 
 
 def _build_no_outside(_):
-    return lambda state, info: 1.0 - abs(state['x'])  # x coord is already normalized in -1, +1
+    return ("x",), lambda x: 1.0 - abs(x)  # x coord is already normalized in -1, +1
 
 
 def _build_reach_target(env_params):
     assert "halfwidth_landing_area" in env_params and "landing_height" in env_params
-    dist_x = lambda state, info: env_params["halfwidth_landing_area"] - abs(state["x"])
-    dist_y = lambda state, info: env_params["landing_height"] - abs(state["y"])
-    return lambda state, info: min(dist_x(state, info), dist_y(state, info))
+    halfwidth_landing_area, landing_height = env_params["halfwidth_landing_area"], env_params["landing_height"]
+    return ("x", "y"), lambda x, y: np.minimum(halfwidth_landing_area - abs(x), landing_height - abs(y))
 
 
 def _build_comfortable_angle(env_params):
     assert 'angle_limit' in env_params
-    return lambda state, info: env_params['angle_limit'] - abs(state['angle'])
+    angle_limit = env_params['angle_limit']
+    return ("angle",), lambda angle: angle_limit - abs(angle)
 
 
 def _build_comfortable_angle_vel(env_params):
     assert 'angle_speed_limit' in env_params
-    return lambda state, info: env_params['angle_speed_limit'] - abs(state['angle_speed'])
-
+    angle_speed_limit = env_params['angle_speed_limit']
+    return ("angle_speed",), lambda angle_speed: angle_speed_limit - abs(angle_speed)
+
+
+register_feature("collision", lambda state, info: state["collision"])
+register_feature("x", lambda state, info: state["x"])
+register_feature("y", lambda state, info: state["y"])
+register_feature("angle", lambda state, info: state["angle"])
+register_feature("angle_speed", lambda state, info: state["angle_speed"])
+register_feature("x_target", lambda state, info: info["x_target"])
+register_feature("y_target", lambda state, info: info["y_target"])
+register_derived_feature("dist_goal", ("x", "y", "x_target", "y_target"),
+                         lambda x, y, x_target, y_target: ((x - x_target) ** 2 + (y - y_target) ** 2) ** 0.5)
 
 register_spec('s1_coll', Operator.ENSURE, _build_no_collision)
 register_spec('s2_exit', Operator.ENSURE, _build_no_outside)
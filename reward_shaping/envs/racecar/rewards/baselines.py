@@ -5,6 +5,7 @@ import numpy as np
 
 from reward_shaping.core.configs import EvalConfig
 from reward_shaping.core.helper_fns import monitor_stl_episode
+from reward_shaping.envs.racecar.specs import get_features
 
 
 class RCEvalConfig(EvalConfig):
@@ -25,6 +26,7 @@ class RCEvalConfig(EvalConfig):
                 'float', 'float', 'float', 'float']
 
     def get_monitored_state(self, state, done, info) -> Dict[str, Any]:
+        features = get_features()(state, info)
         # compute monitoring variables (all of them normalized in 0,1)
         monitored_state = {
             'time': info['steps'],
@@ -36,9 +38,9 @@ class RCEvalConfig(EvalConfig):
             'velocity_x': state['velocity_x'],
             'min_velx': info['min_velx'],
             'max_velx': info['max_velx'],
-            'last_steering': state['last_actions'][-1][0],
+            'last_steering': features['last_steering'],
             'comfort_max_steering': info['comfort_max_steering'],
-            'action_norm': np.linalg.norm([state['last_actions'][-1] - state['last_actions'][-2]]),
+            'action_norm': features['last_actions_delta'],
             'comfort_max_norm': info['comfort_max_norm'],
         }
         self._max_episode_len = math.ceil(info['max_steps'] / info["frame_skip"])
@@ -89,20 +89,37 @@ class RacecarEnv(ChangingTrackSingleAgentRaceEnv):
         return obs
 
     def step(self, action: Dict):
-        obs, reward, done, info = super(RacecarEnv, self).step(action)
-        self._steps += 1
+        return self.step_frames(action, n_frames=1)
+
+    def step_frames(self, action: Dict, n_frames: int):
+        """
+        Repeat the action for `n_frames` simulation steps and sum the rewards.
+
+        The intermediate frames only track progress and termination,
+        the observation and info are extended only for the last simulated frame.
+        """
+        total_reward = 0.0
+        for frame in range(n_frames):
+            obs, reward, done, info = super(RacecarEnv, self).step(action)
+            self._steps += 1
+            total_reward += reward
+            progress = self._update_progress(info)
+            done = self._check_termination(progress, done, info)
+            if done:
+                break
         obs = self._extend_obs(obs, info)
-        done = self._check_termination(obs, done, info)
         info = self._extend_info(reward, done, info)
-        return obs, reward, done, info
+        return obs, total_reward, done, info
 
-    def _extend_obs(self, obs, info):
+    def _update_progress(self, info):
         if self._initial_progress is None and info["progress"] is not None:
             # update the initial-progress on the first available progress after reset
             self._initial_progress = info["progress"]
-        progress = 0.0 if self._initial_progress is None else (info["lap"] - 1) + (info["progress"] - self._initial_progress)
+        return 0.0 if self._initial_progress is None else (info["lap"] - 1) + (info["progress"] - self._initial_progress)
+
+    def _extend_obs(self, obs, info):
         obs["collision"] = float(info["wall_collision"])
-        obs["progress"] = progress
+        obs["progress"] = self._update_progress(info)
         obs["dist2obst"] = info["obstacle"]
         obs["velocity_x"] = np.array([obs["velocity"][0]], dtype=np.float32)
         return obs
@@ -122,9 +139,9 @@ class RacecarEnv(ChangingTrackSingleAgentRaceEnv):
         info["done"] = done
         return info
 
-    def _check_termination(self, obs, done, info):
+    def _check_termination(self, progress, done, info):
         collision = info["wall_collision"]
-        lap_completion = obs["progress"] >= self._target_progress
+        lap_completion = progress >= self._target_progress
         timeout = self._steps >= self._max_steps
         return bool(done or collision or lap_completion or timeout)
 
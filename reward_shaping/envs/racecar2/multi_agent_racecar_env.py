@@ -7,7 +7,6 @@ import racecar_gym
 from gym.spaces import Box
 from racecar_gym import MultiAgentScenario
 from racecar_gym.agents import FollowTheGap, FollowTheWall
-from racecar_gym.agents.follow_the_wall import PID
 from racecar_gym.agents.random import RandomAgent
 from racecar_gym.envs.gym_api import ChangingTrackMultiAgentRaceEnv
 
@@ -136,10 +135,13 @@ class MultiAgentRacecarEnv(ChangingTrackMultiAgentRaceEnv):
 
     def reset(self):
         joint_obs = super(MultiAgentRacecarEnv, self).reset(mode='grid' if self._eval else 'random_ball')
-        # perform dummy step to obtain agents' infos
-        no_action = {"speed": -1.0, "steering": 0.0}
-        joint_no_action = {"A": no_action, "B": no_action}
-        joint_obs, joint_reward, joint_done, joint_info = super(MultiAgentRacecarEnv, self).step(joint_no_action)
+        # query agents' infos from the simulation, without stepping it
+        joint_info = self._query_agents_info()
+        if not all([joint_info.get(i, {}).get("progress", None) is not None for i in ["A", "B"]]):
+            # fall back to a dummy step when the progress is not available before the first step
+            no_action = {"speed": -1.0, "steering": 0.0}
+            joint_no_action = {"A": no_action, "B": no_action}
+            joint_obs, _, _, joint_info = super(MultiAgentRacecarEnv, self).step(joint_no_action)
         # assign roles
         is_a_in_front = joint_info["A"]["progress"] > joint_info["B"]["progress"]
         self._npc_id = "A" if is_a_in_front else "B"
@@ -154,6 +156,10 @@ class MultiAgentRacecarEnv(ChangingTrackMultiAgentRaceEnv):
         self._steps = 0
         return agent_obs
 
+    def _query_agents_info(self):
+        """ race infos (e.g., progress, lap, collisions) of all the agents in the current simulation state """
+        return self.scenario.world.state()
+
     def _randomize_npc_params(self, npc_type, default_params):
         # ftg: randomize velocity profile
         # ftw: randomize velocity profile and distance to wall
@@ -167,34 +173,60 @@ class MultiAgentRacecarEnv(ChangingTrackMultiAgentRaceEnv):
         return default_params
 
     def step(self, action: Dict):
-        # perform sim step
-        npc_action, self._npc_state = self._npc.get_action(self._npc_obs, self._npc_state)
-        joint_action = {self._agent_id: action, self._npc_id: npc_action}
-        joint_obs, joint_reward, joint_done, joint_info = super(MultiAgentRacecarEnv, self).step(joint_action)
+        return self.step_frames(action, n_frames=1)
+
+    def step_frames(self, action: Dict, n_frames: int):
+        """
+        Repeat the agent action for `n_frames` simulation steps and sum the agent rewards,
+        the npc keeps acting on its own observation at every frame.
+
+        The intermediate frames only track progress and termination,
+        the observation and info are extended only for the last simulated frame.
+        """
+        total_reward = 0.0
+        for frame in range(n_frames):
+            # perform sim step
+            npc_action, self._npc_state = self._npc.get_action(self._npc_obs, self._npc_state)
+            joint_action = {self._agent_id: action, self._npc_id: npc_action}
+            joint_obs, joint_reward, joint_done, joint_info = super(MultiAgentRacecarEnv, self).step(joint_action)
+            reward = joint_reward[self._agent_id]
+            total_reward += reward
+            progress = self._update_progress(joint_info[self._agent_id])
+            dist_ego2npc = self._get_dist_ego2npc(joint_info)
+            done = self._check_termination(progress, dist_ego2npc, joint_info)
+            if done or frame == n_frames - 1:
+                break
+            # update internal variables
+            self._steps += 1
+            self._npc_obs = joint_obs[self._npc_id]
         # unpack all joint quantities and keep only agent ones (e.g., joint_obs -> agent_obs)
         obs = self._extend_obs(joint_obs, joint_info)
-        reward = joint_reward[self._agent_id]
-        done = self._check_termination(obs, joint_done, joint_info)
         info = self._extend_info(reward, done, joint_info)
         # update internal variables
         self._steps += 1
         self._npc_obs = joint_obs[self._npc_id]  # keep last npc observation for next step
-        return obs, reward, done, info
+        return obs, total_reward, done, info
 
-    def _extend_obs(self, joint_obs, joint_info):
-        obs = joint_obs[self._agent_id]
-        info, info_npc = joint_info[self._agent_id], joint_info[self._npc_id]
+    def _update_progress(self, info):
         if self._initial_progress is None and info["progress"] is not None:
             # update the initial-progress on the first available progress after reset
             self._initial_progress = info["progress"]
-        progress = 0.0 if self._initial_progress is None else (info["lap"] - 1) + (
+        return 0.0 if self._initial_progress is None else (info["lap"] - 1) + (
                     info["progress"] - self._initial_progress)
+
+    def _get_dist_ego2npc(self, joint_info):
+        info, info_npc = joint_info[self._agent_id], joint_info[self._npc_id]
+        return ((info["lap"] + info["progress"]) - (info_npc["lap"] + info_npc["progress"])) * self._track_length
+
+    def _extend_obs(self, joint_obs, joint_info):
+        obs = joint_obs[self._agent_id]
+        info = joint_info[self._agent_id]
         obs["collision"] = float(info["wall_collision"])
-        obs["progress"] = progress
+        obs["progress"] = self._update_progress(info)
         obs["remaining_time"] = 1.0 if self._eval else (self._max_steps - self._steps)/self._max_steps
         obs["dist2obst"] = info["obstacle"]
         obs["velocity_x"] = np.array([obs["velocity"][0]], dtype=np.float32)
-        obs["dist_ego2npc"] = ((info["lap"] + info["progress"]) - (info_npc["lap"] + info_npc["progress"])) * self._track_length
+        obs["dist_ego2npc"] = self._get_dist_ego2npc(joint_info)
         return obs
 
     def _extend_info(self, reward, done, joint_info):
@@ -216,11 +248,11 @@ class MultiAgentRacecarEnv(ChangingTrackMultiAgentRaceEnv):
         info["done"] = done
         return info
 
-    def _check_termination(self, obs, joint_done, joint_info):
-        info, info_npc = joint_info[self._agent_id], joint_info[self._npc_id]
+    def _check_termination(self, progress, dist_ego2npc, joint_info):
+        info = joint_info[self._agent_id]
         collision = info["wall_collision"] or len(info["opponent_collisions"]) > 0
-        break_safety_dist = not (obs["dist_ego2npc"] < self._safety_distance)
-        lap_completion = obs["progress"] >= self._target_progress
+        break_safety_dist = not (dist_ego2npc < self._safety_distance)
+        lap_completion = progress >= self._target_progress
         timeout = self._steps >= self._max_steps
         return bool(collision or break_safety_dist or lap_completion or timeout)
 
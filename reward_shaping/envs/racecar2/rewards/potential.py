@@ -1,12 +1,16 @@
+import math
 from typing import List, Union
 
 import numpy as np
 
 from reward_shaping.core.reward import RewardFunction
 from reward_shaping.core.utils import clip_and_norm
-from reward_shaping.envs.racecar2.specs import get_all_specs
+from reward_shaping.envs.racecar2.specs import get_all_specs, get_features
 
 gamma = 1.0
+# max l2-norm of the difference of two actions, assume action_1=[-1, -1], action_2=[1, 1]
+_MAX_L2NORM_ACTION = math.sqrt(8)
+_features = get_features()
 
 
 def safety_collision_potential(state, info):
@@ -27,15 +31,14 @@ def dist_to_target(state, info):
 def comfort_small_steer(state, info):
     # assume target steering is 0
     assert "last_actions" in state
-    abs_steering = abs(state["last_actions"][-1][0])
+    abs_steering = abs(_features(state, info)["last_steering"])
     return 1.0 - clip_and_norm(abs_steering, info["comfort_max_steering"], 1.0)
 
 
 def comfort_smooth_control(state, info):
     assert "last_actions" in state and "comfort_max_norm" in info
-    l2norm_action = np.linalg.norm(state["last_actions"][-1] - state["last_actions"][-2])
-    max_l2norm = np.sqrt(8)  # assume action_1=[-1, -1], action_2=[1, 1]
-    return 1.0 - clip_and_norm(l2norm_action, info["comfort_max_norm"], max_l2norm)
+    l2norm_action = _features(state, info)["last_actions_delta"]
+    return 1.0 - clip_and_norm(l2norm_action, info["comfort_max_norm"], _MAX_L2NORM_ACTION)
 
 
 def comfort_min_comfort_dist(state, info):
@@ -1,28 +1,45 @@
 import numpy as np
 
 from reward_shaping.monitor.formula import Operator
+from reward_shaping.monitor.predicates import RequirementRegistry
 
-_registry = {}
+_registry = RequirementRegistry()
 
 
 def get_spec(name):
-    return _registry[name]
+    return _registry.get_spec(name)
 
 
 def get_all_specs():
-    return _registry
+    return _registry.get_all_specs()
+
+
+def compile_specs(env_params):
+    return _registry.compile(env_params)
+
+
+def get_features():
+    """ shared per-step extractor of the env features """
+    return _registry.features
 
 
 def register_spec(name, operator, build_predicate):
-    if name not in _registry.keys():
-        _registry[name] = (operator, build_predicate)
+    _registry.register_spec(name, operator, build_predicate)
+
+
+def register_feature(name, extractor):
+    _registry.register_feature(name, extractor)
+
+
+def register_derived_feature(name, inputs, fn):
+    _registry.register_derived_feature(name, inputs, fn)
 
 
 def _build_no_collision(_):
     """
     ensure collision <= 0
     """
-    return lambda state, info: -1.0 if state['collision'] > 0 else +1
+    return ("collision",), lambda collision: 1.0 - 2.0 * (collision > 0)
 
 
 def _build_keep_safety_distance(_):
@@ -31,7 +48,7 @@ def _build_keep_safety_distance(_):
 
     note: since the ego vehicle is behing, we assume all these distances to be negative values
     """
-    return lambda state, info: info["safety_distance"] - state["dist_ego2npc"]
+    return ("safety_distance", "dist_ego2npc"), lambda safety_distance, dist_ego2npc: safety_distance - dist_ego2npc
 
 
 def _build_complete_lap(env_params):
@@ -40,7 +57,8 @@ def _build_complete_lap(env_params):
 
     note: info['progress'] contains the normalized lap progress w.r.t. the grid position
     """
-    return lambda state, info: state["progress"] - env_params["reward_params"]["target_progress"]
+    target_progress = env_params["reward_params"]["target_progress"]
+    return ("progress",), lambda progress: progress - target_progress
 
 
 def _build_keep_center(env_params):
@@ -57,7 +75,8 @@ def _build_keep_center(env_params):
     The threshold defines then a corridor centered on the centerline,
     For example, requiring info['dist2obst'] >= 0.5 means a corridor large 0.5*max_track_width
     """
-    return lambda state, info: state["dist2obst"] - env_params["reward_params"]["target_dist2obst"]
+    target_dist2obst = env_params["reward_params"]["target_dist2obst"]
+    return ("dist2obst",), lambda dist2obst: dist2obst - target_dist2obst
 
 
 def _build_small_steering(env_params):
@@ -67,30 +86,51 @@ def _build_small_steering(env_params):
     note:   assume actions is a (k,2)-dim array containing the last k actions,
             where the 1st action is steering and 2nd action is speed.
     """
-    return lambda state, info: env_params["reward_params"]["comfort_max_steering"] - abs(state["last_actions"][-1][0])
+    comfort_max_steering = env_params["reward_params"]["comfort_max_steering"]
+    return ("last_steering",), lambda last_steering: comfort_max_steering - abs(last_steering)
 
 
 def _build_min_comfort_dist(env_params):
     """
     encourage dist_ego2npc >= min_comfort_dist
     """
-    return lambda state, info: state["dist_ego2npc"] - env_params["reward_params"]["min_comfort_distance"]
+    min_comfort_distance = env_params["reward_params"]["min_comfort_distance"]
+    return ("dist_ego2npc",), lambda dist_ego2npc: dist_ego2npc - min_comfort_distance
 
 
 def _build_max_comfort_dist(env_params):
     """
     encourage dist_ego2npc <= max_comfort_dist
     """
-    return lambda state, info: env_params["reward_params"]["max_comfort_distance"] - state["dist_ego2npc"]
+    max_comfort_distance = env_params["reward_params"]["max_comfort_distance"]
+    return ("dist_ego2npc",), lambda dist_ego2npc: max_comfort_distance - dist_ego2npc
 
 
 def _build_smooth_controls(env_params):
     """
     encourage (action[-1] - action[-2])**2 <= comfortable_value
     """
-    return lambda state, info: env_params["reward_params"]["comfort_max_norm"] - np.linalg.norm(
-        state["last_actions"][-1] - state["last_actions"][-2])
+    comfort_max_norm = env_params["reward_params"]["comfort_max_norm"]
+    return ("last_actions_delta",), lambda last_actions_delta: comfort_max_norm - last_actions_delta
+
+
+def _last_steering(state, info):
+    # note: last_actions is a (k,2)-dim array of the last k actions, the 1st action is steering
+    return state["last_actions"][-1][0]
+
+
+def _last_actions_delta(state, info):
+    # l2-norm of the difference of the last two actions, without np.linalg.norm overhead on small arrays
+    delta = state["last_actions"][-1] - state["last_actions"][-2]
+    return float(np.sqrt(np.dot(delta, delta)))
+
 
+register_feature("collision", lambda state, info: state["collision"])
+register_feature("safety_distance", lambda state, info: info["safety_distance"])
+register_feature("dist_ego2npc", lambda state, info: state["dist_ego2npc"])
+register_feature("progress", lambda state, info: state["progress"])
+register_feature("last_steering", _last_steering)
+register_feature("last_actions_delta", _last_actions_delta)
 
 register_spec('s1_coll', Operator.ENSURE, _build_no_collision)
 register_spec('s2_safe_dist', Operator.ENSURE, _build_keep_safety_distance)
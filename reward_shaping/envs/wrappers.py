@@ -1,11 +1,14 @@
 import collections
-from typing import Dict, Tuple, Any
+from typing import Dict, Tuple, Any, TYPE_CHECKING
 
 import gym
 from gym.spaces import Box
 from gym.wrappers import LazyFrames
 import numpy as np
-from stable_baselines3.common.type_aliases import GymObs
+
+if TYPE_CHECKING:
+    # avoid importing sb3 (and torch) in the env workers only for type hints
+    from stable_baselines3.common.type_aliases import GymObs
 
 
 class FixResetWrapper(gym.Wrapper):
@@ -166,14 +169,19 @@ class FrameSkip(gym.Wrapper):
     def __init__(self, env: gym.Env, skip: int = 4):
         gym.Wrapper.__init__(self, env)
         self._skip = skip
+        # envs implementing `step_frames` (e.g., racecar) repeat the action internally with minimal work per frame.
+        # note: look it up on the class, to not pick it up through other wrappers (gym.Wrapper forwards attributes)
+        self._fused_step = callable(getattr(type(env), "step_frames", None))
 
-    def step(self, action: int) -> GymObs:
+    def step(self, action: int) -> "GymObs":
         """
         Step the environment with the given action
         Repeat action, sum reward, and max over last observations.
         :param action: the action
         :return: observation, reward, done, information
         """
+        if self._fused_step:
+            return self.env.step_frames(action, n_frames=self._skip)
         total_reward = 0.0
         done = None
         for i in range(self._skip):
@@ -183,7 +191,7 @@ class FrameSkip(gym.Wrapper):
                 break
         return obs, total_reward, done, info
 
-    def reset(self, **kwargs) -> GymObs:
+    def reset(self, **kwargs) -> "GymObs":
         return self.env.reset(**kwargs)
 
 
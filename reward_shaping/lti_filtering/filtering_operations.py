@@ -1,3 +1,6 @@
+from collections import deque
+
+import numpy as np
 from rtamt.operation.abstract_operation import AbstractOperation
 from rtamt.enumerations.comp_oper import StlComparisonOperator
 from rtamt.exception.ltl.exception import LTLException
@@ -12,27 +15,28 @@ class PredicateOperation(AbstractOperation):
         out = [float(o) for o in self.sat(left, right)]
         return out
 
+    def update_sample(self, left, right):
+        """ simple MTL semantics, for a single sample """
+        return float(self.sat_sample(left, right))
+
     def sat(self, left, right):
-        out = []
-        for i in range(len(left)):
-            if self.op.value == StlComparisonOperator.EQ.value:
-                val = left[i] == right[i]
-            elif self.op.value == StlComparisonOperator.NEQ.value:
-                val = left[i] != right[i]
-            elif self.op.value == StlComparisonOperator.GEQ.value:
-                val = left[i] >= right[i]
-            elif self.op.value == StlComparisonOperator.GREATER.value:
-                val = left[i] > right[i]
-            elif self.op.value == StlComparisonOperator.LEQ.value:
-                val = left[i] <= right[i]
-            elif self.op.value == StlComparisonOperator.LESS.value:
-                val = left[i] < right[i]
-            else:
-                raise LTLException('Unknown predicate operation')
-
-            out.append(val)
+        return [self.sat_sample(left[i], right[i]) for i in range(len(left))]
 
-        return out
+    def sat_sample(self, left, right):
+        if self.op.value == StlComparisonOperator.EQ.value:
+            return left == right
+        elif self.op.value == StlComparisonOperator.NEQ.value:
+            return left != right
+        elif self.op.value == StlComparisonOperator.GEQ.value:
+            return left >= right
+        elif self.op.value == StlComparisonOperator.GREATER.value:
+            return left > right
+        elif self.op.value == StlComparisonOperator.LEQ.value:
+            return left <= right
+        elif self.op.value == StlComparisonOperator.LESS.value:
+            return left < right
+        else:
+            raise LTLException('Unknown predicate operation')
 
 
 class EventuallyOperation(AbstractOperation):
@@ -44,3 +48,478 @@ class EventuallyOperation(AbstractOperation):
         out = [k * sum(samples[i:]) for i in range(len(samples))]
         return out
 
+
+def sliding_extremum(samples, bounds, use_min=True, empty=0.0):
+    """
+    Min (or max) of `samples` over the windows [lo, hi] in `bounds`, with both lo and hi non-decreasing.
+    It keeps a monotonic deque of candidate indices (Lemire's algorithm), then it is O(n) over the trace.
+    Empty windows (lo > hi) return `empty`.
+    """
+    out = []
+    window = deque()
+    next_idx = 0
+    for lo, hi in bounds:
+        while next_idx <= hi:
+            new = samples[next_idx]
+            while window and (samples[window[-1]] >= new if use_min else samples[window[-1]] <= new):
+                window.pop()
+            window.append(next_idx)
+            next_idx += 1
+        while window and window[0] < lo:
+            window.popleft()
+        out.append(samples[window[0]] if lo <= hi else empty)
+    return out
+
+
+def prefix_sums(samples):
+    out = [0.0]
+    for sample in samples:
+        out.append(out[-1] + sample)
+    return out
+
+
+class TimedEventuallyOperation(AbstractOperation):
+    """
+    Filtering eventually over [i+begin, i+end]: sum of the samples in the window over the window length,
+    the samples beyond the end of the trace count as zero (as for the unbounded eventually, filtered over n).
+    """
+
+    def __init__(self, begin, end):
+        self.begin = begin
+        self.end = end
+
+    def update(self, samples):
+        n = len(samples)
+        k = 1 / (self.end - self.begin + 1)
+        sums = prefix_sums(samples)
+        return [k * (sums[min(i + self.end, n - 1) + 1] - sums[i + self.begin]) if i + self.begin < n else 0.0
+                for i in range(n)]
+
+
+class TimedAlwaysOperation(AbstractOperation):
+    """ min over [i+begin, i+end], the window is clipped to the end of the trace """
+
+    def __init__(self, begin, end):
+        self.begin = begin
+        self.end = end
+
+    def update(self, samples):
+        n = len(samples)
+        bounds = [(min(i + self.begin, n - 1), min(i + self.end, n - 1)) for i in range(n)]
+        return sliding_extremum(samples, bounds, use_min=True)
+
+
+class OnceOperation(AbstractOperation):
+    """ filtering once, mirror of the filtering eventually: sum of the past samples over the trace length """
+
+    def __init__(self):
+        pass
+
+    def update(self, samples):
+        k = 1 / len(samples)
+        sums = prefix_sums(samples)
+        return [k * sums[i + 1] for i in range(len(samples))]
+
+
+class TimedOnceOperation(AbstractOperation):
+    """ filtering once over [i-end, i-begin], the samples before the beginning of the trace count as zero """
+
+    def __init__(self, begin, end):
+        self.begin = begin
+        self.end = end
+
+    def update(self, samples):
+        k = 1 / (self.end - self.begin + 1)
+        sums = prefix_sums(samples)
+        return [k * (sums[i - self.begin + 1] - sums[max(i - self.end, 0)]) if i - self.begin >= 0 else 0.0
+                for i in range(len(samples))]
+
+
+class HistoricallyOperation(AbstractOperation):
+    def __init__(self):
+        pass
+
+    def update(self, samples):
+        out = []
+        prev = float("inf")
+        for sample in samples:
+            prev = min(prev, sample)
+            out.append(prev)
+        return out
+
+
+class TimedHistoricallyOperation(AbstractOperation):
+    """ min over [i-end, i-begin], the window is clipped to the beginning of the trace """
+
+    def __init__(self, begin, end):
+        self.begin = begin
+        self.end = end
+
+    def update(self, samples):
+        bounds = [(max(i - self.end, 0), max(i - self.begin, 0)) for i in range(len(samples))]
+        return sliding_extremum(samples, bounds, use_min=True)
+
+
+class UntilOperation(AbstractOperation):
+    """ out[i] = max_{j>=i} min(right[j], min_{i<=k<j} left[k]), computed backwards """
+
+    def __init__(self):
+        pass
+
+    def update(self, left, right):
+        out = [0.0] * len(left)
+        prev = - float("inf")
+        for i in reversed(range(len(left))):
+            prev = max(right[i], min(left[i], prev))
+            out[i] = prev
+        return out
+
+
+class TimedUntilOperation(AbstractOperation):
+    """
+    out[i] = max_{j in [i+begin, i+end]} min(right[j], min_{i<=k<j} left[k]), with the window clipped to the end.
+    It is decomposed in O(n) operations, for m = i+begin (clipped):
+        out[i] = min(min_{i<=k<m} left[k], until_[0,end-begin](m)),
+        until_[0,c](m) = min(until(m), max_{m<=j<=m+c} right[j])
+    """
+
+    def __init__(self, begin, end):
+        self.begin = begin
+        self.end = end
+
+    def update(self, left, right):
+        n = len(left)
+        until = UntilOperation().update(left, right)
+        width = self.end - self.begin
+        right_max = sliding_extremum(right, [(m, min(m + width, n - 1)) for m in range(n)], use_min=False)
+        starts = [min(i + self.begin, n - 1) for i in range(n)]
+        left_min = sliding_extremum(left, [(i, m - 1) for i, m in enumerate(starts)], use_min=True,
+                                    empty=float("inf"))
+        return [min(left_min[i], until[m], right_max[m]) for i, m in enumerate(starts)]
+
+
+class SinceOperation(AbstractOperation):
+    """ out[i] = max_{j<=i} min(right[j], min_{j<k<=i} left[k]), the time-reversed until """
+
+    def __init__(self):
+        pass
+
+    def update(self, left, right):
+        return UntilOperation().update(list(left)[::-1], list(right)[::-1])[::-1]
+
+
+class TimedSinceOperation(AbstractOperation):
+    """ since with j in [i-end, i-begin] clipped to the beginning of the trace, the time-reversed timed until """
+
+    def __init__(self, begin, end):
+        self.begin = begin
+        self.end = end
+
+    def update(self, left, right):
+        return TimedUntilOperation(self.begin, self.end).update(list(left)[::-1], list(right)[::-1])[::-1]
+
+
+class PreviousOperation(AbstractOperation):
+    """ out[i] = samples[i-1], the first sample is repeated """
+
+    def __init__(self):
+        pass
+
+    def update(self, samples):
+        samples = list(samples)
+        return samples[:1] + samples[:-1]
+
+
+class NextOperation(AbstractOperation):
+    """ out[i] = samples[i+1], the last sample is repeated """
+
+    def __init__(self):
+        pass
+
+    def update(self, samples):
+        samples = list(samples)
+        return samples[1:] + samples[-1:]
+
+
+class RiseOperation(AbstractOperation):
+    """ out[i] = min(samples[i], not samples[i-1]) """
+
+    def __init__(self):
+        pass
+
+    def update(self, samples):
+        previous = PreviousOperation().update(samples)
+        return [min(s, -p) for s, p in zip(samples, previous)]
+
+
+class FallOperation(AbstractOperation):
+    """ out[i] = min(not samples[i], samples[i-1]) """
+
+    def __init__(self):
+        pass
+
+    def update(self, samples):
+        previous = PreviousOperation().update(samples)
+        return [min(-s, p) for s, p in zip(samples, previous)]
+
+
+class OnlineTemporalOperation(AbstractOperation):
+    """
+    Online counterpart of the filtering operators, evaluated on the stream of samples pushed since the last reset
+    (only the last `window_len` samples, if given).
+
+    Each `update` consumes one sample and returns the operation itself, which exposes:
+        - `value`: the output at the first position of the stream, as the offline monitor `[0]`,
+        - `positions_sum`: the sum of the outputs over all the positions, required by an enclosing eventually,
+        - `n_samples`: the number of positions in the stream.
+    """
+
+    def __init__(self, window_len=None):
+        self.window_len = window_len
+
+    def reset(self):
+        pass
+
+    def get_state(self):
+        """ snapshot of the buffers (numpy arrays and floats), the operands are set again at the next update """
+        return {}
+
+    def set_state(self, state):
+        pass
+
+    def _is_full(self, n_samples):
+        return self.window_len is not None and n_samples >= self.window_len
+
+    @property
+    def value(self):
+        raise NotImplementedError
+
+    @property
+    def positions_sum(self):
+        raise LTLException(f'{type(self).__name__} cannot be nested in a temporal operator in online monitoring')
+
+    @property
+    def n_samples(self):
+        raise NotImplementedError
+
+
+class OnlinePositionZeroOperation(OnlineTemporalOperation):
+    """ stream of a non-temporal sub-formula, its value is the one of the first sample """
+
+    def __init__(self, window_len=None):
+        super(OnlinePositionZeroOperation, self).__init__(window_len)
+        self.reset()
+
+    def reset(self):
+        self.samples = deque()
+        self.sum = 0.0
+
+    def get_state(self):
+        return {"samples": np.array(self.samples, dtype=float), "sum": self.sum}
+
+    def set_state(self, state):
+        self.samples, self.sum = deque(state["samples"].tolist()), state["sum"]
+
+    def update(self, sample):
+        if self._is_full(len(self.samples)):
+            self.sum -= self.samples.popleft()
+        self.samples.append(sample)
+        self.sum += sample
+        return self
+
+    @property
+    def value(self):
+        return self.samples[0]
+
+    @property
+    def positions_sum(self):
+        return self.sum
+
+    @property
+    def n_samples(self):
+        return len(self.samples)
+
+
+class OnlineEventuallyOperation(OnlineTemporalOperation):
+    """
+    Filtering eventually: the output at position i is the mean of the sub-formula over the positions j>=i.
+    Then, the value at the first position is a running mean, and the sum over positions is sum_j (j+1) * x_j / n.
+    If the sub-formula is temporal, its own `positions_sum` is used and the window is handled by the sub-formula.
+    """
+
+    def __init__(self, window_len=None):
+        super(OnlineEventuallyOperation, self).__init__(window_len)
+        self.reset()
+
+    def reset(self):
+        self.samples = deque()
+        self.sum = 0.0
+        self.weighted_sum = 0.0
+        self.child = None
+
+    def get_state(self):
+        return {"samples": np.array(self.samples, dtype=float), "sum": self.sum, "weighted_sum": self.weighted_sum}
+
+    def set_state(self, state):
+        self.samples = deque(state["samples"].tolist())
+        self.sum, self.weighted_sum = state["sum"], state["weighted_sum"]
+
+    def update(self, sample):
+        if isinstance(sample, OnlineTemporalOperation):
+            self.child = sample
+            return self
+        if self._is_full(len(self.samples)):
+            # shifting all the positions by one, each weight decreases by 1
+            self.weighted_sum -= self.sum
+            self.sum -= self.samples.popleft()
+        self.samples.append(sample)
+        self.sum += sample
+        self.weighted_sum += len(self.samples) * sample
+        return self
+
+    @property
+    def value(self):
+        if self.child is not None:
+            return self.child.positions_sum / self.child.n_samples
+        return self.sum / len(self.samples)
+
+    @property
+    def positions_sum(self):
+        if self.child is not None:
+            return super(OnlineEventuallyOperation, self).positions_sum
+        return self.weighted_sum / len(self.samples)
+
+    @property
+    def n_samples(self):
+        return self.child.n_samples if self.child is not None else len(self.samples)
+
+
+class OnlineAlwaysOperation(OnlineTemporalOperation):
+    """
+    Always: the output at position i is the min of the sub-formula over the positions j>=i.
+    The suffix minima are non-decreasing with i, so they are stored as a monotonic deque of [value, nr positions]:
+    a new sample merges all the trailing groups with larger value, the oldest position is dropped from the front.
+    Each sample is pushed and popped at most once, then the update is constant time in amortized sense.
+    """
+
+    def __init__(self, window_len=None):
+        super(OnlineAlwaysOperation, self).__init__(window_len)
+        self.reset()
+
+    def reset(self):
+        self.groups = deque()
+        self.sum = 0.0
+        self.count = 0
+
+    def get_state(self):
+        return {"groups": np.array(self.groups, dtype=float).reshape(-1, 2), "sum": self.sum, "count": self.count}
+
+    def set_state(self, state):
+        self.groups = deque([value, int(n)] for value, n in state["groups"].tolist())
+        self.sum, self.count = state["sum"], state["count"]
+
+    def update(self, sample):
+        if self._is_full(self.count):
+            oldest = self.groups[0]
+            oldest[1] -= 1
+            self.sum -= oldest[0]
+            self.count -= 1
+            if oldest[1] == 0:
+                self.groups.popleft()
+        count = 1
+        while self.groups and self.groups[-1][0] >= sample:
+            value, n = self.groups.pop()
+            self.sum -= value * n
+            count += n
+        self.groups.append([sample, count])
+        self.sum += sample * count
+        self.count += 1
+        return self
+
+    @property
+    def value(self):
+        return self.groups[0][0]
+
+    @property
+    def positions_sum(self):
+        return self.sum
+
+    @property
+    def n_samples(self):
+        return self.count
+
+
+class OnlineNotOperation(OnlineTemporalOperation):
+    """ negation of a temporal sub-formula """
+
+    def __init__(self):
+        super(OnlineNotOperation, self).__init__()
+        self.child = None
+
+    def reset(self):
+        self.child = None
+
+    def update(self, sample):
+        self.child = sample
+        return self
+
+    @property
+    def value(self):
+        return - self.child.value
+
+    @property
+    def positions_sum(self):
+        return - self.child.positions_sum
+
+    @property
+    def n_samples(self):
+        return self.child.n_samples
+
+
+class OnlineAndOperation(OnlineTemporalOperation):
+    """
+    Conjunction at the first position, where at least one operand is temporal.
+    The non-temporal operands are lifted to streams, to retain their value at the first position.
+    """
+
+    def __init__(self, window_len=None):
+        super(OnlineAndOperation, self).__init__(window_len)
+        self.lifted = [OnlinePositionZeroOperation(window_len), OnlinePositionZeroOperation(window_len)]
+        self.operands = [None, None]
+
+    def reset(self):
+        for lifted in self.lifted:
+            lifted.reset()
+        self.operands = [None, None]
+
+    def get_state(self):
+        return {"lifted": [lifted.get_state() for lifted in self.lifted]}
+
+    def set_state(self, state):
+        for lifted, lifted_state in zip(self.lifted, state["lifted"]):
+            lifted.set_state(lifted_state)
+
+    def update(self, left, right):
+        for i, sample in enumerate([left, right]):
+            if not isinstance(sample, OnlineTemporalOperation):
+                sample = self.lifted[i].update(sample)
+            self.operands[i] = sample
+        return self
+
+    def combine(self, left, right):
+        return min(left, right)
+
+    @property
+    def value(self):
+        return self.combine(self.operands[0].value, self.operands[1].value)
+
+    @property
+    def n_samples(self):
+        return self.operands[0].n_samples
+
+
+class OnlineOrOperation(OnlineAndOperation):
+    """ disjunction at the first position, where at least one operand is temporal """
+
+    def combine(self, left, right):
+        return max(left, right)
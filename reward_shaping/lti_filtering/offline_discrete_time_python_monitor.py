@@ -13,7 +13,10 @@ from rtamt.operation.arithmetic.discrete_time.offline.pow_operation import PowOp
 from rtamt.operation.stl.discrete_time.offline.not_operation import NotOperation
 from rtamt.operation.stl.discrete_time.offline.always_operation import AlwaysOperation
 # custom re-implemented operators
-from reward_shaping.lti_filtering.filtering_operations import PredicateOperation, EventuallyOperation
+from reward_shaping.lti_filtering.filtering_operations import PredicateOperation, EventuallyOperation, \
+    TimedEventuallyOperation, TimedAlwaysOperation, OnceOperation, TimedOnceOperation, HistoricallyOperation, \
+    TimedHistoricallyOperation, UntilOperation, TimedUntilOperation, SinceOperation, TimedSinceOperation, \
+    PreviousOperation, NextOperation, RiseOperation, FallOperation
 
 
 class MTLFilteringOfflineDiscreteTimePythonMonitor(STLVisitor):
@@ -24,6 +27,14 @@ class MTLFilteringOfflineDiscreteTimePythonMonitor(STLVisitor):
         self.visit(node, [])
         return self.node_monitor_dict
 
+    @staticmethod
+    def _interval(node):
+        """ bounds of a timed operator, in discrete time they are expressed in number of samples """
+        begin, end = int(node.begin), int(node.end)
+        if begin < 0 or end < begin:
+            raise ValueError(f"invalid interval [{begin}, {end}] in {node.name}")
+        return begin, end
+
     def visitPredicate(self, node, args):
         monitor = PredicateOperation(node.operator)
         self.node_monitor_dict[node.name] = monitor
@@ -125,22 +136,42 @@ class MTLFilteringOfflineDiscreteTimePythonMonitor(STLVisitor):
         self.visit(node.children[0], args)
 
     def visitUntil(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = UntilOperation()
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
+        self.visit(node.children[1], args)
 
     def visitOnce(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = OnceOperation()
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
 
     def visitHistorically(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = HistoricallyOperation()
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
 
     def visitSince(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = SinceOperation()
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
+        self.visit(node.children[1], args)
 
     def visitRise(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = RiseOperation()
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
 
     def visitFall(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = FallOperation()
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
 
     def visitConstant(self, node, args):
         # what is this?
@@ -148,31 +179,57 @@ class MTLFilteringOfflineDiscreteTimePythonMonitor(STLVisitor):
         self.node_monitor_dict[node.name] = monitor
 
     def visitPrevious(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = PreviousOperation()
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
 
     def visitNext(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = NextOperation()
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
 
     def visitTimedPrecedes(self, node, args):
         raise NotImplementedError("operator not implemented")
 
     def visitTimedOnce(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = TimedOnceOperation(*self._interval(node))
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
 
     def visitTimedHistorically(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = TimedHistoricallyOperation(*self._interval(node))
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
 
     def visitTimedSince(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = TimedSinceOperation(*self._interval(node))
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
+        self.visit(node.children[1], args)
 
     def visitTimedAlways(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = TimedAlwaysOperation(*self._interval(node))
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
 
     def visitTimedEventually(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = TimedEventuallyOperation(*self._interval(node))
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
 
     def visitTimedUntil(self, node, args):
-        raise NotImplementedError("operator not implemented")
+        monitor = TimedUntilOperation(*self._interval(node))
+        self.node_monitor_dict[node.name] = monitor
+
+        self.visit(node.children[0], args)
+        self.visit(node.children[1], args)
 
     def visitDefault(self, node, args):
         pass
@@ -0,0 +1,156 @@
+from rtamt.exception.ltl.exception import LTLException
+from rtamt.spec.stl.discrete_time.visitor import STLVisitor
+
+from reward_shaping.lti_filtering.filtering_operations import PredicateOperation, OnlineEventuallyOperation, \
+    OnlineAlwaysOperation, OnlineNotOperation, OnlineAndOperation, OnlineOrOperation
+
+
+class MTLFilteringOnlineDiscreteTimePythonMonitor(STLVisitor):
+    """
+    Generate the online operations of a spec.
+    Non-temporal sub-formulas (predicates, arithmetic, boolean operators) are stateless and computed per sample,
+    only the nodes having a temporal operand need a stateful operation.
+
+    Each visit returns a pair (is temporal, supports sum over positions) for the visited sub-formula,
+    used to reject the nesting which cannot be updated in constant time (e.g., `always(eventually(...))`).
+    """
+
+    def __init__(self, window_len=None):
+        self.window_len = window_len
+        self.node_monitor_dict = dict()
+
+    def generate(self, node):
+        self.visit(node, [])
+        return self.node_monitor_dict
+
+    def _visit_non_temporal(self, node, args):
+        for child in node.children:
+            is_temporal, _ = self.visit(child, args)
+            if is_temporal:
+                raise LTLException(f'online monitoring: temporal operand not supported in {node.name}')
+        return False, True
+
+    def visitPredicate(self, node, args):
+        monitor = PredicateOperation(node.operator)
+        self.node_monitor_dict[node.name] = monitor
+        return self._visit_non_temporal(node, args)
+
+    def visitVariable(self, node, args):
+        return False, True
+
+    def visitConstant(self, node, args):
+        return False, True
+
+    def visitAbs(self, node, args):
+        return self._visit_non_temporal(node, args)
+
+    def visitSqrt(self, node, args):
+        return self._visit_non_temporal(node, args)
+
+    def visitExp(self, node, args):
+        return self._visit_non_temporal(node, args)
+
+    def visitPow(self, node, args):
+        return self._visit_non_temporal(node, args)
+
+    def visitAddition(self, node, args):
+        return self._visit_non_temporal(node, args)
+
+    def visitSubtraction(self, node, args):
+        return self._visit_non_temporal(node, args)
+
+    def visitMultiplication(self, node, args):
+        return self._visit_non_temporal(node, args)
+
+    def visitDivision(self, node, args):
+        return self._visit_non_temporal(node, args)
+
+    def visitNot(self, node, args):
+        is_temporal, has_sum = self.visit(node.children[0], args)
+        if is_temporal:
+            self.node_monitor_dict[node.name] = OnlineNotOperation()
+        return is_temporal, has_sum
+
+    def visitAnd(self, node, args):
+        return self._visit_boolean(node, args, OnlineAndOperation)
+
+    def visitOr(self, node, args):
+        return self._visit_boolean(node, args, OnlineOrOperation)
+
+    def _visit_boolean(self, node, args, operation_cls):
+        is_temporal = any([self.visit(child, args)[0] for child in node.children])
+        if not is_temporal:
+            return False, True
+        self.node_monitor_dict[node.name] = operation_cls(self.window_len)
+        return True, False
+
+    def visitImplies(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitIff(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitXor(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitEventually(self, node, args):
+        is_temporal, has_sum = self.visit(node.children[0], args)
+        if is_temporal and not has_sum:
+            raise LTLException(f'online monitoring: temporal operand not supported in {node.name}')
+        self.node_monitor_dict[node.name] = OnlineEventuallyOperation(self.window_len)
+        return True, not is_temporal
+
+    def visitAlways(self, node, args):
+        is_temporal, _ = self.visit(node.children[0], args)
+        if is_temporal:
+            raise LTLException(f'online monitoring: temporal operand not supported in {node.name}')
+        self.node_monitor_dict[node.name] = OnlineAlwaysOperation(self.window_len)
+        return True, True
+
+    def visitUntil(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitOnce(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitHistorically(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitSince(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitRise(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitFall(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitPrevious(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitNext(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitTimedPrecedes(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitTimedOnce(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitTimedHistorically(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitTimedSince(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitTimedAlways(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitTimedEventually(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitTimedUntil(self, node, args):
+        raise NotImplementedError("operator not implemented")
+
+    def visitDefault(self, node, args):
+        return False, True
@@ -0,0 +1,128 @@
+import math
+import operator
+
+from rtamt.enumerations.options import *
+from rtamt.spec.stl.discrete_time.visitor import STLVisitor
+
+from reward_shaping.lti_filtering.filtering_operations import OnlineTemporalOperation, OnlinePositionZeroOperation
+from reward_shaping.lti_filtering.online_discrete_time_python_monitor import \
+    MTLFilteringOnlineDiscreteTimePythonMonitor
+
+
+class MTLFilteringOnlineEvaluator(STLVisitor):
+    """
+    Evaluate the spec one sample at a time, the output is the filtering robustness at the first position
+    of the stream (i.e., the same of the offline evaluation at index 0 on the samples pushed since the last reset).
+
+    Non-temporal nodes return the value of the current sample, temporal nodes return their online operation.
+    """
+
+    def __init__(self, spec, window_len=None):
+        self.spec = spec
+
+        assert self.spec.language == Language.PYTHON, f"not implemented {self.spec.language}"
+        assert self.spec.time_interpretation == TimeInterpretation.DISCRETE, f"not implemented {self.spec.time_interpretation}"
+        generator = MTLFilteringOnlineDiscreteTimePythonMonitor(window_len)
+        self.node_monitor_dict = generator.generate(self.spec.top)
+        # lift a non-temporal spec to a stream, to return its value at the first position
+        self.output_monitor = OnlinePositionZeroOperation(window_len)
+        self._samples = dict()
+
+    def reset(self):
+        for monitor in self.node_monitor_dict.values():
+            monitor.reset()
+        self.output_monitor.reset()
+
+    def get_state(self):
+        """ snapshot of the buffers of the temporal operations, by node name """
+        state = {name: monitor.get_state() for name, monitor in self.node_monitor_dict.items()
+                 if isinstance(monitor, OnlineTemporalOperation)}
+        state[None] = self.output_monitor.get_state()
+        return state
+
+    def set_state(self, state):
+        for name, monitor_state in state.items():
+            monitor = self.output_monitor if name is None else self.node_monitor_dict[name]
+            monitor.set_state(monitor_state)
+
+    def evaluate(self, node, args):
+        self._samples = dict()
+        sample = self.visit(node, args)
+        if not isinstance(sample, OnlineTemporalOperation):
+            sample = self.output_monitor.update(sample)
+        return sample.value
+
+    def visit(self, node, args):
+        # sub-formulas with the same name share the monitor, then they must be updated once per sample
+        if node.name not in self._samples:
+            self._samples[node.name] = super(MTLFilteringOnlineEvaluator, self).visit(node, args)
+        return self._samples[node.name]
+
+    def visitPredicate(self, node, args):
+        in_sample_1 = self.visit(node.children[0], args)
+        in_sample_2 = self.visit(node.children[1], args)
+        return self.node_monitor_dict[node.name].update_sample(in_sample_1, in_sample_2)
+
+    def visitVariable(self, node, args):
+        var = self.spec.var_object_dict[node.var]
+        if node.field:
+            return operator.attrgetter(node.field)(var)
+        return var
+
+    def visitConstant(self, node, args):
+        return node.val
+
+    def visitAbs(self, node, args):
+        return abs(self.visit(node.children[0], args))
+
+    def visitSqrt(self, node, args):
+        return math.sqrt(self.visit(node.children[0], args))
+
+    def visitExp(self, node, args):
+        return math.exp(self.visit(node.children[0], args))
+
+    def visitPow(self, node, args):
+        return self.visit(node.children[0], args) ** self.visit(node.children[1], args)
+
+    def visitAddition(self, node, args):
+        return self.visit(node.children[0], args) + self.visit(node.children[1], args)
+
+    def visitSubtraction(self, node, args):
+        return self.visit(node.children[0], args) - self.visit(node.children[1], args)
+
+    def visitMultiplication(self, node, args):
+        return self.visit(node.children[0], args) * self.visit(node.children[1], args)
+
+    def visitDivision(self, node, args):
+        return self.visit(node.children[0], args) / self.visit(node.children[1], args)
+
+    def visitNot(self, node, args):
+        in_sample = self.visit(node.children[0], args)
+        if node.name in self.node_monitor_dict:
+            return self.node_monitor_dict[node.name].update(in_sample)
+        return - in_sample
+
+    def visitAnd(self, node, args):
+        in_sample_1 = self.visit(node.children[0], args)
+        in_sample_2 = self.visit(node.children[1], args)
+        if node.name in self.node_monitor_dict:
+            return self.node_monitor_dict[node.name].update(in_sample_1, in_sample_2)
+        return min(in_sample_1, in_sample_2)
+
+    def visitOr(self, node, args):
+        in_sample_1 = self.visit(node.children[0], args)
+        in_sample_2 = self.visit(node.children[1], args)
+        if node.name in self.node_monitor_dict:
+            return self.node_monitor_dict[node.name].update(in_sample_1, in_sample_2)
+        return max(in_sample_1, in_sample_2)
+
+    def visitEventually(self, node, args):
+        in_sample = self.visit(node.children[0], args)
+        return self.node_monitor_dict[node.name].update(in_sample)
+
+    def visitAlways(self, node, args):
+        in_sample = self.visit(node.children[0], args)
+        return self.node_monitor_dict[node.name].update(in_sample)
+
+    def visitDefault(self, node, args):
+        return None
@@ -1,4 +1,5 @@
-from antlr4 import *
+import numpy as np
+from antlr4 import CommonTokenStream
 from antlr4.InputStream import InputStream
 
 from rtamt.spec.ltl.discrete_time.specification import LTLDiscreteTimeSpecification
@@ -8,6 +9,7 @@ from rtamt.parser.stl.StlParser import StlParser
 from rtamt.spec.stl.discrete_time.specification_parser import STLSpecificationParser
 
 from rtamt.parser.stl.error.parser_error_listener import STLParserErrorListener
+
 from rtamt.exception.stl.exception import STLParseException
 
 from rtamt.spec.stl.discrete_time.pastifier import STLPastifier
@@ -17,6 +19,7 @@ from rtamt.enumerations.options import *
 from rtamt.exception.stl.exception import STLException
 
 from reward_shaping.lti_filtering.offline_evaluator import MTLFilteringOfflineEvaluator
+from reward_shaping.lti_filtering.online_evaluator import MTLFilteringOnlineEvaluator
 
 
 class MTLDiscreteTimeSpecification(LTLDiscreteTimeSpecification):
@@ -37,10 +40,13 @@ class MTLDiscreteTimeSpecification(LTLDiscreteTimeSpecification):
         top : AbstractNode - pointer to the specification parse tree
 
         online_evaluator : AbstractEvaluator - pointer to the object that implements the monitoring algorithm
+        online_window : int - nr of most recent samples monitored online (default = None, all the samples since reset)
 
         update_counter : int
         previous_time : float
         sampling_violation_counter : int
+        sampling_violations : list(int) - indices of the samples violating the sampling period in the last evaluation
+        check_sampling : bool - validate the inputs and the sampling period (default = True)
 
     """
 
@@ -61,11 +67,15 @@ class MTLDiscreteTimeSpecification(LTLDiscreteTimeSpecification):
         self.update_counter = int(0)
         self.previous_time = float(0.0)
         self.sampling_violation_counter = int(0)
+        self.sampling_violations = []
+        self.check_sampling = True
 
         self.normalize = float(1.0)
 
         self.reseter = STLReset()
 
+        self.online_window = None
+
     # Parses the MTL property
     # string can be either file path containing the STL property
     # or the textual property itself
@@ -104,7 +114,34 @@ class MTLDiscreteTimeSpecification(LTLDiscreteTimeSpecification):
             self.var_subspec_dict[key] = node
 
     def update(self, timestamp, list_inputs):
-        raise NotImplemented("update method not implemented, because online monitoring is not implemented")
+        """
+        Push one sample and return the robustness at the first position of the monitored stream,
+        that is the same of `evaluate(...)[0][1]` on the samples pushed since the last reset
+        (or on the last `online_window` samples).
+        """
+        if self.var_subspec_dict:
+            raise STLException('update: modular sub-specifications are not supported online')
+
+        if self.online_evaluator is None:
+            # Initialize the online_evaluator
+            self.online_evaluator = MTLFilteringOnlineEvaluator(self, window_len=self.online_window)
+
+        # Check if the difference with the previous timestamp is between the accepted tolerance
+        if self.check_sampling and self.update_counter > 0:
+            duration = (timestamp - self.previous_time) * self.normalize
+            tolerance = self.sampling_period * self.sampling_tolerance
+            if duration < self.sampling_period - tolerance or duration > self.sampling_period + tolerance:
+                self.sampling_violation_counter = self.sampling_violation_counter + 1
+        self.update_counter = self.update_counter + 1
+        self.previous_time = timestamp
+
+        # update the value of every input variable
+        for var_name, var_value in list_inputs:
+            self.var_object_dict[var_name] = var_value
+
+        out = self.online_evaluator.evaluate(self.top, [])
+
+        return out
 
     def evaluate(self, *args, **kargs):
         if len(args) != 1:
@@ -112,14 +149,13 @@ class MTLDiscreteTimeSpecification(LTLDiscreteTimeSpecification):
 
         dataset = args[0]
 
-        if not dataset['time']:
+        if 'time' not in dataset or not dataset['time']:
             raise STLException('evaluate: The input does not contain the time field')
 
         length = len(dataset['time'])
 
-        for key in dataset:
-            if len(dataset[key]) != length:
-                raise STLException('evaluate: The input ' + key + ' does not have the same number of samples as time')
+        if self.check_sampling:
+            self.validate_dataset(dataset)
 
         if self.offline_evaluator is None:
             # Initialize the offline_evaluator
@@ -127,15 +163,6 @@ class MTLDiscreteTimeSpecification(LTLDiscreteTimeSpecification):
             self.top.accept(self.offline_evaluator)
             self.reseter.node_monitor_dict = self.offline_evaluator.node_monitor_dict
 
-        # Check if the difference between two consecutive timestamps is between
-        # the accepted tolerance - if not, increase the violation counter
-        ts = dataset['time']
-        for i in range(len(ts) - 1):
-            duration = (ts[i + 1] - ts[i]) * self.normalize
-        tolerance = self.sampling_period * self.sampling_tolerance
-        if duration < self.sampling_period - tolerance or duration > self.sampling_period + tolerance:
-            self.sampling_violation_counter = self.sampling_violation_counter + 1
-
         # update the value of every input variable
         for key in dataset:
             if key != 'time':
@@ -150,13 +177,66 @@ class MTLDiscreteTimeSpecification(LTLDiscreteTimeSpecification):
         # The evaluation done wrt the discrete counter (logical time)
         out = self.offline_evaluator.evaluate(self.top, [length])
 
-        out_t = [[a[0], a[1]] for a in zip(ts, out)]
+        out_t = [[a[0], a[1]] for a in zip(dataset['time'], out)]
         out = out_t
 
         return out
 
+    def validate_dataset(self, dataset):
+        """
+        Check that all the inputs have the same number of samples as time, and that the difference between
+        consecutive timestamps is within the sampling tolerance. Each violation increases the violation counter,
+        their indices are stored in `sampling_violations`.
+        """
+        length = len(dataset['time'])
+        for key in dataset:
+            if len(dataset[key]) != length:
+                raise STLException('evaluate: The input ' + key + ' does not have the same number of samples as time')
+
+        durations = np.diff(np.asarray(dataset['time'], dtype=float)) * self.normalize
+        tolerance = self.sampling_period * self.sampling_tolerance
+        violations = np.flatnonzero((durations < self.sampling_period - tolerance) |
+                                    (durations > self.sampling_period + tolerance))
+        self.sampling_violations = (violations + 1).tolist()
+        self.sampling_violation_counter = self.sampling_violation_counter + len(violations)
+
+    def set_sampling_check(self, enabled=True):
+        """ disable the validation of inputs and sampling period for trusted traces (e.g., integer steps) """
+        self.check_sampling = enabled
+
     def reset(self):
-        raise NotImplemented("reset method not implemented, because online monitoring is not implemented")
+        self.update_counter = int(0)
+        self.previous_time = float(0.0)
+        if self.online_evaluator is not None:
+            self.online_evaluator.reset()
+
+    def get_online_state(self):
+        """ snapshot of the online monitoring (sample counters and buffers of the temporal operations) """
+        if self.online_evaluator is None:
+            self.online_evaluator = MTLFilteringOnlineEvaluator(self, window_len=self.online_window)
+        return {"update_counter": self.update_counter, "previous_time": self.previous_time,
+                "sampling_violation_counter": self.sampling_violation_counter,
+                "evaluator": self.online_evaluator.get_state()}
+
+    def set_online_state(self, state):
+        """ restore a snapshot of `get_online_state`, without pushing the samples again """
+        if self.online_evaluator is None:
+            self.online_evaluator = MTLFilteringOnlineEvaluator(self, window_len=self.online_window)
+        self.update_counter, self.previous_time = state["update_counter"], state["previous_time"]
+        self.sampling_violation_counter = state["sampling_violation_counter"]
+        self.online_evaluator.set_state(state["evaluator"])
+
+    def set_online_window(self, window_len=None):
+        """
+        Monitor online only the last `window_len` samples (None for all the samples since the last reset).
+        If the spec is already parsed, the online evaluator is created here to report unsupported operators early.
+        """
+        if window_len is not None and window_len < 1:
+            raise STLException('The online window must be a positive number of samples')
+        self.online_window = window_len
+        self.online_evaluator = None
+        if self.top is not None:
+            self.online_evaluator = MTLFilteringOnlineEvaluator(self, window_len=self.online_window)
 
     @property
     def sampling_period(self):
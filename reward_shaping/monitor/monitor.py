@@ -1,182 +1,166 @@
-from abc import abstractmethod, ABC
+import os
+from abc import ABC
+from types import MappingProxyType
 from typing import Callable
 
 import numpy as np
 
 from reward_shaping.monitor.formula import Operator
 
-""" 
+"""
 Conventions:
     - 2-states automaton: state 0 is unsat (safety violation, target not reached, ..), 1 is sat (safe, target reached)
+    - transition tables are indexed by [state id][p(s)>=0] and give (next state id, counter update)
 """
 
-class GenericMonitor(ABC):
-    """ monitor implemented as a Moore machine with states (id,reg) where id is the id state,
-    reg is a shared register with quantitative sat measure """
+# consistency checks at each step, disabled by default because monitors run at each env step
+DEBUG = os.environ.get("REWARD_SHAPING_DEBUG", "0") == "1"
 
-    @abstractmethod
-    def __init__(self, predicate: Callable):
-        self._p = predicate
-        self._terminal_ids = None
-        self._counter = None
-        self._state_id = None
-        self._states = None
+# counter updates
+KEEP, INCREMENT, RESET = 0, 1, 2
 
-    @abstractmethod
-    def step(self, state):
-        pass
+# read-only default info, to avoid a mutable default argument
+_EMPTY_INFO = MappingProxyType({})
 
-    @abstractmethod
-    def reset(self):
-        pass
 
-    @property
-    def n_states(self):
-        return len(self._states)
+class GenericMonitor(ABC):
+    """ monitor implemented as a Moore machine with states (id,reg) where id is the id state,
+    reg is a shared register with quantitative sat measure
 
-    def is_sat(self) -> bool:
-        return self._state_id in self._terminal_ids
+    The automaton is defined at class level by
+        - STATES: names of the states, indexed by state id
+        - TERMINAL_IDS: ids of the accepting states
+        - INITIAL_ID: id of the initial state
+        - TRANSITIONS: (next state id, counter update) indexed by [state id][int(p(s)>=0)]
+    """
+    __slots__ = ("_p", "_state_id", "_counter")
 
-    def get_counter(self) -> bool:
-        return self._counter
+    STATES = ()
+    TERMINAL_IDS = frozenset()
+    INITIAL_ID = 0
+    TRANSITIONS = ()
 
-
-class EnsureMonitor(GenericMonitor):
     def __init__(self, predicate: Callable):
         self._p = predicate
-        self._states = {0: "unsafe", 1: "safe"}
-        self._terminal_ids = {1}
         self._state_id = None
         self._counter = None
         self.reset()
 
     def reset(self):
-        self._state_id = 1
+        self._state_id = self.INITIAL_ID
         self._counter = 0
 
-    def step(self, state, info={}):
-        """
-        Transition definition (S x B -> S x R):
-            state: (1, k), p(s)>0   -> (1, k++)
-            state: (1, k), p(s)<0   -> (0, k)
-            state: (0, k), *        -> (0, k)
-         """
-        current_rob = self._p(state, info)
-        # transition
-        if self._state_id == 1 and current_rob < 0:
-            self._state_id = 0
-        # update counter
-        if self._state_id == 1 and current_rob >= 0:
+    def step(self, state, info=None):
+        current_rob = self._p(state, _EMPTY_INFO if info is None else info)
+        # note: numpy booleans cannot index a tuple
+        self._state_id, update = self.TRANSITIONS[self._state_id][1 if current_rob >= 0 else 0]
+        if update == INCREMENT:
             self._counter += 1
-        assert self._state_id in self._states, f"unexpected state {self._state_id} in a ensure automaton"
+        elif update == RESET:
+            self._counter = 0
+        if DEBUG:
+            assert 0 <= self._state_id < len(self.STATES), \
+                f"unexpected state {self._state_id} in a {type(self).__name__}"
         return self._state_id, self._counter
 
+    @property
+    def n_states(self):
+        return len(self.STATES)
 
-class AchieveMonitor(GenericMonitor):
-    def __init__(self, predicate: Callable):
-        self._p = predicate
-        self._states = {0: "not_achieved", 1: "achieved"}
-        self._terminal_ids = {1}
-        self._state_id = None
-        self._counter = None
-        self.reset()
+    def is_sat(self) -> bool:
+        return self._state_id in self.TERMINAL_IDS
 
-    def reset(self):
-        self._state_id = 0
-        self._counter = 0
+    def get_counter(self) -> bool:
+        return self._counter
 
-    def step(self, state, info={}):
-        """
-        Transition definition (S x B -> S x R):
-            state: (0, k), p(s)>0   -> (1, k++)
-            state: (0, k), p(s)<0   -> (0, k)
-            state: (1, k), p(s)>0   -> (1, k++)
-            state: (1, k), p(s)<0   -> (1, k)
-         """
-        current_rob = self._p(state, info)
-        # transition
-        if self._state_id == 0 and current_rob >= 0:
-            self._state_id = 1
-        # update counter
-        if current_rob >= 0:
-            self._counter += 1
-        assert self._state_id in self._states, f"unexpected state {self._state_id} in a achieve automaton"
-        return self._state_id, self._counter
+    def get_state(self) -> np.ndarray:
+        """ compact snapshot of the automaton: (state id, counter) """
+        return np.array([self._state_id, self._counter], dtype=np.int64)
 
+    def set_state(self, state: np.ndarray):
+        assert 0 <= int(state[0]) < len(self.STATES), f"unexpected state {state[0]} in a {type(self).__name__}"
+        self._state_id, self._counter = int(state[0]), int(state[1])
 
-class ConquerMonitor(GenericMonitor):
-    def __init__(self, predicate: Callable):
-        self._p = predicate
-        self._states = {0: "not_achieved", 1: "achieved", 2: "conquer"}
-        self._terminal_ids = {2}
-        self._state_id = None
-        self._counter = None
-        self.reset()
 
-    def reset(self):
-        self._state_id = 0
-        self._counter = 0
+class EnsureMonitor(GenericMonitor):
+    """
+    Transition definition (S x B -> S x R):
+        state: (1, k), p(s)>0   -> (1, k++)
+        state: (1, k), p(s)<0   -> (0, k)
+        state: (0, k), *        -> (0, k)
+    """
+    __slots__ = ()
+
+    STATES = ("unsafe", "safe")
+    TERMINAL_IDS = frozenset({1})
+    INITIAL_ID = 1
+    TRANSITIONS = (
+        ((0, KEEP), (0, KEEP)),
+        ((0, KEEP), (1, INCREMENT)),
+    )
 
-    def step(self, state, info={}):
-        """
-        Transition definition (S x R x B -> S x R):
-            (0, k), p(x)<0 -> (0, k)
-            (0, k), p(x)>0 -> (2, k++)
-            (1, k), p(x)<0 -> (1, 0)
-            (1, k), p(x)>0 -> (2, k++)
-            (2, k), p(x)<0 -> (1, 0)
-            (2, k), p(x)>0 -> (2, k++)
-         """
-        current_rob = self._p(state, info)
-        # transition
-        if self._state_id == 0 and current_rob >= 0:
-            self._state_id = 2
-        elif self._state_id == 1 and current_rob >= 0:
-            self._state_id = 2
-        elif self._state_id == 2 and current_rob < 0:
-            self._state_id = 1
-        # counter
-        if current_rob >= 0:
-            self._counter += 1
-        else:
-            self._counter = 0  # reset counter
-        assert self._state_id in self._states, f"unexpected state {self._state_id} in a conquer automaton"
-        return self._state_id, self._counter
 
+class AchieveMonitor(GenericMonitor):
+    """
+    Transition definition (S x B -> S x R):
+        state: (0, k), p(s)>0   -> (1, k++)
+        state: (0, k), p(s)<0   -> (0, k)
+        state: (1, k), p(s)>0   -> (1, k++)
+        state: (1, k), p(s)<0   -> (1, k)
+    """
+    __slots__ = ()
+
+    STATES = ("not_achieved", "achieved")
+    TERMINAL_IDS = frozenset({1})
+    INITIAL_ID = 0
+    TRANSITIONS = (
+        ((0, KEEP), (1, INCREMENT)),
+        ((1, KEEP), (1, INCREMENT)),
+    )
 
-class EncourageMonitor(GenericMonitor):
-    def __init__(self, predicate: Callable):
-        self._p = predicate
-        self._states = {0: "uncomfortable", 1: "comfortable"}
-        self._terminal_ids = {0, 1}  # comfort is always satisfied
-        self._state_id = None
-        self._counter = None
-        self.reset()
 
-    def reset(self):
-        self._state_id = 0
-        self._counter = 0
+class ConquerMonitor(GenericMonitor):
+    """
+    Transition definition (S x R x B -> S x R):
+        (0, k), p(x)<0 -> (0, 0)
+        (0, k), p(x)>0 -> (2, k++)
+        (1, k), p(x)<0 -> (1, 0)
+        (1, k), p(x)>0 -> (2, k++)
+        (2, k), p(x)<0 -> (1, 0)
+        (2, k), p(x)>0 -> (2, k++)
+    """
+    __slots__ = ()
+
+    STATES = ("not_achieved", "achieved", "conquer")
+    TERMINAL_IDS = frozenset({2})
+    INITIAL_ID = 0
+    TRANSITIONS = (
+        ((0, RESET), (2, INCREMENT)),
+        ((1, RESET), (2, INCREMENT)),
+        ((1, RESET), (2, INCREMENT)),
+    )
 
-    def step(self, state, info={}):
-        """
-        Transition definition (S x B ->  (S x R):
-            state: (*, k), p(s)>0   -> (1, k++)
-            state: (*, k), p(s)<0   -> (0, k)
-         """
-        current_rob = self._p(state, info)
-        # transition
-        if current_rob >= 0:
-            self._state_id = 1
-        elif current_rob < 0:
-            self._state_id = 0
-        # update counter
-        if current_rob >= 0:
-            self._counter += 1
-        assert self._state_id in self._states, f"unexpected state {self._state_id} in a encourage automaton"
-        return self._state_id, self._counter
+
+class EncourageMonitor(GenericMonitor):
+    """
+    Transition definition (S x B ->  (S x R):
+        state: (*, k), p(s)>0   -> (1, k++)
+        state: (*, k), p(s)<0   -> (0, k)
+    """
+    __slots__ = ()
+
+    STATES = ("uncomfortable", "comfortable")
+    TERMINAL_IDS = frozenset({0, 1})  # comfort is always satisfied
+    INITIAL_ID = 0
+    TRANSITIONS = (
+        ((0, KEEP), (1, INCREMENT)),
+        ((0, KEEP), (1, INCREMENT)),
+    )
 
 
 class Monitor(GenericMonitor):
+    __slots__ = ()
+
     @staticmethod
     def from_spec(operator: Operator, predicate: Callable):
         if operator == Operator.ENSURE:
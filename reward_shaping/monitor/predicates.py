@@ -0,0 +1,99 @@
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from reward_shaping.core.features import FeatureExtractor
+from reward_shaping.monitor.formula import Operator
+
+# a compiled predicate: names of the features it reads, function of these features (scalars or columns)
+CompiledPredicate = Tuple[Sequence[str], Callable]
+
+
+class CompiledPredicates:
+    """
+    All the requirement predicates of a task, evaluated together from a flat vector of features.
+
+    The features are read once per step from the shared extractor of the env,
+    each predicate is a function of its features with the constants already resolved from `env_params`,
+    then it works either on scalars (a single env) or on columns of a (n_envs, n_features)-array (batched form).
+    """
+
+    def __init__(self, labels: List[str], feature_names: List[str], features: FeatureExtractor,
+                 predicates: List[CompiledPredicate]):
+        self.labels = labels
+        self.feature_names = feature_names
+        self.features = features
+        index = {name: i for i, name in enumerate(feature_names)}
+        self._predicates = [(tuple(index[name] for name in names), fn) for names, fn in predicates]
+
+    def __len__(self):
+        return len(self._predicates)
+
+    def extract(self, state, info) -> List[Any]:
+        step_features = self.features(state, info)
+        return [step_features[name] for name in self.feature_names]
+
+    def evaluate(self, features: Sequence[Any]) -> List[float]:
+        """ robustness of each requirement, from the features of a single env """
+        return [fn(*[features[i] for i in idx]) for idx, fn in self._predicates]
+
+    def evaluate_batch(self, features: np.ndarray) -> np.ndarray:
+        """ robustness of each requirement, from a (n_envs, n_features)-array to a (n_envs, n_reqs)-array """
+        features = np.asarray(features, dtype=np.float64)
+        n_envs = features.shape[0]
+        return np.stack([np.broadcast_to(fn(*[features[:, i] for i in idx]), (n_envs,))
+                         for idx, fn in self._predicates], axis=1)
+
+    def __call__(self, state, info) -> List[float]:
+        return self.evaluate(self.extract(state, info))
+
+
+class RequirementRegistry:
+    """
+    Registry of the requirements of an env.
+
+    Features are registered in the feature extractor of the env (see `FeatureExtractor`),
+    each requirement with its operator and a builder `env_params -> (feature names, fn)`.
+    """
+
+    def __init__(self, features: FeatureExtractor = None):
+        self.features = FeatureExtractor() if features is None else features
+        self._specs = {}
+
+    def register_feature(self, name: str, extractor: Callable):
+        self.features.register(name, extractor)
+
+    def register_derived_feature(self, name: str, inputs: Sequence[str], fn: Callable):
+        self.features.register_derived(name, inputs, fn)
+
+    def register_spec(self, name: str, operator: Operator, build_predicate: Callable):
+        if name not in self._specs:
+            self._specs[name] = (operator, build_predicate)
+
+    def get_spec(self, name: str):
+        return self.get_all_specs()[name]
+
+    def get_all_specs(self) -> Dict[str, Tuple[Operator, Callable]]:
+        """ map each requirement to its operator and a builder of the `(state, info)` predicate """
+        return {name: (operator, self._state_predicate_builder(build)) for name, (operator, build) in
+                self._specs.items()}
+
+    def _state_predicate_builder(self, build: Callable):
+        def build_state_predicate(env_params):
+            names, fn = build(env_params)
+
+            def predicate(state, info):
+                step_features = self.features(state, info)
+                return fn(*[step_features[name] for name in names])
+
+            return predicate
+
+        return build_state_predicate
+
+    def compile(self, env_params: Dict[str, Any]) -> CompiledPredicates:
+        labels = list(self._specs.keys())
+        predicates = [build(env_params) for _, build in self._specs.values()]
+        # extract only the features used by some predicate, in registration order
+        used = set(name for names, _ in predicates for name in names)
+        feature_names = [name for name in self.features.names if name in used]
+        return CompiledPredicates(labels, feature_names, self.features, predicates)
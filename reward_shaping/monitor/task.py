@@ -1,21 +1,35 @@
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Callable
+from typing import Any, Callable, Dict, List, Tuple
 
 import gym
 import numpy as np
 
 from reward_shaping.monitor.formula import Operator
 from reward_shaping.monitor.monitor import Monitor
+from reward_shaping.monitor.predicates import CompiledPredicates
 
 
 class RLTask(gym.Wrapper):
-    def __init__(self, env: gym.Env, requirements: List[Tuple[str, Operator, Callable]]):
+    def __init__(self, env: gym.Env, requirements: List[Tuple[str, Operator, Callable]],
+                 compiled: CompiledPredicates = None):
+        """
+        @param: compiled: optional compiled predicates of the requirements (same labels, same order),
+                    evaluated together once per step instead of calling each predicate on (state, info)
+        """
         super(RLTask, self).__init__(env)
         self._requirements = requirements
+        self._compiled = compiled
         self._monitors = {}
+        self._time = 0
         assert len(requirements) == len(
             set([l for l, _, _ in requirements])), f"not unique labels {[l for l, _, _ in requirements]}"
+        if compiled is not None:
+            assert list(compiled.labels) == [l for l, _, _ in requirements], \
+                f"compiled predicates {compiled.labels} do not match the requirements"
         for i, (label, op, pred) in enumerate(requirements):
+            if compiled is not None:
+                # the monitor reads the i-th robustness of the compiled evaluation
+                pred = (lambda robs, info, i=i: robs[i])
             self._monitors[i] = Monitor.from_spec(op, pred)
 
     @property
@@ -24,20 +38,37 @@ class RLTask(gym.Wrapper):
 
     def _get_monitor_infos(self, obs, info):
         infos = {}
+        # with compiled predicates, all the robustness values are computed at once
+        state = obs if self._compiled is None else self._compiled(obs, info)
         for i, monitor in self._monitors.items():
-            mstate, mcounter = monitor.step(obs, info)
+            mstate, mcounter = monitor.step(state, info)
             infos[f"{self._requirements[i][0]}_state"] = mstate
             infos[f"{self._requirements[i][0]}_counter"] = mcounter
         return infos
 
+    def get_state(self) -> Dict[str, Any]:
+        """ snapshot of the monitors, stacked in a (n_requirements, 2)-array of (state id, counter) """
+        return {"time": self._time, "monitors": np.stack([m.get_state() for m in self._monitors.values()])}
+
+    def set_state(self, state: Dict[str, Any]):
+        assert len(state["monitors"]) == len(self._monitors), "the snapshot does not match the requirements"
+        self._time = state["time"]
+        for monitor, monitor_state in zip(self._monitors.values(), state["monitors"]):
+            monitor.set_state(monitor_state)
+
     def reset(self, **kwargs):
         self._time = 0
         for i, monitor in self._monitors.items():
             monitor.reset()
+        if self._compiled is not None:
+            self._compiled.features.new_step()
         return super(RLTask, self).reset(**kwargs)
 
     def step(self, action):
         obs, reward, done, info = super(RLTask, self).step(action)
+        if self._compiled is not None:
+            # features of the new step are shared with the outer wrappers (rewards, tl monitoring)
+            self._compiled.features.new_step()
         monitor_infos = self._get_monitor_infos(obs, info)
         info.update(monitor_infos)  #inplace
         return obs, reward, done, info
@@ -1,5 +1,7 @@
 from unittest import TestCase
 
+import numpy as np
+
 from reward_shaping.monitor.formula import Operator
 from reward_shaping.monitor.monitor import EnsureMonitor, AchieveMonitor, ConquerMonitor, EncourageMonitor, Monitor
 
@@ -126,3 +128,60 @@ class TestMonitor(TestCase):
         sat, k = self._generic_monitor_test(monitor, predicate, trace)
         self.assertTrue(sat)
         self.assertTrue(k == 0)
+
+    def test_state_snapshot(self):
+        predicate = lambda x, y: x
+        trace = [-1, 2, 3, 3, -2, -1, 1, 2]
+        for operator in [Operator.ENSURE, Operator.ACHIEVE, Operator.CONQUER, Operator.ENCOURAGE]:
+            monitor = Monitor.from_spec(operator, predicate)
+            monitor.reset()
+            for s in trace[:3]:
+                monitor.step(s)
+            snapshot = monitor.get_state()
+            outputs = [monitor.step(s) for s in trace[3:]]
+            # restore and replay the same suffix
+            monitor.set_state(snapshot)
+            self.assertEqual(outputs, [monitor.step(s) for s in trace[3:]])
+
+    def test_numpy_robustness(self):
+        predicate = lambda x, y: np.float64(x)
+        trace = [1, 2, -3, 3]
+        monitor = Monitor.from_spec(Operator.CONQUER, predicate)
+        sat, k = self._generic_monitor_test(monitor, predicate, trace)
+        self.assertTrue(sat)
+        self.assertTrue(k == 1)
+
+    def test_compiled_predicates(self):
+        from reward_shaping.envs.racecar.specs import get_all_specs, compile_specs
+        env_params = {"reward_params": {"target_progress": 0.99, "target_dist2obst": 0.5, "comfort_max_steering": 0.1,
+                                        "min_velx": 2.0, "max_velx": 3.0, "comfort_max_norm": 0.25}}
+        rng = np.random.default_rng(0)
+        states = [{"collision": rng.integers(0, 2), "progress": rng.uniform(), "dist2obst": rng.uniform(),
+                   "velocity_x": rng.uniform(0, 4, size=(1,)), "last_actions": rng.uniform(-1, 1, size=(3, 2))}
+                  for _ in range(10)]
+        compiled = compile_specs(env_params)
+        predicates = [build(env_params) for _, build in get_all_specs().values()]
+        self.assertEqual(compiled.labels, list(get_all_specs().keys()))
+        expected = np.array([[float(np.squeeze(p(state, {}))) for p in predicates] for state in states])
+        single = np.array([compiled(state, {}) for state in states])
+        batch = compiled.evaluate_batch(np.array([compiled.extract(state, {}) for state in states]))
+        self.assertTrue(np.allclose(single, expected))
+        self.assertTrue(np.allclose(batch, expected))
+
+    def test_shared_features(self):
+        from reward_shaping.core.features import FeatureExtractor
+        calls = []
+        features = FeatureExtractor()
+        features.register("x", lambda state, info: calls.append("x") or state["x"])
+        features.register("limit", lambda state, info: info["limit"])
+        features.register_derived("margin", ("x", "limit"), lambda x, limit: calls.append("margin") or limit - x)
+        state, info = {"x": 1.0}, {"limit": 3.0}
+        # each feature is computed once for the same (state, info), then memoized
+        self.assertEqual(features(state, info)["margin"], 2.0)
+        self.assertEqual(features(state, info)["margin"], 2.0)
+        self.assertEqual(features(state, info)["x"], 1.0)
+        self.assertEqual(calls, ["x", "margin"])
+        # a new step is computed again
+        features.new_step()
+        self.assertEqual(list(features(state, info).as_array()), [1.0, 3.0, 2.0])
+        self.assertEqual(calls, ["x", "margin", "x", "margin"])
@@ -1,8 +1,15 @@
+import os
+import random
+import tempfile
 import time
 from unittest import TestCase
 import matplotlib.pyplot as plt
 
-from reward_shaping.core.helper_fns import monitor_mtl_filtering_episode
+from reward_shaping.core import spec_cache
+from reward_shaping.core.helper_fns import monitor_mtl_filtering_episode, make_mtl_filtering_online_monitor
+from reward_shaping.lti_filtering.filtering_operations import TimedAlwaysOperation, TimedEventuallyOperation, \
+    TimedHistoricallyOperation, TimedUntilOperation, TimedSinceOperation
+from reward_shaping.lti_filtering.specification import MTLDiscreteTimeSpecification
 from reward_shaping.test.test import generic_env_test, generic_training, generic_env_test_wt_agent
 
 env_name = "cart_pole_obst"
@@ -42,4 +49,142 @@ class TestFilteringSemanticsMonitoring(TestCase):
                    "dist_obstacle": [0.15, 0.2, 0.2, 0.1, 0.05, 0.0, 0.1, 0.2, 0.25, 0.2]
                    }
         expected_robustness = [0.0] * 7 + [0.2] * 2 + [0.1]
-        self._generic_example_1(episode, exp_rob_trace=expected_robustness)
\ No newline at end of file
+        self._generic_example_1(episode, exp_rob_trace=expected_robustness)
+
+    def _generic_online_example(self, episode, window_len=None):
+        # online robustness must match the offline one at the first position of the (windowed) prefix
+        spec = "(always(dist_obstacle>0.1)) and (eventually(always(dist_origin<0.1)))"
+        vars = ["time", "dist_obstacle", "dist_origin"]
+        types = ["int", "float", "float"]
+        online_spec = make_mtl_filtering_online_monitor(spec, vars, types, window_len)
+        self.assertIsNotNone(online_spec)
+        for _ in range(2):  # the second pass checks the reset
+            online_spec.reset()
+            for i, t in enumerate(episode["time"]):
+                robustness = online_spec.update(t, [(v, episode[v][i]) for v in vars if v != "time"])
+                first = 0 if window_len is None else max(0, i + 1 - window_len)
+                prefix = {v: episode[v][first:i + 1] for v in vars}
+                expected = monitor_mtl_filtering_episode(spec, vars, types, prefix)[0][1]
+                self.assertAlmostEqual(expected, robustness)
+
+    def test_online_episode(self):
+        episode = {"time": [0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+                   "dist_origin": [2.0, 1.5, 1.0, 0.75, 0.5, 0.0, 0.2, 0.1, 0.0, 0.0],
+                   "dist_obstacle": [0.15, 0.2, 0.2, 0.1, 0.05, 0.0, 0.1, 0.2, 0.25, 0.2]
+                   }
+        self._generic_online_example(episode)
+        self._generic_online_example(episode, window_len=4)
+
+    def test_online_state(self):
+        # a monitor restored from a snapshot continues as the original one, without pushing the samples again
+        spec = "(always(dist_obstacle>0.1)) and (eventually(always(dist_origin<0.1)))"
+        vars = ["time", "dist_obstacle", "dist_origin"]
+        types = ["int", "float", "float"]
+        episode = {"time": list(range(10)),
+                   "dist_origin": [2.0, 1.5, 1.0, 0.75, 0.5, 0.0, 0.2, 0.1, 0.0, 0.0],
+                   "dist_obstacle": [0.15, 0.2, 0.2, 0.1, 0.05, 0.0, 0.1, 0.2, 0.25, 0.2]}
+        for window_len in [None, 4]:
+            monitor = make_mtl_filtering_online_monitor(spec, vars, types, window_len)
+            restored = make_mtl_filtering_online_monitor(spec, vars, types, window_len)
+            monitor.reset()
+            restored.reset()
+            for i, t in enumerate(episode["time"]):
+                inputs = [(v, episode[v][i]) for v in vars if v != "time"]
+                if i == 6:
+                    restored.set_online_state(monitor.get_online_state())
+                robustness = monitor.update(t, inputs)
+                if i >= 6:
+                    self.assertAlmostEqual(robustness, restored.update(t, inputs))
+
+    def test_online_unsupported_nesting(self):
+        spec = "always(eventually(dist_origin<0.1))"
+        vars = ["time", "dist_origin"]
+        types = ["int", "float"]
+        self.assertIsNone(make_mtl_filtering_online_monitor(spec, vars, types))
+
+    def _make_spec(self, check_sampling):
+        spec = MTLDiscreteTimeSpecification()
+        spec.declare_var("time", "int")
+        spec.declare_var("dist_origin", "float")
+        spec.spec = "eventually(dist_origin<0.1)"
+        spec.parse()
+        spec.set_sampling_check(check_sampling)
+        return spec
+
+    def test_sampling_violations(self):
+        episode = {"time": [0, 1, 2, 4, 5, 7], "dist_origin": [1.0, 0.5, 0.2, 0.0, 0.0, 0.0]}
+        spec = self._make_spec(check_sampling=True)
+        spec.evaluate(episode)
+        self.assertEqual([3, 5], spec.sampling_violations)
+        self.assertEqual(2, spec.sampling_violation_counter)
+        # trusted traces skip the validation
+        spec = self._make_spec(check_sampling=False)
+        spec.evaluate(episode)
+        self.assertEqual(0, spec.sampling_violation_counter)
+
+class TestTimedOperations(TestCase):
+    """ compare the sliding-window operations with a brute-force evaluation of the windows """
+
+    def _random_traces(self, n_traces=200, seed=0):
+        rng = random.Random(seed)
+        for _ in range(n_traces):
+            n, begin = rng.randint(1, 12), rng.randint(0, 3)
+            end = begin + rng.randint(0, 4)
+            left = [float(rng.randint(-3, 3)) for _ in range(n)]
+            right = [float(rng.randint(-3, 3)) for _ in range(n)]
+            yield n, begin, end, left, right
+
+    def test_timed_always_eventually(self):
+        for n, a, b, x, _ in self._random_traces():
+            always = [min(x[min(i + a, n - 1):min(i + b, n - 1) + 1]) for i in range(n)]
+            eventually = [sum(x[i + a:i + b + 1]) / (b - a + 1) for i in range(n)]
+            historically = [min(x[max(i - b, 0):max(i - a, 0) + 1]) for i in range(n)]
+            self.assertEqual(always, TimedAlwaysOperation(a, b).update(x))
+            self.assertEqual(historically, TimedHistoricallyOperation(a, b).update(x))
+            for expected, result in zip(eventually, TimedEventuallyOperation(a, b).update(x)):
+                self.assertAlmostEqual(expected, result)
+
+    def test_timed_until_since(self):
+        for n, a, b, x, y in self._random_traces():
+            until = [max(min([y[j]] + x[i:j]) for j in range(min(i + a, n - 1), min(i + b, n - 1) + 1))
+                     for i in range(n)]
+            since = [max(min([y[j]] + x[j + 1:i + 1]) for j in range(max(i - b, 0), max(i - a, 0) + 1))
+                     for i in range(n)]
+            self.assertEqual(until, TimedUntilOperation(a, b).update(x, y))
+            self.assertEqual(since, TimedSinceOperation(a, b).update(x, y))
+
+    def test_bounded_spec(self):
+        spec = "always[0:2](dist_obstacle>0.1)"
+        vars = ["time", "dist_obstacle"]
+        types = ["int", "float"]
+        episode = {"time": [0, 1, 2, 3, 4, 5], "dist_obstacle": [0.15, 0.2, 0.2, 0.1, 0.2, 0.3]}
+        robustness = monitor_mtl_filtering_episode(spec, vars, types, episode)
+        self.assertEqual([1.0, 0.0, 0.0, 0.0, 1.0, 1.0], [r[1] for r in robustness])
+
+
+class TestSpecCache(TestCase):
+
+    def test_cached_spec(self):
+        spec = "(always(dist_obstacle>0.1)) and (eventually(dist_origin<0.1))"
+        vars = ["time", "dist_obstacle", "dist_origin"]
+        types = ["int", "float", "float"]
+        episode = {"time": [0, 1, 2, 3], "dist_origin": [2.0, 1.0, 0.0, 0.0], "dist_obstacle": [0.2, 0.2, 0.3, 0.2]}
+        old_dir = os.environ.get(spec_cache.CACHE_DIR_ENV)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.environ[spec_cache.CACHE_DIR_ENV] = tmpdir
+            try:
+                spec_cache.clear_spec_cache()
+                expected = monitor_mtl_filtering_episode(spec, vars, types, episode)
+                self.assertEqual(1, len(list(spec_cache.get_cache_dir().glob("*.pkl"))))
+                # a new process only finds the on-disk cache
+                spec_cache.clear_spec_cache(disk=False)
+                self.assertEqual(expected, monitor_mtl_filtering_episode(spec, vars, types, episode))
+                # different declarations, different entry
+                monitor_mtl_filtering_episode(spec, vars, ["int", "float", "int"], episode)
+                self.assertEqual(2, len(list(spec_cache.get_cache_dir().glob("*.pkl"))))
+            finally:
+                spec_cache.clear_spec_cache(disk=False)
+                if old_dir is None:
+                    os.environ.pop(spec_cache.CACHE_DIR_ENV)
+                else:
+                    os.environ[spec_cache.CACHE_DIR_ENV] = old_dir
@@ -59,8 +59,8 @@ def generic_env_test_wt_agent(env_name, model, task, reward_name):
 def generic_training(env, task, reward):
     # create training environment
     seed = np.random.randint(0, 1000000)
-    train_env, env_params = make_env(env, task, reward, seed=seed)
-    eval_env, _ = make_env(env, task, "eval", seed=seed)
+    train_env, env_params = make_env(env, task, reward, seed=seed, check=True)
+    eval_env, _ = make_env(env, task, "eval", seed=seed, check=True)
     # create agent
     model = make_agent(env, train_env, reward, "sac", logdir=None)
     # train
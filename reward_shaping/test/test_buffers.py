@@ -0,0 +1,61 @@
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+from gym import spaces
+
+from reward_shaping.training.buffers import CompactReplayBuffer
+
+
+def fill_buffer(buffer, n_steps, episode_len, obs_dim):
+    """ add transitions where the observation of step t is [t, ..., t] / n_steps """
+    obs = np.zeros((1, obs_dim), dtype=np.float32)
+    for t in range(n_steps):
+        next_obs = np.full((1, obs_dim), (t + 1) / n_steps, dtype=np.float32)
+        done = (t + 1) % episode_len == 0
+        buffer.add(obs, next_obs, np.array([[t]]), np.array([t]), np.array([done]), [{}])
+        obs = np.zeros((1, obs_dim), dtype=np.float32) if done else next_obs
+
+
+class TestCompactReplayBuffer(TestCase):
+    obs_space = spaces.Box(low=-1.0, high=1.0, shape=(4,))
+    action_space = spaces.Box(low=-1000.0, high=1000.0, shape=(1,))
+
+    def _check_samples(self, buffer, n_steps, atol):
+        samples = buffer.sample(256)
+        actions = samples.actions.numpy()[:, 0]
+        obs, next_obs = samples.observations.numpy(), samples.next_observations.numpy()
+        # the transition of step t has reward t, next obs (t+1)/n, obs t/n (0 at the episode start)
+        self.assertTrue(np.allclose(samples.rewards.numpy()[:, 0], actions))
+        self.assertTrue(np.allclose(next_obs, ((actions + 1) / n_steps)[:, None], atol=atol))
+        self.assertTrue(np.all(np.isclose(obs, (actions / n_steps)[:, None], atol=atol) | (np.abs(obs) <= atol)))
+        return actions
+
+    def test_next_obs_by_index(self):
+        for obs_dtype, atol in [("float32", 1e-6), ("float16", 1e-3), ("uint8", 2 / 255)]:
+            buffer = CompactReplayBuffer(100, self.obs_space, self.action_space, obs_dtype=obs_dtype)
+            fill_buffer(buffer, n_steps=250, episode_len=50, obs_dim=4)
+            actions = self._check_samples(buffer, n_steps=250, atol=atol)
+            # only the last 100 transitions are in the buffer
+            self.assertGreaterEqual(actions.min(), 150)
+            # one observation per step, plus the terminal ones
+            self.assertLess(buffer.nbytes(), 2 * 100 * 4 * np.dtype(obs_dtype).itemsize + 100 * 40)
+
+    def test_short_episodes(self):
+        # a terminal observation every 2 steps overflows the extra rows, the stale transitions are not sampled
+        buffer = CompactReplayBuffer(100, self.obs_space, self.action_space, obs_dtype="float32")
+        fill_buffer(buffer, n_steps=300, episode_len=2, obs_dim=4)
+        actions = self._check_samples(buffer, n_steps=300, atol=1e-6)
+        self.assertGreaterEqual(actions.min(), 300 - 2 * buffer._obs_capacity // 3 - 1)
+
+    def test_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            buffer = CompactReplayBuffer(100, self.obs_space, self.action_space, obs_dtype="uint8", storage_dir=tmpdir)
+            fill_buffer(buffer, n_steps=150, episode_len=30, obs_dim=4)
+            self._check_samples(buffer, n_steps=150, atol=2 / 255)
+            self.assertIsInstance(buffer._obs, np.memmap)
+
+    def test_unbounded_uint8(self):
+        unbounded = spaces.Box(low=-np.inf, high=np.inf, shape=(4,))
+        with self.assertRaises(ValueError):
+            CompactReplayBuffer(100, unbounded, self.action_space, obs_dtype="uint8")
@@ -0,0 +1,97 @@
+import pathlib
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import torch as th
+from gym import spaces
+
+from reward_shaping.test.test_buffers import fill_buffer
+from reward_shaping.training.buffers import CompactReplayBuffer
+from reward_shaping.training.checkpointing import AsyncCheckpointWriter, BufferDeltas, get_buffer_checkpoints, \
+    find_resume_step, restore_model
+
+
+class TestCheckpointing(TestCase):
+    obs_space = spaces.Box(low=-1.0, high=1.0, shape=(4,))
+    action_space = spaces.Box(low=-1000.0, high=1000.0, shape=(1,))
+
+    def _make_buffer(self):
+        return CompactReplayBuffer(100, self.obs_space, self.action_space, obs_dtype="uint8")
+
+    def test_incremental_buffer_checkpoints(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            buffer, deltas, writer = self._make_buffer(), BufferDeltas(), AsyncCheckpointWriter()
+            n_steps = 0
+            for step in [40, 40, 40, 40, 40]:
+                fill_buffer(buffer, n_steps=step, episode_len=20, obs_dim=4)
+                n_steps += step
+                writer.save_buffer(deltas, buffer, n_steps, pathlib.Path(tmpdir) / f"replay_buffer_{n_steps}_steps.npz")
+            writer.close()
+            files = get_buffer_checkpoints(tmpdir)
+            # the first checkpoints were overwritten by the last 100 transitions
+            self.assertEqual([f.name for f in files][0], "replay_buffer_120_steps.npz")
+            restored = self._make_buffer()
+            BufferDeltas().restore(restored, files)
+            self.assertEqual((restored.pos, restored.full, restored._n_obs), (buffer.pos, buffer.full, buffer._n_obs))
+            for name in ["_obs", "_obs_ids", "actions", "rewards", "dones"]:
+                self.assertTrue(np.array_equal(getattr(restored, name), getattr(buffer, name)), name)
+
+    def test_failed_buffer_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            buffer, deltas = self._make_buffer(), BufferDeltas()
+            fill_buffer(buffer, n_steps=30, episode_len=20, obs_dim=4)
+            # the first write fails, its rows are written with the next checkpoint
+            deltas.snapshot(buffer, 30)
+            fill_buffer(buffer, n_steps=30, episode_len=20, obs_dim=4)
+            deltas.write(deltas.snapshot(buffer, 60), pathlib.Path(tmpdir) / "replay_buffer_60_steps.npz")
+            restored = self._make_buffer()
+            BufferDeltas().restore(restored, get_buffer_checkpoints(tmpdir))
+            for name in ["_obs", "_obs_ids", "actions", "rewards", "dones"]:
+                self.assertTrue(np.array_equal(getattr(restored, name), getattr(buffer, name)), name)
+
+    def test_model_checkpoint(self):
+        from stable_baselines3 import SAC
+
+        model = SAC("MlpPolicy", "Pendulum-v1", buffer_size=1000, learning_starts=10, seed=0)
+        model.learn(total_timesteps=20)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer = AsyncCheckpointWriter()
+            writer.save_model(model, pathlib.Path(tmpdir) / "model_20_steps.zip")
+            writer.close()
+            loaded = SAC.load(pathlib.Path(tmpdir) / "model_20_steps.zip")
+        self.assertEqual(loaded.num_timesteps, model.num_timesteps)
+        for name, param in model.policy.state_dict().items():
+            self.assertTrue(th.equal(param.cpu(), loaded.policy.state_dict()[name].cpu()), name)
+
+    def test_find_resume_step(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ["model_100_steps.zip", "rng_100_steps.pkl", "replay_buffer_100_steps.npz",
+                         "model_200_steps.zip", "rng_200_steps.pkl", "model_300_steps.zip"]:
+                (pathlib.Path(tmpdir) / name).touch()
+            # the checkpoint at 300 steps is incomplete, the one at 200 steps has no replay buffer
+            self.assertEqual(find_resume_step(tmpdir), 200)
+            self.assertEqual(find_resume_step(tmpdir, with_buffer=True), 100)
+            self.assertIsNone(find_resume_step(pathlib.Path(tmpdir) / "missing"))
+
+    def test_restore_model(self):
+        from stable_baselines3 import SAC
+
+        model = SAC("MlpPolicy", "Pendulum-v1", buffer_size=1000, learning_starts=10, seed=0)
+        model.learn(total_timesteps=30)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer, deltas = AsyncCheckpointWriter(), BufferDeltas()
+            writer.save_model(model, pathlib.Path(tmpdir) / "model_30_steps.zip")
+            writer.save_buffer(deltas, model.replay_buffer, 30, pathlib.Path(tmpdir) / "replay_buffer_30_steps.npz")
+            writer.save_rng_state(model, pathlib.Path(tmpdir) / "rng_30_steps.pkl")
+            writer.close()
+            expected_sample = np.random.rand()
+            resumed = SAC("MlpPolicy", "Pendulum-v1", buffer_size=1000, learning_starts=10, seed=1)
+            restore_model(resumed, tmpdir, find_resume_step(tmpdir, with_buffer=True), buffer_deltas=BufferDeltas())
+        self.assertEqual(resumed.num_timesteps, 30)
+        self.assertEqual(np.random.rand(), expected_sample)
+        self.assertTrue(np.array_equal(resumed.replay_buffer.observations, model.replay_buffer.observations))
+        expected_state = model.critic.optimizer.state_dict()["state"]
+        state = resumed.critic.optimizer.state_dict()["state"]
+        for name, value in expected_state[0].items():
+            self.assertTrue(th.equal(th.as_tensor(value), th.as_tensor(state[0][name])), name)
@@ -0,0 +1,42 @@
+import os
+import pathlib
+import tempfile
+from unittest import TestCase
+
+from reward_shaping.core.eval_cache import eval_cache_key, evaluate_with_cache, load_eval_result, prune_eval_cache
+
+
+class TestEvalCache(TestCase):
+
+    def test_evaluate_with_cache(self):
+        calls = []
+
+        def evaluate():
+            calls.append(1)
+            return [1.0, 2.0], [10, 20], {"s1_collision_counter": [0.0, 1.0]}
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_dir = pathlib.Path(tmpdir)
+            key = eval_cache_key("policy", "racecar", "drive", {"seed": 0}, n_episodes=2, seed=0)
+            self.assertNotEqual(key, eval_cache_key("policy", "racecar", "drive", {"seed": 0}, n_episodes=3, seed=0))
+            first = evaluate_with_cache(key, evaluate, cache_dir=cache_dir)
+            second = evaluate_with_cache(key, evaluate, cache_dir=cache_dir)
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(first, second)
+            evaluate_with_cache(key, evaluate, refresh=True, cache_dir=cache_dir)
+            self.assertEqual(len(calls), 2)
+
+    def test_lru_pruning(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_dir = pathlib.Path(tmpdir)
+            keys = [eval_cache_key(f"policy_{i}", "racecar", "drive", {}, n_episodes=1, seed=0) for i in range(3)]
+            for i, key in enumerate(keys):
+                evaluate_with_cache(key, lambda: ([float(i)], [1], {}), cache_dir=cache_dir)
+                os.utime(cache_dir / f"{key}.json", (i, i))
+            # using the oldest entry makes it the most recent
+            self.assertIsNotNone(load_eval_result(keys[0], cache_dir))
+            entry_size = (cache_dir / f"{keys[1]}.json").stat().st_size
+            prune_eval_cache(cache_dir, max_size=2 * entry_size)
+            self.assertIsNotNone(load_eval_result(keys[0], cache_dir))
+            self.assertIsNone(load_eval_result(keys[1], cache_dir))
+            self.assertIsNotNone(load_eval_result(keys[2], cache_dir))
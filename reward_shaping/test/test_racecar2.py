@@ -64,4 +64,4 @@ class TestTrainingLoop(TestCase):
 
     def test_train_morl_dec(self):
         for task in tasks:
-            generic_training(env_name, task, 'morl_dec')
\ No newline at end of file
+            generic_training(env_name, task, 'morl_dec')
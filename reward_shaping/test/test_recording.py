@@ -0,0 +1,171 @@
+import pathlib
+import tempfile
+from unittest import TestCase
+
+import gym
+import numpy as np
+
+from reward_shaping.core.recording import TrajectoryRecorder, TrajectoryDataset, get_field_group
+from reward_shaping.core.rescoring import rescore, ReplayEnv
+from reward_shaping.core.wrappers import get_wrappers_state, set_wrappers_state
+
+
+class CounterEnv(gym.Env):
+    """ episodes of random length, the observation counts the steps """
+
+    def __init__(self, seed=0):
+        self._rng = np.random.default_rng(seed)
+        self._t, self._len = 0, 0
+
+    def reset(self):
+        self._t, self._len = 0, int(self._rng.integers(1, 20))
+        return {"t": np.array([self._t], dtype=np.float32), "pos": np.zeros(2)}
+
+    def step(self, action):
+        self._t += 1
+        obs = {"t": np.array([self._t], dtype=np.float32), "pos": np.full(2, self._t, dtype=np.float64)}
+        info = {"time": self._t, "collision": False, "name": "counter", "default_reward": 0.5 * self._t}
+        return obs, float(self._t), self._t >= self._len, info
+
+
+class DictActionEnv(CounterEnv):
+    """ as the racecar envs, the actions are dictionaries (eg, motor and steering) and the infos change type """
+
+    def step(self, action):
+        assert isinstance(action, dict)
+        obs, reward, done, info = super(DictActionEnv, self).step(action)
+        info["progress"] = 0 if self._t == 1 else 0.25 * self._t
+        return obs, reward, done, info
+
+
+class TestTrajectoryRecorder(TestCase):
+
+    def test_record_and_read(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            lengths = []
+            for shard in ["worker_0", "worker_1"]:
+                env = TrajectoryRecorder(CounterEnv(seed=len(lengths)), tmpdir, shard=shard, chunk_size=7)
+                for _ in range(10):
+                    env.reset()
+                    done, n_steps = False, 0
+                    while not done:
+                        _, _, done, _ = env.step(np.array([0.5]))
+                        n_steps += 1
+                    lengths.append(n_steps)
+                # interrupted episode
+                env.reset()
+                env.step(np.array([0.5]))
+                env.close()
+            dataset = TrajectoryDataset(tmpdir)
+            self.assertEqual(len(dataset), 22)
+            self.assertTrue("info.name" not in dataset.fields)
+            episodes = list(dataset.episodes())
+            self.assertEqual([len(e["t"]) - 1 for e in episodes], lengths)
+            for episode in episodes:
+                obs = get_field_group(episode, "obs")
+                self.assertTrue(np.array_equal(episode["t"], np.arange(len(episode["t"]))))
+                self.assertTrue(np.array_equal(obs["t"][:, 0], episode["t"]))
+                self.assertTrue(np.array_equal(episode["info.time"][1:], episode["t"][1:]))
+                self.assertTrue(episode["done"][-1] and not episode["done"][:-1].any())
+            self.assertFalse(dataset.is_complete(10))
+
+    def test_rescoring(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            recdir, cachedir = pathlib.Path(tmpdir) / "rec", pathlib.Path(tmpdir) / "cache"
+            env = TrajectoryRecorder(CounterEnv(), recdir, shard="worker_0", chunk_size=16)
+            expected = []
+            for _ in range(5):
+                env.reset()
+                done, tot_reward = False, 0.0
+                while not done:
+                    _, _, done, info = env.step(np.array([0.5]))
+                    tot_reward += info["default_reward"]
+                expected.append(tot_reward)
+            env.close()
+            # the 'default' reward replays the env reward stored in the info
+            results = rescore(recdir, "racecar", "drive_delta", ["default"], n_workers=2, chunk_episodes=2,
+                              cache_dir=cachedir)
+            self.assertEqual([results["worker_0"]["default"][i] for i in range(5)], expected)
+            self.assertEqual(len(list(cachedir.glob("*.json"))), 1)
+            # a new shard is scored, the cached one is loaded
+            env = TrajectoryRecorder(CounterEnv(seed=1), recdir, shard="worker_1", chunk_size=16)
+            env.reset()
+            done = False
+            while not done:
+                _, _, done, _ = env.step(np.array([0.5]))
+            env.close()
+            results = rescore(recdir, "racecar", "drive_delta", ["default"], cache_dir=cachedir)
+            self.assertEqual([results["worker_0"]["default"][i] for i in range(5)], expected)
+            self.assertEqual(len(results["worker_1"]["default"]), 1)
+            self.assertEqual(len(list(cachedir.glob("*.json"))), 2)
+
+    def test_restore_replay(self):
+        from reward_shaping.training.utils import load_env_params, make_reward_wrap
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = TrajectoryRecorder(CounterEnv(), tmpdir, shard="worker_0")
+            env.reset()
+            done = False
+            while not done:
+                _, _, done, _ = env.step(np.array([0.5]))
+            env.close()
+            replay = ReplayEnv(TrajectoryDataset(tmpdir).episode(0))
+        # branch and restart: the rewards after the snapshot are the same, without replaying the prefix
+        env = make_reward_wrap("racecar", replay, load_env_params("racecar", "drive_delta"), "default")
+        env.reset()
+        env.step(replay.action(1))
+        snapshot = get_wrappers_state(env)
+        rewards = [env.step(replay.action(t))[1] for t in range(2, replay.n_steps + 1)]
+        set_wrappers_state(env, snapshot)
+        self.assertEqual([env.step(replay.action(t))[1] for t in range(2, replay.n_steps + 1)], rewards)
+
+    def test_dict_actions(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = TrajectoryRecorder(DictActionEnv(), tmpdir, shard="worker_0", chunk_size=8)
+            for _ in range(3):
+                env.reset()
+                done = False
+                while not done:
+                    _, _, done, _ = env.step({"motor": np.array([0.5]), "steering": np.array([-0.5])})
+            env.close()
+            dataset = TrajectoryDataset(tmpdir)
+            self.assertEqual(len(dataset), 3)
+            for episode in dataset.episodes():
+                actions = get_field_group(episode, "action")
+                self.assertEqual(set(actions), {"motor", "steering"})
+                self.assertTrue(np.all(actions["motor"][1:] == 0.5) and np.all(actions["steering"][1:] == -0.5))
+                # the int value of the first step does not truncate the next ones
+                self.assertTrue(np.allclose(episode["info.progress"][2:], 0.25 * episode["t"][2:]))
+
+    def test_schema_checks(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = TrajectoryRecorder(CounterEnv(), tmpdir, shard="objects")
+            env.reset()
+            with self.assertRaises(ValueError):
+                env.step(np.array([object()]))
+            # an info field missing after the first step is stored as missing, without stopping the episode
+            env = TrajectoryRecorder(CounterEnv(), tmpdir, shard="missing", info_keys=["time", "collision"])
+            env.reset()
+            env.step(np.array([0.5]))
+            env.env.step = lambda action: (env.env.reset(), 0.0, True, {"time": 1})
+            with self.assertWarns(RuntimeWarning):
+                env.step(np.array([0.5]))
+            env.close()
+            episode = TrajectoryDataset(pathlib.Path(tmpdir) / "missing").episode(0)
+            self.assertEqual(list(episode["info.collision"]), [False, False, False])
+
+    def test_late_info_fields(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # as the racecar progress, the field is None until it is available
+            infos = [{"progress": None}, {"progress": 0.3}, {"progress": 0.5, "lap": 1}, {"progress": "n/a"}]
+            env = TrajectoryRecorder(CounterEnv(), tmpdir, shard="worker_0")
+            env.env.step = lambda action: (env.env.reset(), 0.0, len(infos) == 0, infos.pop(0))
+            env.reset()
+            with self.assertWarns(RuntimeWarning):
+                for _ in range(4):
+                    env.step(np.array([0.5]))
+            env.close()
+            dataset = TrajectoryDataset(tmpdir)
+            self.assertTrue("info.lap" not in dataset.fields)
+            progress = dataset.episode(0)["info.progress"]
+            self.assertTrue(np.isnan(progress[[1, 4]]).all())
+            self.assertEqual(list(progress[2:4]), [0.3, 0.5])
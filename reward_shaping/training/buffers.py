@@ -0,0 +1,172 @@
+import pathlib
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import torch as th
+from gym import spaces
+from stable_baselines3.common.buffers import BaseBuffer
+from stable_baselines3.common.type_aliases import ReplayBufferSamples
+from stable_baselines3.common.vec_env import VecNormalize
+
+OBS_DTYPES = ["float32", "float16", "uint8"]
+
+
+class CompactReplayBuffer(BaseBuffer):
+    """
+    Replay buffer for off-policy algorithms (sac, td3, ddpg), with the interface of the sb3 `ReplayBuffer`.
+
+    Compared to the sb3 buffer:
+        - each observation is stored once: a transition stores the ids of its observation and next observation,
+          the next observation of a transition is the observation of the following one, unless the episode ended
+          (then the terminal observation is stored as an extra observation),
+        - observations are stored as float32, float16, or quantized in uint8 over the bounds of the observation space
+          (eg, racecar observations are normalized in [-1, 1], the quantization step is 2/255),
+        - the storage can be memory-mapped on disk, then it is backed by the page cache and not by the swap.
+
+    The observations are written in a ring of `buffer_size * (1 + extra_obs_fraction)` rows. When episodes are so
+    short that the ring overwrites the observations of the oldest transitions, those are not sampled anymore.
+
+    @param: obs_dtype: storage type of the observations (float32, float16, uint8)
+    @param: storage_dir: if given, directory of the memory-mapped storage
+    @param: extra_obs_fraction: rows for the terminal observations, as fraction of the buffer size
+    """
+
+    def __init__(
+            self,
+            buffer_size: int,
+            observation_space: spaces.Space,
+            action_space: spaces.Space,
+            device: Union[th.device, str] = "cpu",
+            n_envs: int = 1,
+            optimize_memory_usage: bool = False,
+            handle_timeout_termination: bool = True,
+            obs_dtype: str = "float16",
+            storage_dir: Optional[Union[str, pathlib.Path]] = None,
+            extra_obs_fraction: float = 0.1,
+    ):
+        super(CompactReplayBuffer, self).__init__(buffer_size, observation_space, action_space, device, n_envs=n_envs)
+        if n_envs != 1:
+            raise ValueError(f"{type(self).__name__} supports a single env, got n_envs={n_envs}")
+        if not isinstance(observation_space, spaces.Box):
+            raise ValueError(f"{type(self).__name__} supports Box observations (eg, flattened), "
+                             f"got {observation_space}")
+        if obs_dtype not in OBS_DTYPES:
+            raise ValueError(f"obs_dtype must be one of {OBS_DTYPES}, got {obs_dtype}")
+        # note: each observation is stored once by design, the sb3 flag is accepted for compatibility
+        self.optimize_memory_usage = optimize_memory_usage
+        self.handle_timeout_termination = handle_timeout_termination
+        self._obs_dtype = obs_dtype
+        self._storage_dir = pathlib.Path(storage_dir) if storage_dir is not None else None
+        if self._storage_dir is not None:
+            self._storage_dir.mkdir(parents=True, exist_ok=True)
+        if obs_dtype == "uint8":
+            low, high = observation_space.low.astype(np.float64), observation_space.high.astype(np.float64)
+            if not (np.all(np.isfinite(low)) and np.all(np.isfinite(high))):
+                raise ValueError("uint8 observations require a bounded observation space")
+            self._low, self._high, self._scale = low, high, (high - low) / 255.0
+        # observations ring and transitions
+        self._obs_capacity = buffer_size + max(1, int(extra_obs_fraction * buffer_size))
+        self._obs = self._allocate("observations", (self._obs_capacity,) + self.obs_shape, np.dtype(obs_dtype))
+        self._obs_ids = self._allocate("obs_ids", (self.buffer_size, 2), np.int64)
+        self.actions = self._allocate("actions", (self.buffer_size, self.n_envs, self.action_dim),
+                                      action_space.dtype)
+        self.rewards = self._allocate("rewards", (self.buffer_size, self.n_envs), np.float32)
+        self.dones = self._allocate("dones", (self.buffer_size, self.n_envs), np.float32)
+        self.timeouts = self._allocate("timeouts", (self.buffer_size, self.n_envs), np.float32)
+        # nr observations written since the creation, id of the last next observation if the episode continues
+        self._n_obs = 0
+        self._last_next_id = None
+        self._last_next_obs = None
+
+    def _allocate(self, name: str, shape, dtype) -> np.ndarray:
+        if self._storage_dir is None:
+            return np.zeros(shape, dtype=dtype)
+        return np.lib.format.open_memmap(self._storage_dir / f"{name}.npy", mode="w+", dtype=dtype, shape=shape)
+
+    def _encode(self, obs: np.ndarray) -> np.ndarray:
+        if self._obs_dtype == "uint8":
+            return np.rint((np.clip(obs, self._low, self._high) - self._low) /
+                           np.where(self._scale > 0, self._scale, 1.0)).astype(np.uint8)
+        return obs.astype(self._obs_dtype)
+
+    def _decode(self, obs: np.ndarray) -> np.ndarray:
+        if self._obs_dtype == "uint8":
+            return (self._low + obs * self._scale).astype(np.float32)
+        return obs.astype(np.float32)
+
+    def _write_obs(self, obs: np.ndarray) -> int:
+        self._obs[self._n_obs % self._obs_capacity] = self._encode(obs)
+        self._n_obs += 1
+        return self._n_obs - 1
+
+    def add(
+            self,
+            obs: np.ndarray,
+            next_obs: np.ndarray,
+            action: np.ndarray,
+            reward: np.ndarray,
+            done: np.ndarray,
+            infos: List[Dict[str, Any]],
+    ) -> None:
+        obs = np.asarray(obs).reshape(self.obs_shape)
+        next_obs = np.asarray(next_obs).reshape(self.obs_shape)
+        # the observation is the next observation of the previous transition, unless the episode was restarted
+        if self._last_next_id is not None and np.array_equal(obs, self._last_next_obs):
+            obs_id = self._last_next_id
+        else:
+            obs_id = self._write_obs(obs)
+        next_id = self._write_obs(next_obs)
+        self._obs_ids[self.pos] = (obs_id, next_id)
+        self.actions[self.pos] = np.array(action).reshape((self.n_envs, self.action_dim))
+        self.rewards[self.pos] = np.array(reward)
+        self.dones[self.pos] = np.array(done)
+        if self.handle_timeout_termination:
+            self.timeouts[self.pos] = np.array([info.get("TimeLimit.truncated", False) for info in infos])
+        if np.any(done):
+            self._last_next_id, self._last_next_obs = None, None
+        else:
+            self._last_next_id, self._last_next_obs = next_id, next_obs.copy()
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+            self.pos = 0
+
+    def reset(self) -> None:
+        super(CompactReplayBuffer, self).reset()
+        self._n_obs = 0
+        self._last_next_id, self._last_next_obs = None, None
+
+    def _n_stale(self) -> int:
+        """ nr oldest transitions whose observations were overwritten in the ring """
+        size, start = self.size(), self.pos if self.full else 0
+        oldest_valid_id = self._n_obs - self._obs_capacity
+        # the observation ids grow with the age of the transitions, binary search on the age
+        lo, hi = 0, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._obs_ids[(start + mid) % self.buffer_size, 0] < oldest_valid_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def sample(self, batch_size: int, env: Optional[VecNormalize] = None) -> ReplayBufferSamples:
+        n_stale = self._n_stale()
+        start = self.pos if self.full else 0
+        ages = n_stale + np.random.randint(0, self.size() - n_stale, size=batch_size)
+        return self._get_samples((start + ages) % self.buffer_size, env=env)
+
+    def _get_samples(self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None) -> ReplayBufferSamples:
+        obs_ids = self._obs_ids[batch_inds] % self._obs_capacity
+        data = (
+            self._normalize_obs(self._decode(self._obs[obs_ids[:, 0]]), env),
+            self.actions[batch_inds, 0, :],
+            self._normalize_obs(self._decode(self._obs[obs_ids[:, 1]]), env),
+            (self.dones[batch_inds, 0] * (1 - self.timeouts[batch_inds, 0])).reshape(-1, 1),
+            self._normalize_reward(self.rewards[batch_inds, 0].reshape(-1, 1), env),
+        )
+        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
+
+    def nbytes(self) -> int:
+        """ size of the storage in bytes """
+        return sum(a.nbytes for a in [self._obs, self._obs_ids, self.actions, self.rewards, self.dones, self.timeouts])
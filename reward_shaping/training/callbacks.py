@@ -1,3 +1,4 @@
+import json
 import pathlib
 from typing import Any, Dict, Union, Optional
 
@@ -12,6 +13,8 @@ import os
 
 from stable_baselines3.common.vec_env import sync_envs_normalization, VecEnv
 
+from reward_shaping.core.eval_cache import eval_cache_key, evaluate_with_cache, get_model_hash
+from reward_shaping.training.checkpointing import AsyncCheckpointWriter, BufferDeltas, write_atomic
 from reward_shaping.training.custom_evaluation import evaluate_policy_with_monitors
 
 
@@ -76,7 +79,16 @@ class CustomEvalCallback(EvalCallback):
             render: bool = False,
             verbose: int = 1,
             warn: bool = True,
+            cache_params: Optional[Dict[str, Any]] = None,
+            eval_seed: int = 0,
+            checkpoint_writer: Optional[AsyncCheckpointWriter] = None,
     ):
+        """
+        :param cache_params: identify the eval env in the eval cache (env name, task, env params),
+            if given the eval env is seeded with `eval_seed` before each evaluation and the results are cached
+            (see `reward_shaping.core.eval_cache`)
+        :param checkpoint_writer: if given, the best model is saved in background
+        """
         super(CustomEvalCallback, self).__init__(eval_env, callback_on_new_best, callback_after_eval,
                                                  n_eval_episodes, eval_freq, log_path,
                                                  best_model_save_path, deterministic, render, verbose, warn)
@@ -85,17 +97,33 @@ class CustomEvalCallback(EvalCallback):
         self.evaluations_metrics = {m: [] for m in self._list_of_metrics}
         # for logging
         self.log_dir = pathlib.Path(log_path)
+        self._cache_params = cache_params
+        self._eval_seed = eval_seed
+        self._checkpoint_writer = checkpoint_writer
 
-    def _on_step(self) -> bool:
+    def restore_history(self, num_timesteps: int):
+        """ restore the evaluations up to `num_timesteps` from the evaluation log (eg, to resume a training) """
+        log_path = self.log_dir / f"evaluations_{self.log_dir.name}.npz"
+        if not log_path.exists():
+            return
+        with np.load(log_path) as data:
+            keep = data["timesteps"] <= num_timesteps
+            self.evaluations_timesteps = list(data["timesteps"][keep])
+            self.evaluations_results = [list(r) for r in data["results"][keep]]
+            self.evaluations_length = [list(r) for r in data["ep_lengths"][keep]]
+            for m in self.evaluations_metrics:
+                if m in data.files:
+                    self.evaluations_metrics[m] = [list(r) for r in data[m][keep]]
+            if "successes" in data.files:
+                self.evaluations_successes = [list(r) for r in data["successes"][keep]]
+        if len(self.evaluations_results) > 0:
+            self.best_mean_reward = max(np.mean(r) for r in self.evaluations_results)
 
-        if self.eval_freq > 0 and self.n_calls % self.eval_freq == 0:
-            # Sync training and eval env if there is VecNormalize
-            sync_envs_normalization(self.training_env, self.eval_env)
-
-            # Reset success rate buffer
-            self._is_success_buffer = []
-
-            episode_rewards, episode_lengths, episode_metrics = evaluate_policy_with_monitors(
+    def _evaluate(self):
+        def evaluate():
+            if self._cache_params is not None:
+                self.eval_env.seed(self._eval_seed)
+            return evaluate_policy_with_monitors(
                 self.model,
                 self.eval_env,
                 n_eval_episodes=self.n_eval_episodes,
@@ -107,6 +135,23 @@ class CustomEvalCallback(EvalCallback):
                 list_of_metrics=self._list_of_metrics
             )
 
+        if self._cache_params is None:
+            return evaluate()
+        key = eval_cache_key(get_model_hash(self.model), n_episodes=self.n_eval_episodes, seed=self._eval_seed,
+                             deterministic=self.deterministic, **self._cache_params)
+        return evaluate_with_cache(key, evaluate)
+
+    def _on_step(self) -> bool:
+
+        if self.eval_freq > 0 and self.n_calls % self.eval_freq == 0:
+            # Sync training and eval env if there is VecNormalize
+            sync_envs_normalization(self.training_env, self.eval_env)
+
+            # Reset success rate buffer
+            self._is_success_buffer = []
+
+            episode_rewards, episode_lengths, episode_metrics = self._evaluate()
+
             if self.log_path is not None:
                 self.evaluations_timesteps.append(self.num_timesteps)
                 self.evaluations_results.append(episode_rewards)
@@ -124,15 +169,16 @@ class CustomEvalCallback(EvalCallback):
                 # note: EvalCallback set logpath to `logdir/evaluations`
                 # we prefer `logdir/evaluations_<something_identifying_experiment>` to easier post-processing
                 exp_identifier = self.log_dir.name
-                log_path = self.log_dir / f"evaluations_{exp_identifier}"
-                np.savez(
-                    str(log_path),
+                # written in a temporary file and renamed, the readers never load a partial file
+                log_path = self.log_dir / f"evaluations_{exp_identifier}.npz"
+                write_atomic(log_path, lambda file: np.savez(
+                    file,
                     timesteps=self.evaluations_timesteps,
                     results=self.evaluations_results,
                     ep_lengths=self.evaluations_length,
                     **self.evaluations_metrics,     # unpack eval metrics to
                     **kwargs,
-                )
+                ))
 
             mean_reward, std_reward = np.mean(episode_rewards), np.std(episode_rewards)
             mean_metrics = {m: np.mean(episode_metrics[m]) for m in episode_metrics}
@@ -165,7 +211,10 @@ class CustomEvalCallback(EvalCallback):
             if mean_reward > self.best_mean_reward:
                 if self.verbose > 0:
                     print("New best mean reward!")
-                if self.best_model_save_path is not None:
+                if self.best_model_save_path is not None and self._checkpoint_writer is not None:
+                    self._checkpoint_writer.save_model(self.model,
+                                                       pathlib.Path(self.best_model_save_path) / "best_model.zip")
+                elif self.best_model_save_path is not None:
                     self.model.save(os.path.join(self.best_model_save_path, "best_model"))
                 self.best_mean_reward = mean_reward
                 # Trigger callback if needed
@@ -173,3 +222,83 @@ class CustomEvalCallback(EvalCallback):
                     return self._on_event()
 
         return True
+
+
+class AsyncCheckpointCallback(BaseCallback):
+    def __init__(self, save_freq: int, save_path: pathlib.Path, name_prefix: str = "model",
+                 save_replay_buffer: bool = False, writer: Optional[AsyncCheckpointWriter] = None, verbose: int = 0):
+        """
+        Save a checkpoint of the model every `save_freq` steps, as `CheckpointCallback`, without blocking
+        the training loop: the model is written by a background thread (see `reward_shaping.training.checkpointing`).
+
+        :param save_freq: save every this nr of calls to `env.step()`
+        :param save_path: directory of the checkpoints `<name_prefix>_<steps>_steps.zip`,
+            with the states of the random generators in `rng_<steps>_steps.pkl`
+        :param save_replay_buffer: also save the rows of the replay buffer added since the last checkpoint,
+            in `replay_buffer_<steps>_steps.npz`
+        :param writer: background writer, a new one if not given
+        """
+        super().__init__(verbose)
+        self.save_freq = save_freq
+        self.save_path = pathlib.Path(save_path)
+        self.name_prefix = name_prefix
+        self.save_replay_buffer = save_replay_buffer
+        self.writer = writer if writer is not None else AsyncCheckpointWriter()
+        self.buffer_deltas = BufferDeltas()
+
+    def _init_callback(self) -> None:
+        self.save_path.mkdir(parents=True, exist_ok=True)
+
+    def _on_step(self) -> bool:
+        if self.n_calls % self.save_freq == 0:
+            path = self.save_path / f"{self.name_prefix}_{self.num_timesteps}_steps.zip"
+            self.writer.save_model(self.model, path)
+            if self.save_replay_buffer and getattr(self.model, "replay_buffer", None) is not None:
+                # note: the callback runs after `env.step()`, before the transition of this step is stored
+                n_transitions = self.num_timesteps // self.model.n_envs - 1
+                self.writer.save_buffer(self.buffer_deltas, self.model.replay_buffer, n_transitions,
+                                        self.save_path / f"replay_buffer_{self.num_timesteps}_steps.npz")
+            self.writer.save_rng_state(self.model, self.save_path / f"rng_{self.num_timesteps}_steps.pkl")
+            if self.verbose > 1:
+                print(f"Saving model checkpoint to {path}")
+        return True
+
+    def _on_training_end(self) -> None:
+        # the checkpoints are complete when `learn` returns
+        self.writer.flush()
+
+
+class ProfilingCallback(BaseCallback):
+    def __init__(self, log_freq: int, save_path: Optional[pathlib.Path] = None, verbose: int = 0):
+        """
+        Log the timings collected by the profiler of the training env (see `make_env(..., profile=True)`)
+        under `time/*`, and store the final summary in a json file.
+
+        :param log_freq: log the timings every log_freq calls of the callback
+        :param save_path: path of the json summary written at the end of training
+        """
+        super(ProfilingCallback, self).__init__(verbose)
+        self._log_freq = log_freq
+        self._save_path = save_path
+
+    def _get_summaries(self):
+        # profiler copies are returned for subprocess envs, then it works for any vec env
+        return [profiler.summary() for profiler in self.training_env.get_attr("profiler")]
+
+    def _on_step(self) -> bool:
+        if self._log_freq > 0 and self.n_calls % self._log_freq == 0:
+            for i, summary in enumerate(self._get_summaries()):
+                prefix = "time" if i == 0 else f"time/env{i}"
+                for name, stats in summary.items():
+                    self.logger.record(f"{prefix}/{name}_self_ms", stats["mean_self_ms"])
+                    self.logger.record(f"{prefix}/{name}_cum_ms", stats["mean_cum_ms"])
+                    self.logger.record(f"{prefix}/{name}_calls", stats["calls"], exclude="tensorboard")
+        return True
+
+    def _on_training_end(self) -> None:
+        if self._save_path is not None:
+            summaries = self._get_summaries()
+            with open(self._save_path, "w") as file:
+                json.dump(summaries[0] if len(summaries) == 1 else summaries, file, indent=2)
+            if self.verbose > 0:
+                print(f"[Info] Profiling summary saved in {self._save_path}")
@@ -0,0 +1,313 @@
+import os
+import pathlib
+import pickle
+import queue
+import random
+import re
+import threading
+import warnings
+import zipfile
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import stable_baselines3 as sb3
+import torch as th
+from stable_baselines3.common.save_util import data_to_json, load_from_zip_file, recursive_getattr, recursive_setattr
+from stable_baselines3.common.utils import get_system_info
+
+from reward_shaping.training.buffers import CompactReplayBuffer
+
+"""
+Checkpoints written in a background thread, to not stall the training loop.
+
+The training thread takes an in-memory snapshot of the model: the attributes serialized as in `BaseAlgorithm.save`
+and a cpu copy of the state dicts (policy, optimizers) and torch variables. The writer thread zips the snapshot
+in the format of `BaseAlgorithm.save` (loadable with `<Algo>.load`), fsyncs it and renames it to the destination,
+so that a checkpoint file is either complete or absent. The queue of pending writes is bounded: when it is full,
+the training thread waits for the writer.
+
+Replay buffer checkpoints are incremental: each file `replay_buffer_<steps>_steps.npz` stores the rows written
+since the previous checkpoint, and the files whose rows were all overwritten by later ones are removed.
+`BufferDeltas.restore` applies the files in order of steps (see `get_buffer_checkpoints`).
+
+Each checkpoint also stores the states of the random generators (`rng_<steps>_steps.pkl`), to resume a training
+from its last complete checkpoint (see `find_resume_step` and `restore_model`).
+"""
+
+MODEL_FILE_REGEX = r"model_(\d+)_steps\.zip$"
+BUFFER_FILE_REGEX = r"replay_buffer_(\d+)_steps\.npz$"
+RNG_FILE_REGEX = r"rng_(\d+)_steps\.pkl$"
+# training progress restored from a checkpoint, the other attributes of the model are rebuilt from the hparams
+RESUMED_ATTRIBUTES = ["num_timesteps", "_n_updates", "_episode_num", "ep_info_buffer", "ep_success_buffer"]
+
+
+def _to_cpu(obj: Any) -> Any:
+    """ copy of the tensors of a (nested) state dict on the cpu """
+    if isinstance(obj, th.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: _to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(v) for v in obj)
+    return obj
+
+
+def write_atomic(path: pathlib.Path, write: Callable[[Any], None]):
+    """ write the file with `write(file)` in a temporary file, fsync it and rename it to the path """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_file, "wb") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_file, path)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def snapshot_model(model) -> Dict[str, Any]:
+    """ in-memory snapshot of a sb3 model, with the content of `BaseAlgorithm.save` """
+    data = model.__dict__.copy()
+    exclude = set(model._excluded_save_params())
+    state_dicts_names, torch_variable_names = model._get_torch_save_params()
+    for name in state_dicts_names + torch_variable_names:
+        exclude.add(name.split(".")[0])
+    for name in exclude:
+        data.pop(name, None)
+    pytorch_variables = {name: recursive_getattr(model, name) for name in torch_variable_names}
+    return {"data": data_to_json(data), "params": _to_cpu(model.get_parameters()),
+            "pytorch_variables": _to_cpu(pytorch_variables)}
+
+
+def write_model_snapshot(snapshot: Dict[str, Any], path: pathlib.Path):
+    """ write a model snapshot as the zip file of `BaseAlgorithm.save` """
+
+    def write(file):
+        with zipfile.ZipFile(file, mode="w") as archive:
+            archive.writestr("data", snapshot["data"])
+            with archive.open("pytorch_variables.pth", mode="w") as pytorch_variables_file:
+                th.save(snapshot["pytorch_variables"], pytorch_variables_file)
+            for file_name, state_dict in snapshot["params"].items():
+                with archive.open(file_name + ".pth", mode="w") as param_file:
+                    th.save(state_dict, param_file)
+            archive.writestr("_stable_baselines3_version", sb3.__version__)
+            archive.writestr("system_info.txt", get_system_info(print_info=False)[1])
+
+    write_atomic(pathlib.Path(path), write)
+
+
+def _buffer_arrays(buffer, n_transitions: int) -> Dict[str, Tuple[np.ndarray, int]]:
+    """ arrays of a replay buffer, with the nr rows written in each of them (rows are written as a ring) """
+    if isinstance(buffer, CompactReplayBuffer):
+        arrays = {"_obs": (buffer._obs, buffer._n_obs)}
+        names = ["_obs_ids", "actions", "rewards", "dones", "timeouts"]
+    else:
+        arrays = {}
+        names = ["observations", "actions", "rewards", "dones", "timeouts"]
+        if not buffer.optimize_memory_usage:
+            names.append("next_observations")
+    arrays.update({name: (getattr(buffer, name), n_transitions) for name in names})
+    return arrays
+
+
+def _buffer_state(buffer) -> Dict[str, np.ndarray]:
+    state = {"pos": np.array(buffer.pos), "full": np.array(buffer.full)}
+    if isinstance(buffer, CompactReplayBuffer):
+        state["_n_obs"] = np.array(buffer._n_obs)
+        state["_last_next_id"] = np.array(-1 if buffer._last_next_id is None else buffer._last_next_id)
+        state["_last_next_obs"] = np.zeros(0) if buffer._last_next_obs is None else buffer._last_next_obs.copy()
+    return state
+
+
+def _set_buffer_state(buffer, state: Dict[str, np.ndarray]):
+    buffer.pos, buffer.full = int(state["pos"]), bool(state["full"])
+    if isinstance(buffer, CompactReplayBuffer):
+        buffer._n_obs = int(state["_n_obs"])
+        buffer._last_next_id = None if int(state["_last_next_id"]) < 0 else int(state["_last_next_id"])
+        buffer._last_next_obs = None if state["_last_next_obs"].size == 0 else state["_last_next_obs"]
+
+
+class BufferDeltas:
+    """
+    Incremental checkpoints of a replay buffer.
+
+    The nr of transitions added to the buffer is given by the caller (the training timesteps per env),
+    the buffer must be checkpointed at least once per `buffer_size` transitions to not miss rows.
+    """
+
+    def __init__(self):
+        # nr rows written in each array at the last checkpoint written to disk, size of the arrays
+        self._written, self._capacity = {}, {}
+        # checkpoint files, with the nr rows written in each array at their snapshot
+        self._files = []
+
+    def snapshot(self, buffer, n_transitions: int) -> Dict[str, np.ndarray]:
+        """
+        rows written since the last checkpoint written to disk, with their indices and the nr rows written so far.
+        The counters advance only when the snapshot is written: the rows of a failed write are in the next snapshot.
+        """
+        delta = {f"state.{k}": v for k, v in _buffer_state(buffer).items()}
+        for name, (array, written) in _buffer_arrays(buffer, n_transitions).items():
+            first = max(self._written.get(name, 0), written - len(array))
+            rows = np.arange(first, written) % len(array)
+            delta[name] = array[rows]
+            delta[f"rows.{name}"] = rows
+            delta[f"written.{name}"] = np.array(written)
+            self._capacity[name] = len(array)
+        return delta
+
+    def write(self, delta: Dict[str, np.ndarray], path: pathlib.Path):
+        """ write a snapshot, then remove the previous files whose rows were all overwritten since then """
+        path = pathlib.Path(path)
+        write_atomic(path, lambda file: np.savez(file, **delta))
+        written = {k[len("written."):]: int(v) for k, v in delta.items() if k.startswith("written.")}
+        self._written.update(written)
+        kept = []
+        for old_path, old_written in self._files:
+            # the last row of the old file is overwritten after `capacity` more rows
+            if all(written[n] - self._capacity[n] >= old_written.get(n, 0) for n in written):
+                old_path.unlink(missing_ok=True)
+            else:
+                kept.append((old_path, old_written))
+        self._files = kept + [(path, written)]
+
+    def restore(self, buffer, files: List[pathlib.Path]):
+        """ apply the checkpoint files in order, the state (eg, position) is the one of the last file """
+        state = None
+        for path in files:
+            with np.load(path) as delta:
+                for name, (array, _) in _buffer_arrays(buffer, 0).items():
+                    array[delta[f"rows.{name}"]] = delta[name]
+                    self._written[name], self._capacity[name] = int(delta[f"written.{name}"]), len(array)
+                state = {k[len("state."):]: delta[k] for k in delta.files if k.startswith("state.")}
+            self._files.append((pathlib.Path(path), dict(self._written)))
+        if state is not None:
+            _set_buffer_state(buffer, state)
+
+
+def _files_by_steps(checkpoint_dir: pathlib.Path, regex: str) -> Dict[int, pathlib.Path]:
+    files = [(int(m.group(1)), f) for f in pathlib.Path(checkpoint_dir).glob("*_steps.*")
+             for m in [re.search(regex, f.name)] if m]
+    return dict(sorted(files))
+
+
+def get_buffer_checkpoints(checkpoint_dir: pathlib.Path, max_steps: Optional[int] = None) -> List[pathlib.Path]:
+    """ replay buffer checkpoint files of a directory, ordered by steps (up to `max_steps` if given) """
+    return [f for steps, f in _files_by_steps(checkpoint_dir, BUFFER_FILE_REGEX).items()
+            if max_steps is None or steps <= max_steps]
+
+
+def snapshot_rng_state(model) -> Dict[str, Any]:
+    """ states of the random generators of the training (python, numpy, torch, sampling of the action space) """
+    state = {"random": random.getstate(), "numpy": np.random.get_state(), "torch": th.get_rng_state()}
+    if th.cuda.is_available():
+        state["torch_cuda"] = th.cuda.get_rng_state_all()
+    np_random = getattr(model.action_space, "np_random", None)
+    if np_random is not None:
+        state["action_space"] = np_random.get_state()
+    return state
+
+
+def restore_rng_state(model, state: Dict[str, Any]):
+    random.setstate(state["random"])
+    np.random.set_state(state["numpy"])
+    th.set_rng_state(state["torch"])
+    if "torch_cuda" in state and th.cuda.is_available():
+        th.cuda.set_rng_state_all(state["torch_cuda"])
+    if "action_space" in state:
+        model.action_space.np_random.set_state(state["action_space"])
+
+
+def find_resume_step(checkpoint_dir: pathlib.Path, with_buffer: bool = False) -> Optional[int]:
+    """ steps of the last complete checkpoint (model, rng states and, if required, replay buffer), None if any """
+    regexes = [MODEL_FILE_REGEX, RNG_FILE_REGEX] + ([BUFFER_FILE_REGEX] if with_buffer else [])
+    steps = set.intersection(*[set(_files_by_steps(checkpoint_dir, regex)) for regex in regexes])
+    return max(steps, default=None)
+
+
+def restore_model(model, checkpoint_dir: pathlib.Path, steps: int, buffer_deltas: Optional[BufferDeltas] = None):
+    """
+    Restore in-place a model created from the same hparams (see `make_agent`) from the checkpoint at `steps`:
+    parameters and optimizers, training progress, random generators and, if `buffer_deltas`, the replay buffer.
+    The training env starts a new episode.
+    """
+    checkpoint_dir = pathlib.Path(checkpoint_dir)
+    data, params, pytorch_variables = load_from_zip_file(checkpoint_dir / f"model_{steps}_steps.zip",
+                                                         device=model.device)
+    # as `BaseAlgorithm.load`, without rebuilding the model
+    model.set_parameters(params, exact_match=True, device=model.device)
+    for name, variable in (pytorch_variables or {}).items():
+        if variable is not None:
+            recursive_setattr(model, name + ".data", variable.data)
+    for name in RESUMED_ATTRIBUTES:
+        if name in data:
+            setattr(model, name, data[name])
+    model._last_obs, model._last_original_obs = None, None
+    if buffer_deltas is not None:
+        buffer_deltas.restore(model.replay_buffer, get_buffer_checkpoints(checkpoint_dir, max_steps=steps))
+        # the files after the checkpoint would be applied on top of the next ones
+        for buffer_steps, path in _files_by_steps(checkpoint_dir, BUFFER_FILE_REGEX).items():
+            if buffer_steps > steps:
+                path.unlink()
+    with open(checkpoint_dir / f"rng_{steps}_steps.pkl", "rb") as file:
+        restore_rng_state(model, pickle.load(file))
+
+
+class AsyncCheckpointWriter:
+    """
+    Background thread writing the checkpoints submitted by the training thread.
+
+    @param: max_pending: bound of the queue of pending writes, `submit` blocks when it is full
+    """
+
+    def __init__(self, max_pending: int = 2):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                job()
+            except Exception as error:
+                warnings.warn(f"checkpoint not written: {error}", RuntimeWarning)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, write: Callable[[], None]):
+        if not self._thread.is_alive():
+            raise RuntimeError("the checkpoint writer is closed")
+        self._queue.put(write)
+
+    def save_model(self, model, path: pathlib.Path):
+        """ snapshot the model now, write it to `path` (.zip) in background """
+        snapshot = snapshot_model(model)
+        self.submit(lambda: write_model_snapshot(snapshot, path))
+
+    def save_buffer(self, deltas: BufferDeltas, buffer, n_transitions: int, path: pathlib.Path):
+        """ snapshot the rows of the buffer written since the previous checkpoint, write them in background """
+        delta = deltas.snapshot(buffer, n_transitions)
+        self.submit(lambda: deltas.write(delta, path))
+
+    def save_rng_state(self, model, path: pathlib.Path):
+        state = snapshot_rng_state(model)
+        self.submit(lambda: write_atomic(pathlib.Path(path), lambda file: pickle.dump(state, file)))
+
+    def flush(self):
+        """ wait for the pending writes """
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
@@ -0,0 +1,22 @@
+import pathlib
+
+import yaml
+
+"""
+Training args of a run, dumped by `train.make_log_dirs` in `<logdir>/args.yml` as an argparse namespace.
+This module only depends on yaml, so that the log tools can read the args without loading the training stack.
+"""
+
+
+class _RunArgsLoader(yaml.SafeLoader):
+    """ safe loader of `args.yml`, where the training args are dumped as an argparse namespace """
+
+
+_RunArgsLoader.add_constructor("tag:yaml.org,2002:python/object:argparse.Namespace",
+                               lambda loader, node: loader.construct_mapping(node, deep=True))
+
+
+def load_run_args(rundir: pathlib.Path) -> dict:
+    """ training args (env, task, reward, algo, seed, ...) stored in the `args.yml` of a run """
+    with open(pathlib.Path(rundir) / "args.yml", "r") as file:
+        return yaml.load(file, _RunArgsLoader)
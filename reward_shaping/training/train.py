@@ -1,12 +1,14 @@
 import pathlib
+import shutil
 import time
+import warnings
 from argparse import Namespace
 
 import yaml
 from gym.wrappers import Monitor
-from stable_baselines3.common.callbacks import EvalCallback, CheckpointCallback
 
-from .callbacks import VideoRecorderCallback, CustomEvalCallback
+from .callbacks import VideoRecorderCallback, CustomEvalCallback, ProfilingCallback, AsyncCheckpointCallback
+from .checkpointing import find_resume_step, restore_model
 from .utils import make_env, make_agent
 
 
@@ -27,18 +29,25 @@ def make_log_dirs(args):
     return logdir, checkpointdir
 
 
-def get_callbacks(env, logdir, checkpointdir, train_params, novideo):
+def get_callbacks(env, logdir, checkpointdir, train_params, novideo, profile=False, cache_params=None,
+                  checkpoint_buffer=False, resume=False):
+    # checkpoints are written in background, the eval callback shares the writer for the best model
+    checkpoint_cb = AsyncCheckpointCallback(save_freq=train_params['checkpoint_every'], save_path=checkpointdir,
+                                            name_prefix='model', save_replay_buffer=checkpoint_buffer)
     eval_cb = CustomEvalCallback(env, eval_freq=train_params['eval_every'],
                                  n_eval_episodes=train_params['n_eval_episodes'],
                                  log_path=logdir,
-                                 deterministic=True, render=False)
-    checkpoint_cb = CheckpointCallback(save_freq=train_params['checkpoint_every'], save_path=checkpointdir,
-                                       name_prefix='model')
+                                 deterministic=True, render=False, cache_params=cache_params,
+                                 checkpoint_writer=checkpoint_cb.writer)
     callbacks = [eval_cb, checkpoint_cb]
     if not novideo:
-        video_cb = VideoRecorderCallback(Monitor(env, logdir / "videos"), render_freq=train_params['video_every'],
+        video_cb = VideoRecorderCallback(Monitor(env, logdir / "videos", resume=resume),
+                                         render_freq=train_params['video_every'],
                                          n_eval_episodes=train_params['n_recorded_episodes'])
         callbacks.append(video_cb)
+    if profile:
+        profile_cb = ProfilingCallback(log_freq=train_params['eval_every'], save_path=logdir / "profile.json")
+        callbacks.append(profile_cb)
     return callbacks
 
 
@@ -59,20 +68,60 @@ def evaluate(env, agent, steps):
     print(f"[Rollout {steps} steps] Result: episodes: {len(rewards)}, mean reward: {sum(rewards) / len(rewards)}")
 
 
-def train(env, task, reward, train_params, algo="sac", seed=0, expdir=None, novideo=False):
+def resume_training(model, callbacks, checkpointdir, checkpoint_buffer=False):
+    """ restore the model and the callbacks from the last complete checkpoint of the run """
+    steps = find_resume_step(checkpointdir, with_buffer=checkpoint_buffer)
+    if steps is None:
+        raise FileNotFoundError(f"no complete checkpoint to resume in {checkpointdir}")
+    if not checkpoint_buffer and getattr(model, "replay_buffer", None) is not None:
+        warnings.warn("the replay buffer was not checkpointed (-checkpoint_buffer), it restarts empty")
+    checkpoint_cb = next(cb for cb in callbacks if isinstance(cb, AsyncCheckpointCallback))
+    restore_model(model, checkpointdir, steps, buffer_deltas=checkpoint_cb.buffer_deltas if checkpoint_buffer else None)
+    for callback in callbacks:
+        # the periodic callbacks count the steps from the start of the training
+        callback.n_calls = model.num_timesteps // model.n_envs
+        if isinstance(callback, CustomEvalCallback):
+            callback.restore_history(model.num_timesteps)
+    print(f"[Info] Resume training from the checkpoint at {steps} steps")
+
+
+def train(env, task, reward, train_params, algo="sac", seed=0, expdir=None, novideo=False, profile=False,
+          record=False, eval_cache=False, buffer_dtype=None, buffer_dir=None, checkpoint_buffer=False, resume=None):
+    """
+    @param: resume: logdir of a run to resume from its last checkpoint, the args must be the ones of the run
+                    (see `run_args.load_run_args`)
+    """
     # logs
-    args = Namespace(env=env, task=task, reward=reward, algo=algo, seed=seed, expdir=expdir, novideo=novideo)
-    logdir, checkpointdir = make_log_dirs(args)
+    args = Namespace(env=env, task=task, reward=reward, algo=algo, seed=seed, expdir=expdir, novideo=novideo,
+                     profile=profile, steps=train_params['steps'], record=record, eval_cache=eval_cache,
+                     buffer_dtype=buffer_dtype, buffer_dir=buffer_dir, checkpoint_buffer=checkpoint_buffer)
+    if resume is None:
+        logdir, checkpointdir = make_log_dirs(args)
+    else:
+        logdir, checkpointdir = pathlib.Path(resume), pathlib.Path(resume) / "checkpoint"
     # prepare envs
-    train_env, trainenv_params = make_env(env, task, reward, eval=False, logdir=logdir, seed=seed)
-    eval_env, evalenv_params = make_env(env, task, reward="eval", eval=True, seed=seed)
-    # create agent
-    model = make_agent(env, train_env, reward, algo, logdir)
+    record_dir = logdir / "trajectories" if record else None
+    train_env, trainenv_params = make_env(env, task, reward, eval=False, logdir=logdir, seed=seed, profile=profile,
+                                          record_dir=record_dir, check=True)
+    eval_env, evalenv_params = make_env(env, task, reward="eval", eval=True, seed=seed, check=True)
+    # create agent, the memory-mapped replay buffer is a scratch dir of the run
+    buffer_params = None
+    if buffer_dtype is not None or buffer_dir is not None:
+        storage_dir = pathlib.Path(buffer_dir) / logdir.name if buffer_dir is not None else None
+        buffer_params = {"obs_dtype": buffer_dtype or "float32", "storage_dir": storage_dir}
+    model = make_agent(env, train_env, reward, algo, logdir, buffer_params=buffer_params)
     # train
-    callbacks = get_callbacks(eval_env, logdir, checkpointdir, train_params, novideo)
-    model.learn(total_timesteps=train_params['steps'], callback=callbacks)
+    cache_params = {"env_name": env, "task": task, "env_params": evalenv_params} if eval_cache else None
+    callbacks = get_callbacks(eval_env, logdir, checkpointdir, train_params, novideo, profile, cache_params,
+                              checkpoint_buffer, resume=resume is not None)
+    if resume is not None:
+        resume_training(model, callbacks, checkpointdir, checkpoint_buffer)
+    model.learn(total_timesteps=train_params['steps'] - model.num_timesteps, callback=callbacks,
+                reset_num_timesteps=resume is None)
     # evaluation
     evaluate(eval_env, model, steps=1600)
     # close envs
     train_env.close()
     eval_env.close()
+    if buffer_params is not None and buffer_params["storage_dir"] is not None:
+        shutil.rmtree(buffer_params["storage_dir"], ignore_errors=True)
@@ -3,7 +3,6 @@ import pathlib
 
 import yaml
 from gym.wrappers import FlattenObservation
-from stable_baselines3.common.env_checker import check_env
 
 from reward_shaping.core.wrappers import RewardWrapper
 from reward_shaping.envs.wrappers import FlattenAction, FrameSkip, DeltaSpeedWrapper
@@ -11,7 +10,7 @@ from reward_shaping.envs.wrappers import ActionHistoryWrapper, ObservationHistor
 from reward_shaping.monitor.task import RLTask
 
 
-def make_env(env_name, task, reward, eval=False, logdir=None, seed=0):
+def make_env(env_name, task, reward, eval=False, logdir=None, seed=0, profile=False, record_dir=None, check=False):
     # make base env
     extra_params = load_eval_params(env_name, task) if eval else {}
     extra_params['seed'] = seed
@@ -23,10 +22,21 @@ def make_env(env_name, task, reward, eval=False, logdir=None, seed=0):
     env = make_base_env(env_name, task, env_params)
     # set reward
     env = make_reward_wrap(env_name, env, env_params, reward)
+    if record_dir is not None:
+        # record the original observations and infos, before filtering and flattening
+        from reward_shaping.core.recording import TrajectoryRecorder
+        env = TrajectoryRecorder(env, directory=record_dir)
     env = make_observation_wrap(env_name, env, env_params)
     env = FlattenObservation(env)
     env = FlattenAction(env)
-    check_env(env)
+    if check:
+        # check the env api once, in the training process: the env workers do not load torch
+        from stable_baselines3.common.env_checker import check_env
+        check_env(env)
+    if profile:
+        # time each layer of the wrapper stack, the profiler is reachable as `env.profiler`
+        from reward_shaping.core.profiling import insert_profiling_wrappers
+        env = insert_profiling_wrappers(env)
     return env, env_params
 
 
@@ -56,31 +66,31 @@ def load_eval_params(env, task):
 def make_base_env(env, task, env_params={}):
     if env == "cart_pole_obst":
         from reward_shaping.envs import CartPoleContObsEnv
-        from reward_shaping.envs.cart_pole_obst.specs import get_all_specs
+        from reward_shaping.envs.cart_pole_obst.specs import get_all_specs, compile_specs
         env = CartPoleContObsEnv(**env_params)
         specs = [(k, op, build_pred(env_params)) for k, (op, build_pred) in get_all_specs().items()]
-        env = RLTask(env=env, requirements=specs)
+        env = RLTask(env=env, requirements=specs, compiled=compile_specs(env_params))
     elif env == "bipedal_walker":
         from reward_shaping.envs import BipedalWalker
-        from reward_shaping.envs.bipedal_walker.specs import get_all_specs
+        from reward_shaping.envs.bipedal_walker.specs import get_all_specs, compile_specs
         env = BipedalWalker(**env_params)
         specs = [(k, op, build_pred(env_params)) for k, (op, build_pred) in get_all_specs().items()]
-        env = RLTask(env=env, requirements=specs)
+        env = RLTask(env=env, requirements=specs, compiled=compile_specs(env_params))
     elif env == "lunar_lander":
         from reward_shaping.envs import LunarLanderContinuous
-        from reward_shaping.envs.lunar_lander.specs import get_all_specs
+        from reward_shaping.envs.lunar_lander.specs import get_all_specs, compile_specs
         env = LunarLanderContinuous(**env_params)
         specs = [(k, op, build_pred(env_params)) for k, (op, build_pred) in get_all_specs().items()]
-        env = RLTask(env=env, requirements=specs)
+        env = RLTask(env=env, requirements=specs, compiled=compile_specs(env_params))
     elif "racecar" in env:
         # base env for either racecar or racecar2
         if env == "racecar":
             from reward_shaping.envs.racecar.single_agent_racecar_env import RacecarEnv
-            from reward_shaping.envs.racecar.specs import get_all_specs
+            from reward_shaping.envs.racecar.specs import get_all_specs, compile_specs
             env = RacecarEnv(**env_params)
         else:
             from reward_shaping.envs.racecar2.multi_agent_racecar_env import MultiAgentRacecarEnv
-            from reward_shaping.envs.racecar2.specs import get_all_specs
+            from reward_shaping.envs.racecar2.specs import get_all_specs, compile_specs
             env = MultiAgentRacecarEnv(**env_params)
 
         # skip frame to match hardware frequency
@@ -94,13 +104,17 @@ def make_base_env(env, task, env_params={}):
             env = DeltaSpeedWrapper(env, **env_params)
 
         specs = [(k, op, build_pred(env_params)) for k, (op, build_pred) in get_all_specs().items()]
-        env = RLTask(env=env, requirements=specs)
+        env = RLTask(env=env, requirements=specs, compiled=compile_specs(env_params))
     else:
         raise NotImplementedError(f"not implemented env for {env}")
     return env
 
 
-def make_agent(env_name, env, reward, rl_algo, logdir=None):
+def make_agent(env_name, env, reward, rl_algo, logdir=None, buffer_params=None):
+    """
+    @param: buffer_params: if given, use a `CompactReplayBuffer` with these params (obs_dtype, storage_dir),
+                           only for off-policy algos (sac, ddpg, td3)
+    """
     policy = "MlpPolicy"
     # load model parameters
     algo = rl_algo.split("_", 1)[0]
@@ -113,19 +127,26 @@ def make_agent(env_name, env, reward, rl_algo, logdir=None):
     if 'tl' in reward:
         # propagate the terminal reward over all the states in the episode
         algo_params['gamma'] = 1.0
+    # replay buffer, not dumped with the algo params
+    buffer_kwargs = {}
+    if buffer_params is not None:
+        if algo not in ["sac", "ddpg", "td3"]:
+            raise ValueError(f"replay buffer params require an off-policy algo, got {algo}")
+        from reward_shaping.training.buffers import CompactReplayBuffer
+        buffer_kwargs = {"replay_buffer_class": CompactReplayBuffer, "replay_buffer_kwargs": dict(buffer_params)}
     # create model
     if algo == "ppo":
         from stable_baselines3 import PPO
         model = PPO(policy, env, verbose=1, tensorboard_log=logdir, **algo_params)
     elif algo == "sac":
         from stable_baselines3 import SAC
-        model = SAC(policy, env, verbose=1, tensorboard_log=logdir, **algo_params)
+        model = SAC(policy, env, verbose=1, tensorboard_log=logdir, **algo_params, **buffer_kwargs)
     elif algo == "ddpg":
         from stable_baselines3 import DDPG
-        model = DDPG(policy, env, verbose=1, tensorboard_log=logdir, **algo_params)
+        model = DDPG(policy, env, verbose=1, tensorboard_log=logdir, **algo_params, **buffer_kwargs)
     elif algo == "td3":
         from stable_baselines3 import TD3
-        model = TD3(policy, env, verbose=1, tensorboard_log=logdir, **algo_params)
+        model = TD3(policy, env, verbose=1, tensorboard_log=logdir, **algo_params, **buffer_kwargs)
     else:
         raise NotImplementedError()
     # copy params in logdir (optional)
@@ -2,34 +2,80 @@ import argparse as parser
 
 import numpy as np
 
-from reward_shaping.training.train import train
+
+def get_train_params(env, steps):
+    video_every = (steps - 1) if env == "f1tenth" else int(steps / 10)  # f1tenth only once at the end
+    return {'steps': steps,
+            'video_every': video_every,  # note: causes trouble with containers, one can disable it wt -novideo
+            'n_recorded_episodes': 2,
+            'eval_every': min(10000, int(steps / 10)),
+            'n_eval_episodes': 10,
+            'checkpoint_every': int(steps / 10)}
+
+
+def resume(args):
+    from reward_shaping.training.run_args import load_run_args
+    from reward_shaping.training.train import train
+    # the args of the run, `steps` is not stored by older runs
+    run_args = load_run_args(args.resume)
+    train_params = get_train_params(run_args["env"], run_args.get("steps", args.steps))
+    train(run_args["env"], run_args["task"], run_args["reward"], train_params, algo=run_args["algo"],
+          seed=run_args["seed"],
+          expdir=run_args["expdir"],
+          novideo=run_args["novideo"],
+          profile=run_args.get("profile", False),
+          record=run_args.get("record", False),
+          eval_cache=run_args.get("eval_cache", False),
+          buffer_dtype=run_args.get("buffer_dtype"),
+          buffer_dir=run_args.get("buffer_dir"),
+          checkpoint_buffer=run_args.get("checkpoint_buffer", False),
+          resume=args.resume)
 
 
 def main(args):
-    video_every = (args.steps - 1) if args.env == "f1tenth" else int(args.steps / 10)  # f1tenth only once at the end
-    train_params = {'steps': args.steps,
-                    'video_every': video_every,  # note: causes trouble with containers, one can disable it wt -novideo
-                    'n_recorded_episodes': 2,
-                    'eval_every': min(10000, int(args.steps / 10)),
-                    'n_eval_episodes': 10,
-                    'checkpoint_every': int(args.steps / 10)}
+    # deferred import of the training stack (sb3, torch), to not pay it when only parsing args (e.g., --help)
+    from reward_shaping.training.train import train
+    train_params = get_train_params(args.env, args.steps)
     for seed in range(args.n_seeds):
         train(args.env, args.task, args.reward, train_params, algo=args.algo,
               seed=np.random.randint(low=0, high=1000000),
               expdir=args.expdir,
-              novideo=args.novideo)
+              novideo=args.novideo,
+              profile=args.profile,
+              record=args.record,
+              eval_cache=args.eval_cache,
+              buffer_dtype=args.buffer_dtype,
+              buffer_dir=args.buffer_dir,
+              checkpoint_buffer=args.checkpoint_buffer)
 
 
 if __name__ == "__main__":
     envs = ['cart_pole_obst', 'bipedal_walker', 'lunar_lander', 'racecar', 'racecar2']
     parser = parser.ArgumentParser()
-    parser.add_argument("--env", type=str, required=True, choices=envs)
-    parser.add_argument("--task", type=str, required=True, help="task executed for the env")
-    parser.add_argument("--reward", type=str, required=True, help="identifier of reward definition")
+    parser.add_argument("--env", type=str, choices=envs)
+    parser.add_argument("--task", type=str, help="task executed for the env")
+    parser.add_argument("--reward", type=str, help="identifier of reward definition")
     parser.add_argument("--steps", type=int, default=1e6, help="nr training steps")
     parser.add_argument("--n_seeds", type=int, default=1, help="nr runs, each with a different rnd seed")
     parser.add_argument("--algo", type=str, default="sac", help="rl algorithm used for training")
     parser.add_argument("--expdir", type=str, default=None, help="name of intermediate dir to group experiments")
     parser.add_argument("-novideo", action="store_true", help="disable recording of videos during training")
+    parser.add_argument("-profile", action="store_true", help="time each wrapper of the training env")
+    parser.add_argument("-record", action="store_true", help="record the training episodes in the logdir")
+    parser.add_argument("-eval_cache", action="store_true",
+                        help="evaluate from a fixed seed and cache the results (see reward_shaping/core/eval_cache.py)")
+    parser.add_argument("--buffer_dtype", type=str, default=None, choices=["float32", "float16", "uint8"],
+                        help="compact replay buffer storing the observations in this type (off-policy algos)")
+    parser.add_argument("--buffer_dir", type=str, default=None,
+                        help="memory-map the compact replay buffer in this dir, removed after training")
+    parser.add_argument("-checkpoint_buffer", action="store_true",
+                        help="checkpoint also the replay buffer, incrementally (off-policy algos)")
+    parser.add_argument("--resume", type=str, default=None,
+                        help="logdir of a run to resume from its last checkpoint, with the args of the run")
     args = parser.parse_args()
-    main(args)
+    if args.resume is not None:
+        resume(args)
+    else:
+        if args.env is None or args.task is None or args.reward is None:
+            parser.error("the arguments --env, --task, --reward are required")
+        main(args)
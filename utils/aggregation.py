@@ -0,0 +1,99 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+"""
+Binned aggregation of learning curves.
+
+The data points (x, y) of all the runs of a curve are assigned to bins of width `binning` along x,
+where bin k covers the interval (k * binning, (k + 1) * binning] and it is labelled by its right edge.
+Statistics are computed with `np.bincount` over the bin indices, without grouping data points in python.
+"""
+
+# max nr of bootstrap resamples drawn at once, bounds the memory to chunk x nr points
+_BOOTSTRAP_CHUNK = 256
+
+
+def get_bins(xx: np.ndarray, binning: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    @return: right edges of the bins, index of the bin of each point (-1 if out of bins, ie x <= 0)
+    """
+    edges = np.arange(0, np.max(xx) + binning, binning)
+    # point in (edges[k-1], edges[k]] has searchsorted index k, ie bin k-1
+    bin_ids = np.searchsorted(edges, xx, side="left") - 1
+    bin_ids[(bin_ids < 0) | (bin_ids >= len(edges) - 1)] = -1
+    return edges[1:], bin_ids
+
+
+def binned_mean_std(bin_ids: np.ndarray, yy: np.ndarray, n_bins: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Mean and sample std (ddof=1) of the values in each bin, nan for empty bins (and std of single values).
+
+    @return: counts, mean, std per bin
+    """
+    valid = bin_ids >= 0
+    bin_ids, yy = bin_ids[valid], yy[valid]
+    counts = np.bincount(bin_ids, minlength=n_bins).astype(np.float64)
+    sums = np.bincount(bin_ids, weights=yy, minlength=n_bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / counts
+        # sum of squares around the bin mean, more accurate than the raw second moment
+        sq_dev = np.bincount(bin_ids, weights=(yy - mean[bin_ids]) ** 2, minlength=n_bins)
+        std = np.sqrt(sq_dev / (counts - 1))
+    std[counts < 2] = np.nan
+    return counts, mean, std
+
+
+def bootstrap_ci(bin_ids: np.ndarray, yy: np.ndarray, n_bins: int, confidence: float = 0.95, n_boot: int = 1000,
+                 seed: Optional[int] = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Percentile bootstrap confidence interval of the mean of each bin.
+
+    All the bins are resampled together: each point is replaced by a random point of its own bin,
+    then the means of the resampled bins are computed with `np.add.reduceat` on the points sorted by bin.
+
+    @return: lower and upper bound per bin, nan for empty bins
+    """
+    valid = bin_ids >= 0
+    order = np.argsort(bin_ids[valid], kind="stable")
+    sorted_ids, sorted_yy = bin_ids[valid][order], yy[valid][order]
+    counts = np.bincount(sorted_ids, minlength=n_bins)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    nonempty = np.flatnonzero(counts)
+    lower, upper = np.full(n_bins, np.nan), np.full(n_bins, np.nan)
+    if len(nonempty) == 0:
+        return lower, upper
+    rng = np.random.default_rng(seed)
+    point_starts, point_counts = starts[sorted_ids], counts[sorted_ids]
+    boot_means = np.empty((n_boot, len(nonempty)))
+    for b in range(0, n_boot, _BOOTSTRAP_CHUNK):
+        n = min(_BOOTSTRAP_CHUNK, n_boot - b)
+        resampled = point_starts + (rng.random((n, len(sorted_yy))) * point_counts).astype(np.int64)
+        boot_means[b:b + n] = np.add.reduceat(sorted_yy[resampled], starts[nonempty], axis=1) / counts[nonempty]
+    alpha = (1.0 - confidence) / 2
+    lower[nonempty], upper[nonempty] = np.quantile(boot_means, [alpha, 1.0 - alpha], axis=0)
+    return lower, upper
+
+
+def aggregate_binned(xx: np.ndarray, yy: np.ndarray, binning: float, confidence: Optional[float] = None,
+                     n_boot: int = 1000, seed: Optional[int] = 0) -> Dict[str, np.ndarray]:
+    """
+    Aggregate the data points of a curve in bins, the curve starts from the origin (0, 0).
+
+    @param: confidence: if given, add the bootstrap confidence interval of the mean (`ci_low`, `ci_high`)
+    @return: dictionary with x (right edge of the bins), mean, std, (ci_low, ci_high), nan for empty bins
+    """
+    xx, yy = np.asarray(xx, dtype=np.float64), np.asarray(yy, dtype=np.float64)
+    edges, bin_ids = get_bins(xx, binning)
+    n_bins = len(edges)
+    _, mean, std = binned_mean_std(bin_ids, yy, n_bins)
+    stats = {"x": edges, "mean": mean, "std": std}
+    if confidence is not None:
+        stats["ci_low"], stats["ci_high"] = bootstrap_ci(bin_ids, yy, n_bins, confidence, n_boot, seed)
+    # prepend the origin in preallocated arrays
+    data = {}
+    for name, values in stats.items():
+        data[name] = np.empty(n_bins + 1)
+        data[name][0] = 0.0
+        data[name][1:] = values
+    return data
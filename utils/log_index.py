@@ -0,0 +1,247 @@
+import json
+import os
+import pathlib
+import shutil
+import warnings
+import zipfile
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from reward_shaping.training.run_args import load_run_args
+from utils.scores import compute_scores
+from utils.utils import find_run_dir, parse_env_task, parse_reward
+
+"""
+Consolidated index of the evaluation logs (`evaluations*.npz`) of a log tree.
+
+Each npz file is loaded once, then the index is stored in `<logdir>/.eval_index`:
+    runs.json                       one entry per npz file: path, mtime, size, run metadata (env, task, reward,
+                                    algo, seed), metrics and rows of the file in the long table
+    gen_<k>/<column>.npy            long table, one row per (file, evaluation, metric):
+                                    run (file index), timestep, metric (index in `metrics`), value, n_episodes
+
+The value of a row is the mean over the evaluation episodes (eg, `results` of shape (n_evals, n_episodes)).
+The policy assessment scores of each evaluation (`score_S`, `score_S+T`, `score_S+T+C`, see `utils.scores`)
+are computed from the per-episode requirement counters at loading, and indexed as the other metrics.
+At each refresh, only the new or modified files (by mtime and size) are loaded, the removed files are dropped.
+"""
+
+INDEX_DIR = ".eval_index"
+INDEX_VERSION = 2
+FILE_REGEX = "evaluations*.npz"
+COLUMNS = {"run": np.int32, "timestep": np.int64, "metric": np.int32, "value": np.float64, "n_episodes": np.int32}
+# errors of a missing, truncated or malformed log file, which is skipped
+LOAD_ERRORS = (OSError, ValueError, KeyError, zipfile.BadZipFile, EOFError)
+
+
+def _run_metadata(filepath: pathlib.Path) -> Dict[str, Any]:
+    """ env, task, reward of the run from its `args.yml` if any, otherwise parsed from the path """
+    rundir = find_run_dir(filepath.parent)
+    if rundir is not None:
+        run_args = load_run_args(rundir)
+        return {k: run_args.get(k) for k in ["env", "task", "reward", "algo", "seed"]}
+    metadata = {"env": None, "task": None, "reward": None, "algo": None, "seed": None}
+    try:
+        metadata["env"], metadata["task"] = parse_env_task(str(filepath))
+        metadata["reward"] = parse_reward(str(filepath))
+    except ValueError:
+        pass
+    return metadata
+
+
+def load_evaluation_file(filepath: pathlib.Path) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """
+    Load an evaluation log, the metrics are averaged over the episodes of each evaluation,
+    the scores are computed on the episodes before averaging.
+
+    @return: metrics (name -> array of n_evals values), timesteps of the evaluations
+    """
+    with np.load(filepath) as data:
+        timesteps = np.asarray(data["timesteps"], dtype=np.int64)
+        metrics = {}
+        for name in data.files:
+            if name == "timesteps":
+                continue
+            values = np.asarray(data[name], dtype=np.float64)
+            if values.ndim == 0 or len(values) != len(timesteps):
+                warnings.warn(f"metric {name} in {filepath} does not match the evaluation timesteps, skipped")
+                continue
+            n_episodes = values.shape[-1] if values.ndim > 1 else 1
+            metrics[name] = (values.reshape(len(values), -1).mean(axis=-1), n_episodes)
+        for name, values in compute_scores({name: data[name] for name in data.files}).items():
+            metrics[name] = (values, np.shape(data["ep_lengths"])[-1])
+    return metrics, timesteps
+
+
+class EvalLogIndex:
+    """
+    Index of the evaluation logs in `logdir`, refreshed at creation.
+
+    @param: logdir: root of the log tree
+    @param: refresh: if false, use the stored index without looking for new or modified files
+    @param: n_workers: nr threads loading the files (decompression and io release the gil)
+    """
+
+    def __init__(self, logdir: pathlib.Path, refresh: bool = True, n_workers: int = 1):
+        self._logdir = pathlib.Path(logdir)
+        self._n_workers = n_workers
+        self._dir = self._logdir / INDEX_DIR
+        self._runs, self._metrics, self._generation = [], [], 0
+        self._columns = {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._load()
+        if refresh:
+            self.refresh()
+
+    @property
+    def runs(self) -> List[Dict[str, Any]]:
+        return self._runs
+
+    @property
+    def metrics(self) -> List[str]:
+        return self._metrics
+
+    @property
+    def directory(self) -> pathlib.Path:
+        """ directory of the stored index """
+        return self._dir
+
+    @property
+    def generation(self) -> int:
+        """ incremented at each change of the stored index """
+        return self._generation
+
+    def _load(self):
+        try:
+            with open(self._dir / "runs.json", "r") as file:
+                index = json.load(file)
+            if index["version"] != INDEX_VERSION:
+                return
+            gen_dir = self._dir / f"gen_{index['generation']}"
+            columns = {name: np.load(gen_dir / f"{name}.npy", mmap_mode="r") for name in COLUMNS}
+        except (OSError, ValueError, KeyError):
+            # missing or incompatible index, it is rebuilt
+            return
+        self._runs, self._metrics, self._generation = index["runs"], index["metrics"], index["generation"]
+        self._columns = columns
+
+    def refresh(self) -> Tuple[int, int]:
+        """
+        Load the new and modified evaluation files, drop the removed ones.
+
+        @return: nr loaded files, nr removed files
+        """
+        stored = {run["path"]: run for run in self._runs}
+        files = {}
+        for filepath in sorted(self._logdir.rglob(FILE_REGEX)):
+            if INDEX_DIR in filepath.parts:
+                continue
+            stat = filepath.stat()
+            files[str(filepath.relative_to(self._logdir))] = (stat.st_mtime_ns, stat.st_size)
+        unchanged = [path for path, (mtime, size) in files.items()
+                     if path in stored and (stored[path]["mtime_ns"], stored[path]["size"]) == (mtime, size)]
+        to_load = [path for path in files if path not in unchanged]
+        n_removed = len([path for path in stored if path not in files])
+        if len(to_load) == 0 and n_removed == 0:
+            return 0, 0
+        # keep the rows of the unchanged files, append the new ones
+        runs, parts, metric_ids = [], [], {name: i for i, name in enumerate(self._metrics)}
+        for path in unchanged:
+            run = stored[path]
+            rows = {name: np.asarray(column[run["offset"]:run["offset"] + run["length"]])
+                    for name, column in self._columns.items()}
+            rows["run"] = np.full(run["length"], len(runs), dtype=COLUMNS["run"])
+            runs.append(dict(run, id=len(runs)))
+            parts.append(rows)
+        for path, loaded in zip(to_load, self._load_files(to_load)):
+            if isinstance(loaded, Exception):
+                warnings.warn(f"cannot load {path}, skipped: {loaded}")
+                continue
+            metrics, timesteps = loaded
+            rows = {name: [] for name in COLUMNS}
+            for name, (values, n_episodes) in metrics.items():
+                metric_id = metric_ids.setdefault(name, len(metric_ids))
+                rows["run"].append(np.full(len(values), len(runs)))
+                rows["timestep"].append(timesteps)
+                rows["metric"].append(np.full(len(values), metric_id))
+                rows["value"].append(values)
+                rows["n_episodes"].append(np.full(len(values), n_episodes))
+            rows = {name: np.concatenate(parts_).astype(COLUMNS[name]) if parts_ else np.zeros(0, COLUMNS[name])
+                    for name, parts_ in rows.items()}
+            mtime, size = files[path]
+            runs.append(dict(_run_metadata(self._logdir / path), id=len(runs), path=path, mtime_ns=mtime, size=size,
+                             metrics=list(metrics.keys()), n_evals=len(timesteps)))
+            parts.append(rows)
+        # offsets of the runs in the new long table
+        offset = 0
+        for run, rows in zip(runs, parts):
+            run["offset"], run["length"] = offset, len(rows["run"])
+            offset += run["length"]
+        self._runs = runs
+        self._metrics = sorted(metric_ids, key=metric_ids.get)
+        self._columns = {name: np.concatenate([rows[name] for rows in parts]) if parts else np.zeros(0, dtype)
+                         for name, dtype in COLUMNS.items()}
+        self._store()
+        return len(to_load), n_removed
+
+    def _load_file(self, path: str):
+        try:
+            return load_evaluation_file(self._logdir / path)
+        except LOAD_ERRORS as error:
+            return error
+
+    def _load_files(self, paths: List[str]) -> List:
+        if self._n_workers <= 1 or len(paths) <= 1:
+            return [self._load_file(path) for path in paths]
+        from multiprocessing.pool import ThreadPool
+        with ThreadPool(self._n_workers) as pool:
+            return pool.map(self._load_file, paths)
+
+    def _store(self):
+        """ write a new generation of the columns, then switch the index to it """
+        generation = self._generation + 1
+        gen_dir = self._dir / f"gen_{generation}"
+        try:
+            shutil.rmtree(gen_dir, ignore_errors=True)
+            gen_dir.mkdir(parents=True)
+            for name, column in self._columns.items():
+                np.save(gen_dir / f"{name}.npy", column)
+            tmp_file = self._dir / f"runs.{os.getpid()}.tmp"
+            with open(tmp_file, "w") as file:
+                json.dump({"version": INDEX_VERSION, "generation": generation, "metrics": self._metrics,
+                           "runs": self._runs}, file)
+            os.replace(tmp_file, self._dir / "runs.json")
+        except OSError as error:
+            warnings.warn(f"evaluation index not stored in {self._dir}: {error}")
+            return
+        self._generation = generation
+        for old_dir in self._dir.glob("gen_*"):
+            if old_dir != gen_dir:
+                shutil.rmtree(old_dir, ignore_errors=True)
+
+    def select(self, regex: str = "**", exclude: Optional[str] = "skip") -> List[Dict[str, Any]]:
+        """ runs of the files matching `<logdir>/<regex>/evaluations*.npz`, except paths containing `exclude` """
+        paths = {str(f.relative_to(self._logdir)) for f in self._logdir.glob(f"{regex}/{FILE_REGEX}")}
+        return [run for run in self._runs if run["path"] in paths and (exclude is None or exclude not in run["path"])]
+
+    def select_files(self, files: List[pathlib.Path]) -> List[Dict[str, Any]]:
+        """ runs of the given evaluation files (eg, selected in the run catalog) """
+        paths = {str(pathlib.Path(f).resolve().relative_to(self._logdir.resolve())) for f in files}
+        return [run for run in self._runs if run["path"] in paths]
+
+    def get_metric(self, run: Dict[str, Any], metric: str) -> Tuple[np.ndarray, np.ndarray]:
+        """ timesteps and values (mean over the episodes) of a metric of a run """
+        rows = slice(run["offset"], run["offset"] + run["length"])
+        mask = np.asarray(self._columns["metric"][rows]) == self._metrics.index(metric) \
+            if metric in self._metrics else np.zeros(run["length"], dtype=bool)
+        return np.asarray(self._columns["timestep"][rows][mask]), np.asarray(self._columns["value"][rows][mask])
+
+    def to_table(self, runs: Optional[List[Dict[str, Any]]] = None) -> Dict[str, np.ndarray]:
+        """ long table of the given runs (all if None), as columns with the metric names """
+        runs = self._runs if runs is None else runs
+        rows = np.concatenate([np.arange(r["offset"], r["offset"] + r["length"]) for r in runs]) if runs else \
+            np.zeros(0, dtype=np.int64)
+        table = {name: np.asarray(column)[rows] for name, column in self._columns.items()}
+        table["metric"] = np.array(self._metrics, dtype=object)[table["metric"]] if len(rows) > 0 else \
+            np.zeros(0, dtype=object)
+        return table
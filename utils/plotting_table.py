@@ -1,170 +1,47 @@
+import argparse
+import hashlib
+import json
+import os
+import pathlib
 import time
+from typing import Any, Dict, List
 
 import numpy as np
 
-all_scores = {
-    "Safe Driving": {
-        "Shaped": {
-            "S": 0.74,
-            "S+T": 0.74,
-            "S+T+C": 0.20,
-        },
-        "TLTL": {
-            "S": 0.38,
-            "S+T": 0.32,
-            "S+T+C": 0.10,
-        },
-        "BHNR": {
-            "S": 0.00,
-            "S+T": 0.00,
-            "S+T+C": 0.00,
-        },
-        "MORL(unif.)": {
-            "S": 0.99,
-            "S+T": 0.69,
-            "S+T+C": 0.32,
-        },
-        "MORL(decr.)": {
-            "S": 0.96,
-            "S+T": 0.75,
-            "S+T+C": 0.35,
-        },
-        "HPRS": {
-            "S": 0.97,
-            "S+T": 0.73,
-            "S+T+C": 0.33,
-        },
-    },
-    "Follow Leading Vehicle": {
-        "Shaped": {
-            "S": 0.97,
-            "S+T": 0.97,
-            "S+T+C": 0.34,
-        },
-        "TLTL": {
-            "S": 0.94,
-            "S+T": 0.12,
-            "S+T+C": 0.06,
-        },
-        "BHNR": {
-            "S": 0.31,
-            "S+T": 0.00,
-            "S+T+C": 0.00,
-        },
-        "MORL(unif.)": {
-            "S": 0.74,
-            "S+T": 0.73,
-            "S+T+C": 0.35,
-        },
-        "MORL(decr.)": {
-            "S": 0.82,
-            "S+T": 0.81,
-            "S+T+C": 0.37,
-        },
-        "HPRS": {
-            "S": 1.00,
-            "S+T": 0.99,
-            "S+T+C": 0.46,
-        },
-    },
-    "Lunar Lander": {
-        "Shaped": {
-            "S": 0.98,
-            "S+T": 0.72,
-            "S+T+C": 0.72,
-        },
-        "TLTL": {
-            "S": 0.92,
-            "S+T": 0.00,
-            "S+T+C": 0.00,
-        },
-        "BHNR": {
-            "S": 0.51,
-            "S+T": 0.49,
-            "S+T+C": 0.49,
-        },
-        "MORL(unif.)": {
-            "S": 0.91,
-            "S+T": 0.91,
-            "S+T+C": 0.90,
-        },
-        "MORL(decr.)": {
-            "S": 0.94,
-            "S+T": 0.91,
-            "S+T+C": 0.91,
-        },
-        "HPRS": {
-            "S": 0.91,
-            "S+T": 0.91,
-            "S+T+C": 0.89,
-        }
-    },
-    "Bipedal Walker": {
-        "Shaped": {
-            "S": 0.99,
-            "S+T": 0.99,
-            "S+T+C": 0.51,
-        },
-        "TLTL": {
-            "S": 0.96,
-            "S+T": 0.45,
-            "S+T+C": 0.27,
-        },
-        "BHNR": {
-            "S": 0.21,
-            "S+T": 0.00,
-            "S+T+C": 0.00,
-        },
-        "MORL(unif.)": {
-            "S": 0.40,
-            "S+T": 0.40,
-            "S+T+C": 0.19,
-        },
-        "MORL(decr.)": {
-            "S": 0.43,
-            "S+T": 0.43,
-            "S+T+C": 0.20,
-        },
-        "HPRS": {
-            "S": 0.96,
-            "S+T": 0.96,
-            "S+T+C": 0.48,
-        }
-    },
-    "Bipedal Walker (Hardcore)": {
-        "Shaped": {
-            "S": 0.84,
-            "S+T": 0.29,
-            "S+T+C": 0.17,
-        },
-        "TLTL": {
-            "S": 0.98,
-            "S+T": 0.00,
-            "S+T+C": 0.00,
-        },
-        "BHNR": {
-            "S": 0.55,
-            "S+T": 0.00,
-            "S+T+C": 0.00,
-        },
-        "MORL(unif.)": {
-            "S": 0.07,
-            "S+T": 0.03,
-            "S+T+C": 0.02,
-        },
-        "MORL(decr.)": {
-            "S": 0.06,
-            "S+T": 0.03,
-            "S+T+C": 0.02,
-        },
-        "HPRS": {
-            "S": 0.85,
-            "S+T": 0.85,
-            "S+T+C": 0.44,
-        }
-    },
+from utils.log_index import EvalLogIndex
+from utils.run_catalog import select_runs
+from utils.scores import SCORES, SCORE_PREFIX
+
+"""
+Table of the policy assessment scores (S, S+T, S+T+C, see `utils.scores`) of each task and reward shaping,
+computed from the evaluation logs of a log tree, and bar plot of the scores relative to the Shaped reward.
+
+The score of a run is its score at the last evaluation (or the best one), then the scores of the runs
+are averaged per (task, reward). The table is cached with the evaluation index, and recomputed only
+when the index changes.
+
+To run (from the repository root):
+    python -m utils.plotting_table --logdir logs --score S+T+C -save
+"""
+
+TASK_LABELS = {
+    "racecar_drive_delta": "Safe Driving",
+    "racecar2_follow_delta": "Follow Leading Vehicle",
+    "lunar_lander_land": "Lunar Lander",
+    "bipedal_walker_forward": "Bipedal Walker",
+    "bipedal_walker_hardcore": "Bipedal Walker (Hardcore)",
 }
 
+# note: the order of the bars, the reference `Shaped` first
+REWARD_LABELS = {
+    'default': 'Shaped',
+    'tltl': 'TLTL',
+    'bhnr': 'BHNR',
+    'morl_uni': 'MORL(unif.)',
+    'morl_dec': 'MORL(decr.)',
+    'hprs': 'HPRS',
+    'hrs_pot': 'HPRS',
+}
 
 COLORS = {
     'Shaped': '#377eb8',
@@ -186,71 +63,208 @@ HATCHES = {
 
 LARGESIZE, MEDIUMSIZE, SMALLSIZE = 16, 13, 10
 
-import matplotlib.pyplot as plt
-
-plt.rcParams.update({'font.size': LARGESIZE})
-plt.rcParams.update({'axes.titlesize': LARGESIZE})
-plt.rcParams.update({'axes.labelsize': MEDIUMSIZE})
-plt.rcParams.update({'xtick.labelsize': MEDIUMSIZE})
-plt.rcParams.update({'ytick.labelsize': SMALLSIZE})
-plt.rcParams.update({'legend.fontsize': MEDIUMSIZE})
-plt.rcParams.update({'figure.titlesize': LARGESIZE})
-
-# plot the above scores into a bar plot
-# where each group of bars is a task, each bar is a reward shaping method,
-# and each bar is the score denoted by "S", "S+T", or "S+T+C".
-# normalize the performance as relative w.r.t. the performance of Shaped.
-
-
-save = True
-score_to_show = "S+T+C"
-tasks = list(all_scores.keys())
-shapings = list(all_scores[tasks[0]].keys())
-
-# get the scores
-scores = []
-for task, methods in all_scores.items():
-    bars = []
-    for method, results in methods.items():
-        bars.append(results[score_to_show])
-    scores.append(bars)
-
-# plot the scores
-fig, ax = plt.subplots(figsize=(15, 5))
-x = list(range(len(scores)))
-width = 0.15
-
-for i, task_scores in enumerate(scores):
-    for j, score in enumerate(task_scores):
-        if shapings[j] == "Shaped":
+TABLE_CACHE = "tables.json"
+
+
+def _run_group(run: Dict[str, Any]):
+    """ (task label, reward label) of a run of the index, None if the run has no training args """
+    if run["env"] is None or run["reward"] is None:
+        return None
+    task = f"{run['env']}_{run['task']}"
+    return TASK_LABELS.get(task, task), REWARD_LABELS.get(run["reward"], run["reward"])
+
+
+def compute_scores_table(index: EvalLogIndex, runs: List[Dict[str, Any]], at: str = "last", best_by: str = "S+T+C"):
+    """
+    Mean score of the runs of each (task, reward), with a vectorized group-by over the long table of the index.
+
+    @param: at: scores of a run at its 'last' evaluation, or at its 'best' one
+    @param: best_by: score selecting the best evaluation of a run, all the scores are reported at that evaluation
+    @return: scores[task][reward][score], nr runs[task][reward]
+    """
+    groups = sorted({g for g in map(_run_group, runs) if g is not None})
+    group_of_run = np.full(max([r["id"] for r in runs], default=-1) + 1, -1)
+    for run in runs:
+        group = _run_group(run)
+        if group is not None:
+            group_of_run[run["id"]] = groups.index(group)
+    table = index.to_table(runs)
+    best_timestep = None
+    if at == "best":
+        # timestep of the best evaluation of each run (the first one, if tied), -1 for the runs without the score
+        selected = table["metric"] == f"{SCORE_PREFIX}{best_by}"
+        run_ids, timesteps, values = table["run"][selected], table["timestep"][selected], table["value"][selected]
+        order = np.lexsort((timesteps, -values, run_ids))
+        run_ids, timesteps = run_ids[order], timesteps[order]
+        run_starts = np.flatnonzero(np.r_[True, run_ids[1:] != run_ids[:-1]]) if len(run_ids) > 0 else \
+            np.zeros(0, dtype=np.int64)
+        best_timestep = np.full(len(group_of_run), -1, dtype=np.int64)
+        best_timestep[run_ids[run_starts]] = timesteps[run_starts]
+    scores, counts = {}, {}
+    for score in SCORES:
+        selected = table["metric"] == f"{SCORE_PREFIX}{score}"
+        if best_timestep is not None:
+            # all the scores of a run from the same evaluation
+            selected &= table["timestep"] == best_timestep[table["run"]]
+        run_ids, timesteps, values = table["run"][selected], table["timestep"][selected], table["value"][selected]
+        # sort by run and timestep, then take one value per run
+        order = np.lexsort((timesteps, run_ids))
+        run_ids, values = run_ids[order], values[order]
+        run_ends = np.flatnonzero(np.r_[run_ids[1:] != run_ids[:-1], True]) if len(run_ids) > 0 else \
+            np.zeros(0, dtype=np.int64)
+        run_values = values[run_ends]
+        run_groups = group_of_run[run_ids[run_ends]]
+        valid = run_groups >= 0
+        sums = np.bincount(run_groups[valid], weights=run_values[valid], minlength=len(groups))
+        n_runs = np.bincount(run_groups[valid], minlength=len(groups))
+        for (task, reward), total, n in zip(groups, sums, n_runs):
+            if n > 0:
+                scores.setdefault(task, {}).setdefault(reward, {})[score] = float(total / n)
+                counts.setdefault(task, {})[reward] = int(n)
+    return scores, counts
+
+
+def get_scores_table(index: EvalLogIndex, runs: List[Dict[str, Any]], at: str = "last", best_by: str = "S+T+C"):
+    """ scores table of the runs, from the cache of the index if it did not change """
+    key = hashlib.sha256(json.dumps([index.generation, sorted(r["path"] for r in runs), at,
+                                     best_by if at == "best" else None]).encode()).hexdigest()
+    cache_file = index.directory / TABLE_CACHE
+    try:
+        with open(cache_file, "r") as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        cache = {}
+    if key in cache:
+        return cache[key]["scores"], cache[key]["counts"]
+    scores, counts = compute_scores_table(index, runs, at, best_by)
+    # keep only the tables of the current index
+    cache = {k: v for k, v in cache.items() if v["generation"] == index.generation}
+    cache[key] = {"generation": index.generation, "scores": scores, "counts": counts}
+    try:
+        index.directory.mkdir(parents=True, exist_ok=True)
+        tmp_file = index.directory / f"{TABLE_CACHE}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as file:
+            json.dump(cache, file)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+    return scores, counts
+
+
+def print_table(scores, counts):
+    shapings = [s for s in dict.fromkeys(REWARD_LABELS.values()) if any(s in v for v in scores.values())]
+    print(f"{'task':<28}" + "".join(f"{s:>22}" for s in shapings))
+    for task, methods in scores.items():
+        cells = []
+        for shaping in shapings:
+            if shaping not in methods:
+                cells.append(f"{'-':>22}")
+                continue
+            values = "/".join(f"{methods[shaping].get(s, np.nan):.2f}" for s in SCORES)
+            cells.append(f"{values} ({counts[task][shaping]})".rjust(22))
+        print(f"{task:<28}" + "".join(cells))
+    print(f"scores: {' / '.join(SCORES)} (nr runs)")
+
+
+def plot_scores(all_scores, score_to_show: str, fig=None):
+    """
+    plot the scores into a bar plot, where each group of bars is a task, each bar is a reward shaping method.
+    normalize the performance as relative w.r.t. the performance of Shaped.
+    """
+    import matplotlib.pyplot as plt
+
+    plt.rcParams.update({'font.size': LARGESIZE})
+    plt.rcParams.update({'axes.titlesize': LARGESIZE})
+    plt.rcParams.update({'axes.labelsize': MEDIUMSIZE})
+    plt.rcParams.update({'xtick.labelsize': MEDIUMSIZE})
+    plt.rcParams.update({'ytick.labelsize': SMALLSIZE})
+    plt.rcParams.update({'legend.fontsize': MEDIUMSIZE})
+    plt.rcParams.update({'figure.titlesize': LARGESIZE})
+
+    tasks = [t for t in TASK_LABELS.values() if t in all_scores] + \
+            [t for t in all_scores if t not in TASK_LABELS.values()]
+    shapings = [s for s in dict.fromkeys(REWARD_LABELS.values())]
+
+    # get the scores, nan for missing runs
+    scores = np.array([[all_scores[task].get(method, {}).get(score_to_show, np.nan) for method in shapings]
+                       for task in tasks]).reshape(len(tasks), len(shapings))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rel_scores = -1 + scores / scores[:, :1]
+
+    # plot the scores
+    if fig is None:
+        fig = plt.figure(figsize=(15, 5))
+    fig.clear()
+    ax = fig.add_subplot()
+    x = np.arange(len(tasks))
+    width = 0.15
+    for j, shaping in enumerate(shapings):
+        if shaping == "Shaped":
             continue
-        offset = (j - len(tasks)/2) * width
-        rel_score = -1 + score / scores[i][0]
-        if i == 0:
-            ax.bar(x[i] + offset, rel_score, width, label=shapings[j], color=COLORS[shapings[j]],
-                   edgecolor='black', linewidth=1, hatch=HATCHES[shapings[j]])
-        else:
-            ax.bar(x[i] + offset, rel_score, width, color=COLORS[shapings[j]],
-                   edgecolor='black', linewidth=1, hatch=HATCHES[shapings[j]])
-
-ax.hlines(0, -0.50, len(tasks)-0.40, linestyles="dashed", colors="k", label="Shaped")
-
-ax.set_ylim(-1.7, 1.7)
-ax.set_ylabel('Rel. Performance to Shaped (%)')
-ax.set_xticks(x)
-ax.set_xticklabels(tasks)
-
-# remove box
-ax.spines['top'].set_visible(False)
-ax.spines['right'].set_visible(False)
-
-# place legend outside of the plot, horizontally centered below
-# more margin from the plot
-handles, labels = ax.get_legend_handles_labels()
-fig.legend(handles, labels, loc='lower center', ncol=len(shapings), bbox_to_anchor=(0.5, 0.0))
-plt.subplots_adjust(bottom=0.2)
-
-if save:
-    plt.savefig(f"barplot_scores_{time.time()}.pdf", bbox_inches='tight')
-else:
-    plt.show()
+        offset = (j - len(tasks) / 2) * width
+        ax.bar(x + offset, rel_scores[:, j], width, label=shaping, color=COLORS.get(shaping),
+               edgecolor='black', linewidth=1, hatch=HATCHES.get(shaping))
+
+    ax.hlines(0, -0.50, len(tasks) - 0.40, linestyles="dashed", colors="k", label="Shaped")
+
+    ax.set_ylim(-1.7, 1.7)
+    ax.set_ylabel('Rel. Performance to Shaped (%)')
+    ax.set_xticks(x)
+    ax.set_xticklabels(tasks)
+
+    # remove box
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+
+    # place legend outside of the plot, horizontally centered below
+    # more margin from the plot
+    handles, labels = ax.get_legend_handles_labels()
+    fig.legend(handles, labels, loc='lower center', ncol=len(shapings), bbox_to_anchor=(0.5, 0.0))
+    fig.subplots_adjust(bottom=0.2)
+    return fig
+
+
+def main(args):
+    import matplotlib.pyplot as plt
+
+    index = EvalLogIndex(args.logdir, n_workers=args.n_workers)
+    outfile = args.logdir / "plots" / f"barplot_scores_{int(time.time())}.pdf"
+    fig = None
+    while True:
+        runs = [r for selection in (args.query or args.regex)
+                for r in select_runs(index, args.logdir, selection, query=args.query is not None)]
+        scores, counts = get_scores_table(index, list({r["id"]: r for r in runs}.values()), at=args.at,
+                                          best_by=args.score)
+        print_table(scores, counts)
+        fig = plot_scores(scores, args.score, fig)
+        if args.save:
+            outfile.parent.mkdir(parents=True, exist_ok=True)
+            fig.savefig(outfile, bbox_inches='tight')
+            print(f"[Info] Figure saved in {outfile}")
+        if args.watch <= 0:
+            break
+        # streaming: redraw while the runs are training, the index only loads the modified logs
+        plt.pause(args.watch)
+        n_loaded, n_removed = index.refresh()
+        print(f"[{time.strftime('%H:%M:%S')}] updated logs: {n_loaded}, removed logs: {n_removed}")
+    if not args.save:
+        plt.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logdir", type=pathlib.Path, required=True)
+    parser.add_argument("--regex", type=str, default=["**"], nargs="+",
+                        help="runs of the files `{logdir}/{regex}/evaluations*.npz`")
+    parser.add_argument("--query", type=str, default=None, nargs="+",
+                        help="instead of regex, sql conditions on the run catalog (see utils/run_catalog.py)")
+    parser.add_argument("--score", type=str, default="S+T+C", choices=SCORES,
+                        help="score in the bar plot, and selecting the best evaluation")
+    parser.add_argument("--at", type=str, default="last", choices=["last", "best"],
+                        help="scores of a run at its last evaluation or at the best one (by --score)")
+    parser.add_argument("--watch", type=float, default=0,
+                        help="if positive, refresh the table and the plot every this nr of seconds")
+    parser.add_argument("--n_workers", type=int, default=1, help="nr threads loading the new evaluation files")
+    parser.add_argument("-save", action="store_true")
+    args = parser.parse_args()
+    main(args)
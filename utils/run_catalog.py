@@ -0,0 +1,237 @@
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import warnings
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from reward_shaping.training.run_args import load_run_args
+from utils.log_index import EvalLogIndex, FILE_REGEX, LOAD_ERRORS, load_evaluation_file
+
+"""
+Catalog of the training runs of a log tree, in a local sqlite database (by default `<logdir>/runs.sqlite`).
+
+A run is a directory with `args.yml` (see `make_log_dirs`). The catalog stores:
+    runs            training args (env, task, reward, algo, seed, expdir), creation time, task and algo params
+                    (the yml dumps in the run dir), location of the evaluation log and of the best model
+    metrics         final and best value of each evaluation metric (mean over the eval episodes)
+    checkpoints     location and training steps of each checkpoint
+
+The scan is incremental: a run is updated only if one of its files changed (by mtime and size).
+"""
+
+CATALOG_FILE = "runs.sqlite"
+# bump to rebuild the catalog when the schema or the cataloged metrics change
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    env TEXT, task TEXT, reward TEXT, algo TEXT, seed INTEGER, expdir TEXT,
+    created INTEGER,
+    args TEXT, task_params TEXT, algo_params TEXT,
+    eval_file TEXT, best_model TEXT, n_evals INTEGER, last_timestep INTEGER,
+    signature TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_env_task_reward ON runs (env, task, reward, algo);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    final REAL, best REAL, best_timestep INTEGER,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS metrics_name ON metrics (name, final);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    steps INTEGER,
+    PRIMARY KEY (run_id, path)
+);
+"""
+
+
+def get_catalog_path(logdir: pathlib.Path) -> pathlib.Path:
+    return pathlib.Path(logdir) / CATALOG_FILE
+
+
+def _read_text(file: pathlib.Path) -> Optional[str]:
+    return file.read_text() if file.exists() else None
+
+
+def _run_files(rundir: pathlib.Path) -> Dict[str, Any]:
+    eval_files = sorted(rundir.glob(FILE_REGEX))
+    best_models = sorted(rundir.rglob("best_model.zip"))
+    return {"args": rundir / "args.yml",
+            "eval_file": eval_files[-1] if eval_files else None,
+            "best_model": best_models[0] if best_models else None,
+            "checkpoints": sorted((rundir / "checkpoint").glob("model_*.zip"))}
+
+
+def _signature(files: Dict[str, Any]) -> str:
+    """ mtime and size of the files of a run, the run is updated when it changes """
+    stats = []
+    for file in [files["args"], files["eval_file"], files["best_model"]] + files["checkpoints"]:
+        if file is not None:
+            stat = file.stat()
+            stats.append([str(file), stat.st_mtime_ns, stat.st_size])
+    return json.dumps(stats)
+
+
+def _final_and_best(eval_file: pathlib.Path) -> Tuple[Dict[str, Tuple[float, float, int]], int, int]:
+    """ @return: (final, best, timestep of best) per metric, nr evaluations, last timestep """
+    metrics, timesteps = load_evaluation_file(eval_file)
+    if len(timesteps) == 0:
+        return {}, 0, None
+    results = {}
+    for name, (values, _) in metrics.items():
+        best = int(np.argmax(values))
+        results[name] = (float(values[-1]), float(values[best]), int(timesteps[best]))
+    return results, len(timesteps), int(timesteps[-1])
+
+
+class RunCatalog:
+    """
+    Sqlite catalog of training runs.
+
+    @param: db_path: database file, created if it does not exist
+    """
+
+    def __init__(self, db_path: pathlib.Path):
+        self._db_path = pathlib.Path(db_path)
+        self._db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self._db_path))
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            # older schema, the catalog is rebuilt by the next scan
+            self._conn.executescript("DROP TABLE IF EXISTS checkpoints; DROP TABLE IF EXISTS metrics; "
+                                     "DROP TABLE IF EXISTS runs;")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def scan(self, logdir: pathlib.Path) -> Tuple[int, int]:
+        """
+        Add the new runs of the log tree, update the modified ones and remove the deleted ones.
+
+        @return: nr added or updated runs, nr removed runs
+        """
+        logdir = pathlib.Path(logdir).resolve()
+        prefix = f"{logdir}{os.sep}"
+        stored = {row["path"]: row["signature"] for row in
+                  self._conn.execute("SELECT path, signature FROM runs WHERE substr(path, 1, ?) = ?",
+                                     (len(prefix), prefix))}
+        n_updated, found = 0, set()
+        with self._conn:
+            for args_file in sorted(logdir.rglob("args.yml")):
+                rundir = args_file.parent
+                found.add(str(rundir))
+                files = _run_files(rundir)
+                signature = _signature(files)
+                if stored.get(str(rundir)) == signature:
+                    continue
+                try:
+                    self._add_run(rundir, files, signature)
+                except LOAD_ERRORS as error:
+                    warnings.warn(f"run {rundir} not cataloged: {error}")
+                    continue
+                n_updated += 1
+            removed = [path for path in stored if path not in found]
+            self._conn.executemany("DELETE FROM runs WHERE path = ?", [(path,) for path in removed])
+        return n_updated, len(removed)
+
+    def _add_run(self, rundir: pathlib.Path, files: Dict[str, Any], signature: str):
+        run_args = load_run_args(rundir)
+        created = re.search(r"_(\d+)$", rundir.name)
+        metrics, n_evals, last_timestep = _final_and_best(files["eval_file"]) if files["eval_file"] else ({}, 0, None)
+        self._conn.execute("DELETE FROM runs WHERE path = ?", (str(rundir),))
+        cursor = self._conn.execute(
+            "INSERT INTO runs (path, env, task, reward, algo, seed, expdir, created, args, task_params, algo_params, "
+            "eval_file, best_model, n_evals, last_timestep, signature) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, "
+            "?, ?, ?)",
+            (str(rundir), run_args.get("env"), run_args.get("task"), run_args.get("reward"), run_args.get("algo"),
+             run_args.get("seed"), run_args.get("expdir"), int(created.group(1)) if created else None,
+             json.dumps(run_args, default=str), _read_text(rundir / f"{run_args.get('task')}.yml"),
+             _read_text(rundir / f"{run_args.get('algo')}.yml"),
+             str(files["eval_file"]) if files["eval_file"] else None,
+             str(files["best_model"]) if files["best_model"] else None, n_evals, last_timestep, signature))
+        run_id = cursor.lastrowid
+        self._conn.executemany("INSERT INTO metrics (run_id, name, final, best, best_timestep) VALUES (?, ?, ?, ?, ?)",
+                               [(run_id, name, *values) for name, values in metrics.items()])
+        steps = [re.search(r"model_(\d+)_steps", checkpoint.name) for checkpoint in files["checkpoints"]]
+        self._conn.executemany("INSERT INTO checkpoints (run_id, path, steps) VALUES (?, ?, ?)",
+                               [(run_id, str(checkpoint), int(s.group(1)) if s else None)
+                                for checkpoint, s in zip(files["checkpoints"], steps)])
+
+    def select_runs(self, where: Optional[str] = None, params: Tuple = (), under: Optional[pathlib.Path] = None,
+                    **filters) -> List[Dict[str, Any]]:
+        """
+        Select runs by training args (eg, `env="racecar", reward="hprs"`) and an optional sql condition
+        on the `runs` table (eg, `where="seed < ?", params=(3,)`).
+
+        @param: under: only runs in this directory
+        @return: runs as dictionaries, ordered by env, task, reward, algo, seed
+        """
+        conditions, values = [], []
+        for column, value in filters.items():
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        if under is not None:
+            prefix = f"{pathlib.Path(under).resolve()}{os.sep}"
+            conditions.append("substr(path, 1, ?) = ?")
+            values.extend([len(prefix), prefix])
+        if where is not None:
+            conditions.append(f"({where})")
+            values.extend(params)
+        query = "SELECT * FROM runs" + (f" WHERE {' AND '.join(conditions)}" if conditions else "") + \
+                " ORDER BY env, task, reward, algo, seed, path"
+        return [dict(row) for row in self._conn.execute(query, values)]
+
+    def get_checkpoints(self, run_id: int) -> List[Dict[str, Any]]:
+        """ checkpoints of a run, ordered by training steps """
+        return [dict(row) for row in
+                self._conn.execute("SELECT path, steps FROM checkpoints WHERE run_id = ? ORDER BY steps, path",
+                                   (run_id,))]
+
+    def get_metrics(self, run_id: int) -> Dict[str, Dict[str, Any]]:
+        """ final and best value of each evaluation metric of a run """
+        return {row["name"]: {"final": row["final"], "best": row["best"], "best_timestep": row["best_timestep"]}
+                for row in self._conn.execute("SELECT * FROM metrics WHERE run_id = ?", (run_id,))}
+
+    def query(self, sql: str, params: Tuple = ()) -> List[Dict[str, Any]]:
+        """ arbitrary read query on the catalog tables """
+        return [dict(row) for row in self._conn.execute(sql, params)]
+
+
+def open_catalog(logdir: pathlib.Path, db_path: Optional[pathlib.Path] = None, scan: bool = True) -> RunCatalog:
+    """ catalog of the log tree (by default in `<logdir>/runs.sqlite`), updated with the changes in the tree """
+    catalog = RunCatalog(get_catalog_path(logdir) if db_path is None else db_path)
+    if scan:
+        catalog.scan(logdir)
+    return catalog
+
+
+def select_runs(index: EvalLogIndex, logdir: pathlib.Path, selection: str, query: bool) -> List[Dict[str, Any]]:
+    """
+    runs of the evaluation index selected by a path regex (`{logdir}/{regex}/evaluations*.npz`),
+    or by a sql condition on the run catalog if `query` (eg, `reward = 'hprs' AND seed < 3`)
+    """
+    if not query:
+        return index.select(selection)
+    with open_catalog(logdir) as catalog:
+        runs = catalog.select_runs(where=selection, under=logdir)
+    return index.select_files([run["eval_file"] for run in runs if run["eval_file"] is not None])
@@ -0,0 +1,59 @@
+from typing import Dict
+
+import numpy as np
+
+"""
+Policy assessment scores of the evaluation episodes, from the requirement counters (`<req>_counter`)
+stored by `CustomEvalCallback` at the last step of each episode.
+
+Requirements are classified by the prefix of their label (eg, `s1_coll`, `t_goal`, `c1_ang`):
+    - safety (ENSURE), satisfied if the counter is the episode length (never violated),
+    - target (ACHIEVE or CONQUER), satisfied if the counter is positive (achieved, and kept for CONQUER),
+    - comfort (ENCOURAGE), the counter is the nr of satisfying steps, normalized by the episode length.
+
+For each evaluation, the scores are averaged over its episodes:
+    - S: fraction of episodes satisfying all the safety requirements,
+    - S+T: fraction of episodes satisfying all the safety and target requirements,
+    - S+T+C: as S+T, where each episode is weighted by its mean comfort satisfaction.
+"""
+
+SCORES = ["S", "S+T", "S+T+C"]
+SCORE_PREFIX = "score_"
+COUNTER_SUFFIX = "_counter"
+
+
+def requirement_class(metric: str) -> str:
+    """ 'safety', 'target', 'comfort' for a requirement counter, None for other metrics """
+    if not metric.endswith(COUNTER_SUFFIX):
+        return None
+    return {"s": "safety", "t": "target", "c": "comfort"}.get(metric[0])
+
+
+def compute_scores(data: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Scores of each evaluation of an evaluation log, computed over all the evaluations at once.
+
+    @param: data: content of an evaluation log, with `ep_lengths` and the counters, of shape (n_evals, n_episodes)
+    @return: scores (`score_S`, `score_S+T`, `score_S+T+C`) of shape (n_evals,), empty if there are no counters
+    """
+    counters = {m: np.asarray(v, dtype=np.float64) for m, v in data.items() if requirement_class(m) is not None}
+    if len(counters) == 0 or "ep_lengths" not in data:
+        return {}
+    ep_lengths = np.asarray(data["ep_lengths"], dtype=np.float64)
+    safe = np.ones(ep_lengths.shape, dtype=bool)
+    target = np.ones(ep_lengths.shape, dtype=bool)
+    comforts = []
+    for metric, counter in counters.items():
+        if counter.shape != ep_lengths.shape:
+            continue
+        req_class = requirement_class(metric)
+        if req_class == "safety":
+            safe &= counter >= ep_lengths
+        elif req_class == "target":
+            target &= counter > 0
+        else:
+            comforts.append(counter / np.maximum(ep_lengths, 1.0))
+    comfort = np.mean(comforts, axis=0) if comforts else np.ones(ep_lengths.shape)
+    episode_scores = {"S": safe, "S+T": safe & target, "S+T+C": (safe & target) * comfort}
+    return {f"{SCORE_PREFIX}{name}": episode_scores[name].reshape(len(ep_lengths), -1).mean(axis=-1)
+            for name in SCORES}
@@ -1,3 +1,6 @@
+import pathlib
+
+
 def get_files(logdir, regex, fileregex):
     return logdir.glob(f"{regex}/{fileregex}")
 
@@ -21,4 +24,13 @@ def parse_reward(filepath: str):
     for reward in ["default", "tltl", "bhnr", "morl_uni", "morl_dec", "hprs", "hrs_pot"]:
         if reward in filepath:
             return reward
-    raise ValueError(f"reward not found in {filepath}")
\ No newline at end of file
+    raise ValueError(f"reward not found in {filepath}")
+
+
+def find_run_dir(path: pathlib.Path):
+    """ closest directory containing `args.yml` among the path and its parents, None if not found """
+    path = pathlib.Path(path)
+    for directory in [path] + list(path.parents):
+        if (directory / "args.yml").exists():
+            return directory
+    return None